@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# candle_service.py
+"""
+Read API over MongoDBHandler for strategies:
+
+    GET /candles/<exchange>/<symbol>/<timeframe>?from=...&to=...&format=json|arrow|npy
+
+`symbol` is written with a dash or underscore instead of the slash (BTC-USDT).
+`from`/`to` are epoch milliseconds or ISO dates; the range is [from, to), and an
+omitted bound reads from the first or up to the latest candle. Without `format`
+the Accept header picks the body. Responses carry a content ETag and honour
+If-None-Match. Processes writing the database must set MONGODB_VERSION_LOG=1 so
+that cached ranges follow their writes.
+
+    python -m api.candle_service --uri mongodb://localhost:27017/ --db binance_BTC_USDT
+"""
+import argparse
+import hashlib
+import io
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from flask import Flask, Response, jsonify, request
+from data.candle_buffer import VALUE_COLUMNS
+from data.ohlcv_cache import CANDLE_DTYPE
+from db.mongo_storage import MongoDBHandler
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+FORMATS = {
+    "json": "application/json",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "npy": "application/x-npy",
+}
+
+def to_naive_utc_ms(value) -> int | None:
+    """
+    Converts a datetime (naive values are taken as UTC) to epoch milliseconds.
+    """
+    if value is None:
+        return None
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert("UTC").tz_localize(None)
+    return int(timestamp.value // 1_000_000)
+
+def parse_bound(value: str | None) -> int | None:
+    """
+    Parses a `from`/`to` query value (epoch ms or ISO date, UTC if naive) into epoch ms.
+    """
+    if value is None or value == "":
+        return None
+    if value.lstrip("-").isdigit():
+        return int(value)
+    return to_naive_utc_ms(pd.Timestamp(value))
+
+class CachedRange:
+    """
+    One cached query result: the candles as CANDLE_DTYPE records, their content ETag
+    and the response bodies rendered so far.
+    """
+
+    def __init__(self, collection: str, start: int | None, end: int | None, candles: np.ndarray):
+        self.collection = collection
+        self.start = start
+        self.end = end
+        self.candles = candles
+        self.etag = hashlib.blake2b(candles.tobytes(), digest_size=12).hexdigest()
+        self.bodies: dict[str, bytes] = {}
+
+    @property
+    def nbytes(self) -> int:
+        return self.candles.nbytes + sum(len(body) for body in self.bodies.values())
+
+    def overlaps(self, first: int | None, last: int | None) -> bool:
+        # first/last None means the whole collection was rewritten.
+        if first is None or last is None:
+            return True
+        return (self.end is None or first < self.end) and (self.start is None or last >= self.start)
+
+    def body(self, fmt: str) -> bytes:
+        if fmt not in self.bodies:
+            self.bodies[fmt] = self._render(fmt)
+        return self.bodies[fmt]
+
+    def _render(self, fmt: str) -> bytes:
+        if fmt == "npy":
+            out = io.BytesIO()
+            np.save(out, self.candles, allow_pickle=False)
+            return out.getvalue()
+        if fmt == "arrow":
+            table = pa.table({name: self.candles[name] for name in CANDLE_DTYPE.names})
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return sink.getvalue().to_pybytes()
+        # JSON rows like ccxt's: [timestamp ms, open, high, low, close, volume], NaN as null.
+        return pd.DataFrame(self.candles).to_json(orient="values").encode()
+
+class CandleQueryService:
+    """
+    Serves candle ranges from an in-process LRU in front of MongoDBHandler.
+
+    Cached ranges are dropped when a write overlaps them. Writes of this process are
+    seen at once through MongoDBHandler.add_write_listener; writes of other processes
+    (updaters, importers) through the collection_versions documents, polled at most
+    every `version_poll_interval` seconds with one query for all collections. Those
+    processes must run with the version log on (MONGODB_VERSION_LOG=1), or their writes
+    go unnoticed. Concurrent misses on the same range share one database read.
+    """
+
+    def __init__(self, mongo_handler: MongoDBHandler, max_entries: int = 512, max_bytes: int = 256 * 1024 ** 2,
+                 version_poll_interval: float = 1.0):
+        """
+        :param mongo_handler: Instance of MongoDBHandler.
+        :param max_entries: Maximum number of cached ranges.
+        :param max_bytes: Maximum size of cached candles and bodies.
+        :param version_poll_interval: Seconds a remote write may go unnoticed.
+        """
+        self.mongo_handler = mongo_handler
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version_poll_interval = version_poll_interval
+        self._entries: OrderedDict[tuple, CachedRange] = OrderedDict()
+        self._versions: dict[str, int] = {}
+        # Bumped by every invalidation, so a read that raced with a write is not cached.
+        self._generations: dict[str, int] = {}
+        self._polled_at = 0.0
+        self._loading: dict[tuple, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "version_polls": 0}
+        mongo_handler.add_write_listener(self._on_write)
+
+    def _on_write(self, collection: str, first: datetime | None, last: datetime | None) -> None:
+        self.invalidate(collection, to_naive_utc_ms(first), to_naive_utc_ms(last))
+
+    def invalidate(self, collection: str, first: int | None = None, last: int | None = None) -> int:
+        """
+        Drops the cached ranges of a collection that overlap [first, last] (all of them by default).
+
+        :return: Number of dropped ranges.
+        """
+        with self._lock:
+            self._generations[collection] = self._generations.get(collection, 0) + 1
+            stale = [key for key, entry in self._entries.items() if entry.collection == collection and entry.overlaps(first, last)]
+            for key in stale:
+                del self._entries[key]
+            self.stats["invalidations"] += len(stale)
+        return len(stale)
+
+    def poll_versions(self, force: bool = False) -> None:
+        """
+        Applies the writes of other processes logged since the last poll.
+        """
+        now = time.monotonic()
+        if not force and now - self._polled_at < self.version_poll_interval:
+            return
+        # One poll at a time; readers arriving meanwhile keep going with the current cache.
+        if not self._poll_lock.acquire(blocking=False):
+            return
+        try:
+            self._polled_at = now
+            docs = self.mongo_handler.get_collection_versions()
+            self.stats["version_polls"] += 1
+            for collection, doc in docs.items():
+                known = self._versions.get(collection)
+                version = doc.get("version", 0)
+                self._versions[collection] = version
+                if version == known:
+                    continue
+                writes = doc.get("writes", [])
+                if known is None or version - known > len(writes):
+                    # The writes since the last poll are not all logged anymore.
+                    self.invalidate(collection)
+                    continue
+                for write in writes[len(writes) - (version - known):]:
+                    self.invalidate(collection, to_naive_utc_ms(write.get("first")), to_naive_utc_ms(write.get("last")))
+        finally:
+            self._poll_lock.release()
+
+    def _evict(self) -> None:
+        # Called with the lock held; least recently used ranges go first.
+        total = sum(entry.nbytes for entry in self._entries.values())
+        while self._entries and (len(self._entries) > self.max_entries or total > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            total -= entry.nbytes
+
+    def _read(self, exchange: str, symbol: str, timeframe: str, start: int | None, end: int | None) -> np.ndarray:
+        bound = lambda ms: None if ms is None else datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+        df = self.mongo_handler.get_ohlcv(exchange, symbol, timeframe, start=bound(start), end=bound(end))
+        candles = np.empty(len(df), dtype=CANDLE_DTYPE)
+        if len(df):
+            timestamps = pd.to_datetime(df["timestamp"], utc=True).dt.tz_localize(None)
+            candles["timestamp"] = timestamps.to_numpy().astype("datetime64[ms]").astype(np.int64)
+            for column in VALUE_COLUMNS:
+                candles[column] = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=np.float64)
+        return candles
+
+    def get(self, exchange: str, symbol: str, timeframe: str, start: int | None = None, end: int | None = None) -> CachedRange:
+        """
+        Returns the candles in [start, end) (epoch ms), from the cache when possible.
+        """
+        self.poll_versions()
+        collection = self.mongo_handler._collection_name(exchange, symbol, timeframe)
+        key = (collection, start, end)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry
+            loading = self._loading.setdefault(key, threading.Lock())
+        with loading:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self.stats["hits"] += 1
+                    return entry
+                self.stats["misses"] += 1
+                generation = self._generations.get(collection, 0)
+            try:
+                candles = self._read(exchange, symbol, timeframe, start, end)
+            except Exception:
+                with self._lock:
+                    self._loading.pop(key, None)
+                raise
+            entry = CachedRange(collection, start, end, candles)
+            with self._lock:
+                self._loading.pop(key, None)
+                if self._generations.get(collection, 0) == generation:
+                    self._entries[key] = entry
+                    self._evict()
+        return entry
+
+def negotiate_format(fmt: str | None, accept) -> str | None:
+    if fmt:
+        return fmt if fmt in FORMATS else None
+    best = accept.best_match(list(FORMATS.values()), default=FORMATS["json"])
+    return next(name for name, mimetype in FORMATS.items() if mimetype == best)
+
+def create_app(service: CandleQueryService) -> Flask:
+    """
+    Builds the Flask app serving `service`.
+    """
+    app = Flask(__name__)
+
+    @app.get("/candles/<exchange>/<symbol>/<timeframe>")
+    def candles(exchange: str, symbol: str, timeframe: str):
+        fmt = negotiate_format(request.args.get("format"), request.accept_mimetypes)
+        if fmt is None:
+            return jsonify(error=f"Unknown format, expected one of {sorted(FORMATS)}"), 400
+        try:
+            start = parse_bound(request.args.get("from"))
+            end = parse_bound(request.args.get("to"))
+        except ValueError as e:
+            return jsonify(error=f"Invalid from/to: {e}"), 400
+
+        entry = service.get(exchange, symbol.replace("-", "/").replace("_", "/"), timeframe, start, end)
+        # One ETag per representation of the same candles.
+        etag = f"{entry.etag}-{fmt}"
+        headers = {"Cache-Control": "no-cache", "Vary": "Accept", "X-Candle-Count": str(len(entry.candles))}
+        if request.if_none_match.contains(etag):
+            response = Response(status=304, headers=headers)
+        else:
+            response = Response(entry.body(fmt), mimetype=FORMATS[fmt], headers=headers)
+        response.set_etag(etag)
+        return response
+
+    @app.get("/stats")
+    def stats():
+        return jsonify(dict(service.stats, cached_ranges=len(service._entries)))
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default=None, help="MongoDB connection string (defaults to MONGODB_URI)")
+    parser.add_argument("--db", default="algo_trade")
+    parser.add_argument("--storage-mode", default="document")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-entries", type=int, default=512)
+    args = parser.parse_args()
+
+    service = CandleQueryService(MongoDBHandler(uri=args.uri, db_name=args.db, storage_mode=args.storage_mode),
+                                 max_entries=args.max_entries)
+    create_app(service).run(host=args.host, port=args.port, threaded=True)
+
+if __name__ == "__main__":
+    main()
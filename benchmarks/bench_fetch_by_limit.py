@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# bench_fetch_by_limit.py
+"""
+Compares the real-time tick cost of the old fetch_by_limit loop (one page, then a sleep of
+max(rateLimit / 1000, 1) seconds) with the current single-call fast path.
+
+Runs offline against FakeExchange with a fixed round-trip latency, so it measures the
+client-side dead time only. One tick fetches limit=1 for every pair, in series, the way
+the real-time updater polled.
+
+    python -m benchmarks.bench_fetch_by_limit --pairs 5 --latency-ms 50 --rate-limit-ms 50
+"""
+import argparse
+import time
+import pandas as pd
+from benchmarks.fake_exchange import FakeExchange
+from data.crypto_data_collector import CryptoDataCollector
+from data.rate_limiter import RequestScheduler
+
+def legacy_fetch_by_limit(collector: CryptoDataCollector, exchange, symbol: str, limit: int, timeframe: str) -> pd.DataFrame:
+    # The loop fetch_by_limit ran before the fast path: it always slept after a page.
+    all_ohlcv = []
+    since = exchange.milliseconds() - (limit * exchange.parse_timeframe(timeframe) * 1000)
+    while len(all_ohlcv) < limit:
+        fetch_limit = min(1000, limit - len(all_ohlcv))
+        ohlcv = collector.safe_fetch_ohlcv(exchange, symbol, timeframe, since, fetch_limit)
+        if not ohlcv:
+            break
+        all_ohlcv += ohlcv
+        since = ohlcv[-1][0] + 1
+        time.sleep(max(exchange.rateLimit / 1000, 1))
+        if len(ohlcv) < fetch_limit:
+            break
+    df = pd.DataFrame(all_ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+    return df
+
+def timed_tick(label: str, fetch, pairs: int, ticks: int) -> float:
+    started = time.perf_counter()
+    for _ in range(ticks):
+        for i in range(pairs):
+            fetch(f"PAIR{i}/USDT")
+    per_tick = (time.perf_counter() - started) / ticks
+    print(f"{label:<32} {per_tick * 1000:10.1f} ms/tick {per_tick * 1000 / pairs:10.1f} ms/pair")
+    return per_tick
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pairs", type=int, default=5)
+    parser.add_argument("--ticks", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--rate-limit-ms", type=int, default=50)
+    parser.add_argument("--timeframe", default="1m")
+    args = parser.parse_args()
+
+    exchange = FakeExchange("simulated", rate_limit_ms=args.rate_limit_ms, latency_ms=args.latency_ms)
+    collector = CryptoDataCollector(exchange_names=[])
+    collector.schedulers[exchange.id] = RequestScheduler.from_exchange(exchange)
+    collector.exchanges[exchange.id] = exchange
+
+    print(f"{args.pairs} pairs, {args.ticks} ticks, {args.latency_ms:.0f} ms latency, rateLimit {args.rate_limit_ms} ms")
+    old = timed_tick("legacy loop (limit=1)", lambda s: legacy_fetch_by_limit(collector, exchange, s, 1, args.timeframe),
+                     args.pairs, args.ticks)
+    new = timed_tick("fast path (limit=1)", lambda s: collector.fetch_by_limit(exchange.id, s, 1, args.timeframe),
+                     args.pairs, args.ticks)
+    print(f"speedup: {old / new:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# bench_suite.py
+"""
+Offline benchmark suite for the collection pipeline. Each data size runs:
+
+    backfill   fetch_by_date over FakeExchange pages, then upsert_frame into storage (candles/sec)
+    sweep      DataIntegrityChecker.find_gaps over the stored range (seconds, gaps found)
+    realtime   update_pair for every pair at each simulated candle close (per-tick latency)
+
+and, unless --no-memory, repeats backfill and sweep under tracemalloc for their peak memory.
+Storage is an in-process stand-in for MongoDB (document mode) by default, or a MongoDB
+server with --mongo-uri (databases named bench_* are dropped and recreated). Results are saved as
+JSON under benchmarks/results/ (ignored by git) or --output, and --compare prints the change
+against an earlier result file, flagging regressions.
+
+    python -m benchmarks.bench_suite --sizes 10000,100000
+    python -m benchmarks.bench_suite --error-rate 0.01 --latency-ms 20 --compare benchmarks/results/<earlier>.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from benchmarks.fake_exchange import FakeExchange
+from tests.memory_storage import InMemoryIntegrityChecker, InMemoryMongoDBHandler
+from data.crypto_data_collector import CryptoDataCollector
+from data.rate_limiter import RequestScheduler
+from data.retry_policy import RetryPolicy
+from db.data_integrity_checker import DataIntegrityChecker
+from db.mongo_storage import MongoDBHandler
+from db.real_time_updater import update_pair
+
+EXCHANGE = "fake"
+SYMBOL = "BTC/USDT"
+TIMEFRAME = "1m"
+TIMEFRAME_MS = 60_000
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+# Metrics where a higher value is better; for the others (seconds, ms, MB) lower is better.
+HIGHER_IS_BETTER = ("candles_per_sec",)
+
+class FakeClock:
+    """
+    Exchange time in epoch ms, moved forward by the real-time phase.
+    """
+
+    def __init__(self, ms: int):
+        self.ms = ms
+
+    def __call__(self) -> int:
+        return self.ms
+
+def make_storage(args, name: str) -> MongoDBHandler:
+    db_name = f"bench_{name}"
+    if args.mongo_uri is None:
+        return InMemoryMongoDBHandler(db_name=db_name, storage_mode=args.storage_mode)
+    handler = MongoDBHandler(uri=args.mongo_uri, db_name=db_name, storage_mode=args.storage_mode)
+    handler.client.drop_database(db_name)
+    return handler
+
+def make_collector(args, clock: FakeClock) -> tuple[CryptoDataCollector, FakeExchange]:
+    exchange = FakeExchange(EXCHANGE, rate_limit_ms=args.rate_limit_ms, latency_ms=args.latency_ms,
+                            jitter_ms=args.jitter_ms, error_rate=args.error_rate, drop_rate=args.drop_rate,
+                            seed=args.seed, clock=clock)
+    collector = CryptoDataCollector(exchange_names=[EXCHANGE], max_workers=args.workers,
+                                    retry_policy=RetryPolicy(base_delay=0.01, max_delay=1.0, max_attempts=8))
+    collector.schedulers[exchange.id] = RequestScheduler.from_exchange(exchange)
+    collector.exchanges[exchange.id] = exchange
+    return collector, exchange
+
+def measure(func, trace_memory: bool):
+    """
+    Runs func and returns (result, seconds, peak traced MB or None).
+    """
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = func()
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2 if trace_memory else None
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return result, elapsed, peak
+
+def bench_backfill_and_sweep(args, size: int, trace_memory: bool = False) -> tuple[dict, tuple]:
+    end = START + timedelta(milliseconds=size * TIMEFRAME_MS)
+    clock = FakeClock(int(end.timestamp() * 1000))
+    collector, exchange = make_collector(args, clock)
+    handler = make_storage(args, f"{size}")
+
+    df, fetch_sec, fetch_peak = measure(
+        lambda: collector.fetch_by_date(EXCHANGE, SYMBOL, TIMEFRAME, since=START, until=end), trace_memory)
+    counts, write_sec, write_peak = measure(lambda: handler.upsert_frame(df, EXCHANGE, SYMBOL, TIMEFRAME), trace_memory)
+    retries = collector.retry_stats().get(EXCHANGE, {})
+    backfill = {
+        "candles": len(df),
+        "fetch_sec": fetch_sec,
+        "write_sec": write_sec,
+        "candles_per_sec": len(df) / (fetch_sec + write_sec),
+        "fetch_candles_per_sec": len(df) / fetch_sec,
+        "write_candles_per_sec": len(df) / write_sec,
+        "api_calls": exchange.stats["calls"],
+        "rate_limited": exchange.stats["rate_limited"],
+        "errors_injected": exchange.stats["errors_injected"],
+        "retries": retries.get("retries", 0),
+        "giveups": retries.get("giveups", 0),
+        "written": counts["inserted"] + counts["upserted"],
+    }
+    if trace_memory:
+        backfill["peak_mb"] = max(fetch_peak, write_peak)
+    del df
+
+    checker_class = InMemoryIntegrityChecker if args.mongo_uri is None else DataIntegrityChecker
+    checker = checker_class(SimpleNamespace(crypto=collector), handler)
+    gaps, sweep_sec, sweep_peak = measure(lambda: checker.find_gaps(EXCHANGE, SYMBOL, TIMEFRAME, START, end), trace_memory)
+    sweep = {"seconds": sweep_sec, "gaps": len(gaps), "candles_per_sec": size / sweep_sec}
+    if trace_memory:
+        sweep["peak_mb"] = sweep_peak
+    return {"backfill": backfill, "sweep": sweep}, (collector, handler, clock)
+
+def bench_realtime(args, collector, handler, clock: FakeClock) -> dict:
+    symbols = [SYMBOL] + [f"PAIR{i}/USDT" for i in range(1, args.pairs)]
+    now = datetime.fromtimestamp(clock() / 1000, tz=timezone.utc)
+    for symbol in symbols[1:]:
+        # Every other pair starts with a short stored history, like a freshly added pair.
+        df = collector.fetch_by_date(EXCHANGE, symbol, TIMEFRAME, since=now - timedelta(minutes=100), until=now)
+        handler.upsert_frame(df, EXCHANGE, symbol, TIMEFRAME)
+    market = SimpleNamespace(crypto=collector)
+
+    tick_ms = []
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for _ in range(args.ticks):
+            clock.ms += TIMEFRAME_MS
+            tick_now = datetime.fromtimestamp(clock() / 1000, tz=timezone.utc)
+            started = time.perf_counter()
+            list(pool.map(lambda symbol: update_pair(market, handler, EXCHANGE, symbol, TIMEFRAME, now=tick_now), symbols))
+            tick_ms.append((time.perf_counter() - started) * 1000)
+    tick_ms.sort()
+    return {
+        "pairs": len(symbols),
+        "ticks": len(tick_ms),
+        "p50_tick_ms": statistics.median(tick_ms),
+        "p95_tick_ms": tick_ms[min(len(tick_ms) - 1, int(0.95 * len(tick_ms)))],
+        "max_tick_ms": tick_ms[-1],
+        "mean_pair_ms": statistics.fmean(tick_ms) / len(symbols),
+    }
+
+def run(args) -> dict:
+    results = {}
+    for size in args.sizes:
+        print(f"size {size}: backfill, sweep, realtime...", flush=True)
+        metrics, (collector, handler, clock) = bench_backfill_and_sweep(args, size)
+        metrics["realtime"] = bench_realtime(args, collector, handler, clock)
+        if args.memory:
+            print(f"size {size}: memory pass...", flush=True)
+            traced, _ = bench_backfill_and_sweep(args, size, trace_memory=True)
+            metrics["backfill"]["peak_mb"] = traced["backfill"]["peak_mb"]
+            metrics["sweep"]["peak_mb"] = traced["sweep"]["peak_mb"]
+        results[str(size)] = metrics
+        print_metrics(size, metrics)
+    return results
+
+def print_metrics(size: int, metrics: dict) -> None:
+    for phase, values in metrics.items():
+        shown = ", ".join(f"{name}={value:,.1f}" if isinstance(value, float) else f"{name}={value:,}"
+                          for name, value in values.items())
+        print(f"  {size:>9} {phase:<9} {shown}")
+
+def flatten(results: dict) -> dict:
+    return {f"{size}.{phase}.{name}": value
+            for size, phases in results.items() for phase, values in phases.items() for name, value in values.items()
+            if isinstance(value, float)}
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Prints the relative change of every timing, throughput and memory metric present in
+    both runs, and returns the ones that got worse by more than `threshold` percent.
+    """
+    regressions = []
+    old, new = flatten(baseline), flatten(current)
+    print(f"\n{'metric':<44} {'baseline':>14} {'current':>14} {'change':>9}")
+    for key in sorted(old.keys() & new.keys()):
+        if not old[key]:
+            continue
+        change = (new[key] - old[key]) / old[key] * 100
+        worse = -change if key.endswith(HIGHER_IS_BETTER) else change
+        flag = "  REGRESSION" if worse > threshold else ""
+        print(f"{key:<44} {old[key]:>14,.2f} {new[key]:>14,.2f} {change:>+8.1f}%{flag}")
+        if flag:
+            regressions.append(key)
+    return regressions
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(RESULTS_DIR), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000", help="Comma-separated numbers of 1m candles to backfill")
+    parser.add_argument("--mongo-uri", default=None, help="MongoDB server to use instead of the in-memory stand-in")
+    parser.add_argument("--storage-mode", default="document", choices=("document", "bucket", "timeseries"))
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent pages in backfills and pairs in ticks")
+    parser.add_argument("--pairs", type=int, default=10)
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--rate-limit-ms", type=float, default=5)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--drop-rate", type=float, default=0.001, help="Share of candles missing on the exchange")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="Skip the tracemalloc pass")
+    parser.add_argument("--output", default=RESULTS_DIR, help="Directory of the result files")
+    parser.add_argument("--compare", default=None, help="Earlier result file to compare with")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent")
+    parser.add_argument("--verbose", action="store_true", help="Show retry warnings")
+    args = parser.parse_args()
+    args.sizes = [int(size) for size in args.sizes.split(",")]
+    if args.mongo_uri is None and args.storage_mode != "document":
+        parser.error("--storage-mode bucket and timeseries need --mongo-uri")
+    if not args.verbose:
+        logging.getLogger("data.retry_policy").setLevel(logging.ERROR)
+
+    started = datetime.now(timezone.utc)
+    report = {
+        "meta": {
+            "started_at": started.isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": args.mongo_uri and "mongodb" or "memory",
+            "args": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        },
+        "results": run(args),
+    }
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"bench-{started:%Y%m%dT%H%M%SZ}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report["results"], baseline["results"], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold:.0f}%.")
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# bench_upsert.py
+"""
+Compares the per-record write path (to_dict + upsert_ohlcv) with upsert_frame.
+
+Needs a reachable MongoDB (MONGODB_URI, default mongodb://localhost:27017) and writes into
+a throwaway database that is dropped afterwards.
+
+    python -m benchmarks.bench_upsert --rows 200000 --workers 4
+"""
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+from db.mongo_storage import MongoDBHandler
+
+def make_candles(rows: int, start: str = "2020-01-01") -> pd.DataFrame:
+    rng = np.random.default_rng(42)
+    close = 10000 + rng.standard_normal(rows).cumsum()
+    return pd.DataFrame({
+        "timestamp": pd.date_range(start, periods=rows, freq="1min"),
+        "open": close + rng.standard_normal(rows),
+        "high": close + 5,
+        "low": close - 5,
+        "close": close,
+        "volume": rng.random(rows) * 10,
+    })
+
+def legacy_write(handler: MongoDBHandler, df: pd.DataFrame) -> None:
+    # What every caller did before upsert_frame existed.
+    records = df.to_dict("records")
+    for r in records:
+        r["timestamp"] = pd.to_datetime(r["timestamp"]).to_pydatetime()
+    handler.upsert_ohlcv(records, "bench", "BTC/USDT", "1m")
+
+def frame_write(handler: MongoDBHandler, df: pd.DataFrame, workers: int) -> None:
+    handler.upsert_frame(df, "bench", "BTC/USDT", "1m", max_workers=workers)
+
+def timed(label: str, func) -> float:
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<40} {elapsed:8.2f} s")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--db", default="candlecollector_bench")
+    args = parser.parse_args()
+
+    handler = MongoDBHandler(uri=os.environ.get("MONGODB_URI", "mongodb://localhost:27017"), db_name=args.db)
+    df = make_candles(args.rows)
+    # Second half overlaps the first load, to measure the upsert branch too.
+    overlap = make_candles(args.rows, start=str(df["timestamp"].iloc[args.rows // 2]))
+    try:
+        print(f"{args.rows} candles, {args.workers} workers")
+        for name, write in (("upsert_ohlcv", lambda d: legacy_write(handler, d)),
+                            ("upsert_frame", lambda d: frame_write(handler, d, args.workers))):
+            handler.client.drop_database(args.db)
+            timed(f"{name}: empty collection", lambda: write(df))
+            timed(f"{name}: 50% overlapping load", lambda: write(overlap))
+    finally:
+        handler.client.drop_database(args.db)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# fake_exchange.py
+import math
+import random
+import threading
+import time
+import zlib
+from typing import Callable
+import ccxt
+import numpy as np
+
+# 2017-07-14, roughly when the big USDT pairs were listed.
+DEFAULT_LISTING_MS = 1_500_000_000_000
+
+class FakeExchange:
+    """
+    Deterministic stand-in for a ccxt exchange, for offline benchmarks.
+
+    fetch_ohlcv has ccxt's shape and paging rules: up to `max_limit` candles from the
+    first boundary at or after `since` (or the latest ones without `since`), the current
+    open candle included, nothing before the listing time. Prices are a pure function of
+    (seed, symbol, timestamp), so every run sees the same candles, and `drop_rate` removes
+    a deterministic share of them to leave gaps for the integrity sweep.
+
+    The exchange enforces `rateLimit` on its side with a small burst allowance and answers
+    excess calls with RateLimitExceeded and a Retry-After header, like a real 429. Latency
+    and transient errors can be injected; both draw from a seeded RNG.
+    """
+
+    def __init__(self, exchange_id: str = "fake", rate_limit_ms: float = 5, max_limit: int = 1000,
+                 latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0, drop_rate: float = 0.0,
+                 burst: int = 20, listing_ms: int = DEFAULT_LISTING_MS, seed: int = 0,
+                 clock: Callable[[], int] | None = None):
+        """
+        :param rate_limit_ms: Milliseconds between two requests, as in ccxt's rateLimit.
+        :param max_limit: Maximum number of candles per call.
+        :param latency_ms: Mean round-trip time of a call; `jitter_ms` adds a uniform spread.
+        :param error_rate: Share of calls failing with a NetworkError, RequestTimeout or ExchangeNotAvailable.
+        :param drop_rate: Share of candles the exchange never returns (gaps).
+        :param burst: Calls the exchange accepts at once before enforcing rate_limit_ms.
+        :param clock: Returns the exchange time in epoch ms (defaults to the wall clock).
+        """
+        self.id = exchange_id
+        self.rateLimit = rate_limit_ms
+        self.enableRateLimit = False
+        self.max_limit = max_limit
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.listing_ms = listing_ms
+        self.seed = seed
+        self.clock = clock or (lambda: int(time.time() * 1000))
+        self.timeframes = {tf: tf for tf in ("1m", "5m", "15m", "30m", "1h", "4h", "8h", "12h", "1d", "1w")}
+        self.last_response_headers = {}
+        self.stats = {"calls": 0, "candles": 0, "rate_limited": 0, "errors_injected": 0}
+        self._rng = random.Random(seed)
+        self._burst = float(burst)
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def parse_timeframe(timeframe: str) -> int:
+        return ccxt.Exchange.parse_timeframe(timeframe)
+
+    def milliseconds(self) -> int:
+        return self.clock()
+
+    def close(self) -> None:
+        pass
+
+    def _admit(self) -> None:
+        # Server-side token bucket: one call per rateLimit, `burst` calls of slack.
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._burst, self._tokens + (now - self._refilled_at) * 1000 / self.rateLimit)
+            self._refilled_at = now
+            self.stats["calls"] += 1
+            if self._tokens < 1:
+                self.stats["rate_limited"] += 1
+                retry_after = (1 - self._tokens) * self.rateLimit / 1000
+                self.last_response_headers = {"Retry-After": f"{retry_after:.3f}"}
+                raise ccxt.RateLimitExceeded(f"{self.id} 429 Too Many Requests")
+            self._tokens -= 1
+            self.last_response_headers = {}
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            failure = self._rng.random() < self.error_rate
+            error = self._rng.choice((ccxt.NetworkError, ccxt.RequestTimeout, ccxt.ExchangeNotAvailable))
+        if delay > 0:
+            time.sleep(delay)
+        if failure:
+            with self._lock:
+                self.stats["errors_injected"] += 1
+            raise error(f"{self.id} injected {error.__name__}")
+
+    def candles(self, symbol: str, timestamps: np.ndarray) -> list[list]:
+        """
+        Returns the deterministic candles of a symbol at the given open times, minus dropped ones.
+        """
+        key = (zlib.crc32(symbol.encode()) ^ self.seed) & 0xFFFFFFFF
+        # splitmix64 hash of (key, timestamp) mapped to [0, 1), for noise and drops.
+        mixed = timestamps.astype(np.uint64) + np.uint64(key * 0x9E3779B97F4A7C15 & 0xFFFFFFFFFFFFFFFF)
+        mixed = (mixed ^ (mixed >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        mixed = (mixed ^ (mixed >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        noise = ((mixed ^ (mixed >> np.uint64(31))) >> np.uint64(32)).astype(np.float64) / 2 ** 32
+        kept = noise >= self.drop_rate if self.drop_rate else np.ones(len(timestamps), dtype=bool)
+        timestamps, noise = timestamps[kept], noise[kept]
+        base = 100 + key % 900 + 20 * np.sin(timestamps / (7 * 86_400_000))
+        close = base * (1 + (noise - 0.5) * 0.01)
+        high = np.maximum(base, close) * (1 + noise * 0.002)
+        low = np.minimum(base, close) * (1 - noise * 0.002)
+        volume = 1 + noise * 100
+        return np.column_stack([timestamps, base, high, low, close, volume]).tolist()
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None, params={}):
+        self._admit()
+        timeframe_ms = self.parse_timeframe(timeframe) * 1000
+        limit = min(limit or self.max_limit, self.max_limit)
+        current_open = self.clock() // timeframe_ms * timeframe_ms
+        if since is None:
+            first = current_open - (limit - 1) * timeframe_ms
+        else:
+            first = math.ceil(since / timeframe_ms) * timeframe_ms
+        first = max(first, math.ceil(self.listing_ms / timeframe_ms) * timeframe_ms)
+        timestamps = np.arange(first, min(first + limit * timeframe_ms, current_open + 1), timeframe_ms, dtype=np.int64)
+        ohlcv = self.candles(symbol, timestamps)
+        for candle in ohlcv:
+            candle[0] = int(candle[0])
+        with self._lock:
+            self.stats["candles"] += len(ohlcv)
+        return ohlcv
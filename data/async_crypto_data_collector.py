@@ -0,0 +1,272 @@
+# async_crypto_data_collector.py
+import asyncio
+import logging
+import os
+import aiohttp
+import pandas as pd
+import ccxt.async_support as ccxt_async
+from datetime import datetime
+from data.base_data_collector import BaseDataCollector
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncIterator
+from data.candle_buffer import CandleBuffer
+from data.crypto_data_collector import to_milliseconds, page_windows, page_request_limit, trim_to_window, ohlcv_to_frame
+from data.market_cache import MarketMetadataCache
+from data.rate_limiter import AsyncRequestScheduler, RequestScheduler
+from data.retry_policy import RetryPolicy
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+class AsyncCryptoDataCollector(BaseDataCollector):
+    """
+    asyncio counterpart of CryptoDataCollector built on ccxt.async_support.
+
+    All exchanges share one pooled aiohttp session, and each exchange has an
+    AsyncRequestScheduler, so hundreds of symbol/timeframe pairs can be tracked
+    from a single event loop. Use it as an async context manager, or call
+    open() and close() yourself. Exchanges are created on first use, as in
+    CryptoDataCollector, so opening the collector costs nothing.
+    """
+
+    def __init__(self, exchange_names=None, max_concurrency: int = 4, page_limit: int = 1000, connection_limit: int = 100,
+                 market_cache: MarketMetadataCache | None = None, retry_policy: RetryPolicy | None = None):
+        """
+        :param exchange_names: Exchanges allowed to be created (defaults to ALLOWED_EXCHANGES).
+        :param max_concurrency: Maximum number of pages fetched at once per fetch_by_date call.
+        :param page_limit: Maximum number of candles per request.
+        :param connection_limit: Size of the shared HTTP connection pool.
+        :param market_cache: Market metadata cache shared with other collectors and processes.
+        :param retry_policy: Retry and circuit breaker policy for API calls.
+        """
+        super().__init__(retry_policy=retry_policy)
+        self.exchange_names = exchange_names or [name.strip() for name in os.getenv('ALLOWED_EXCHANGES', 'binance').split(',')]
+        self.max_concurrency = max_concurrency
+        self.page_limit = page_limit
+        self.connection_limit = connection_limit
+        self.market_cache = market_cache or MarketMetadataCache()
+        # Exchange ids that need an explicit `since` to return the latest candles.
+        self._since_required = set()
+        self.exchanges = {}
+        self.schedulers = {}
+        # Exchanges created without cached markets; load_exchange downloads and caches them.
+        self._markets_pending = set()
+        self.session: aiohttp.ClientSession | None = None
+        logger.info(f"Allowed exchanges: {self.exchange_names}")
+
+    async def open(self) -> None:
+        """
+        Creates the shared HTTP session the exchanges will use.
+        """
+        if self.session is not None:
+            return
+        connector = aiohttp.TCPConnector(limit=self.connection_limit, ttl_dns_cache=300, enable_cleanup_closed=True)
+        self.session = aiohttp.ClientSession(connector=connector, trust_env=True)
+
+    def _init_exchange(self, name: str) -> ccxt_async.Exchange | None:
+        try:
+            exchange_class = getattr(ccxt_async, name)
+        except AttributeError:
+            logger.error(f"Exchange '{name}' is not supported by ccxt.")
+            return None
+        # Pacing is done by the scheduler, not by ccxt's per-instance throttler.
+        exchange = exchange_class({'session': self.session, 'enableRateLimit': False})
+        # Cached markets spare the exchange its load_markets download on the first request.
+        try:
+            if not self.market_cache.apply(exchange):
+                self._markets_pending.add(name)
+        except Exception as e:
+            logger.warning(f"Could not apply cached markets of {name}: {e}")
+        # Published after its scheduler, so no caller can get the exchange unthrottled.
+        self.schedulers[name] = AsyncRequestScheduler.from_exchange(exchange)
+        self.exchanges[name] = exchange
+        logger.info(f"Initialized exchange: {name}")
+        return exchange
+
+    async def close(self) -> None:
+        """
+        Closes every exchange and then the shared HTTP session.
+        """
+        for exchange in self.exchanges.values():
+            await exchange.close()
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        self.exchanges = {}
+        self.schedulers = {}
+        self._markets_pending = set()
+
+    async def __aenter__(self) -> "AsyncCryptoDataCollector":
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+
+    def check_exchange(self, exchange_name: str) -> ccxt_async.Exchange:
+        exchange = self.exchanges.get(exchange_name)
+        # Exchanges are only created on the event loop, so creation needs no lock.
+        if exchange is None and exchange_name in self.exchange_names and self.session is not None:
+            exchange = self._init_exchange(exchange_name)
+        if not exchange:
+            raise ValueError(f"Exchange '{exchange_name}' not initialized.")
+        return exchange
+
+    async def load_exchange(self, exchange_name: str) -> ccxt_async.Exchange:
+        """
+        Returns an exchange like check_exchange, downloading and caching its markets on
+        first use when the market cache had none.
+        """
+        exchange = self.check_exchange(exchange_name)
+        if exchange_name in self._markets_pending:
+            # Discarded first so concurrent callers do not download the markets twice.
+            self._markets_pending.discard(exchange_name)
+            try:
+                await exchange.load_markets()
+                self.market_cache.store(exchange)
+            except Exception as e:
+                logger.warning(f"Could not load markets of {exchange_name} up front: {e}")
+        return exchange
+
+    def scheduler_stats(self) -> dict:
+        """
+        Returns queue depth and wait-time statistics for every exchange scheduler.
+        """
+        return {name: scheduler.stats() for name, scheduler in self.schedulers.items()}
+
+    async def safe_fetch_ohlcv(self, exchange: ccxt_async.Exchange, symbol: str, timeframe: str, since: int | None, limit: int,
+                               priority: int = RequestScheduler.PRIORITY_DEFAULT, weight: float = 1):
+        """
+        Fetches OHLCV data through the retry policy, tracked per exchange.
+
+        :param exchange: The async exchange instance.
+        :param symbol: The trading pair symbol (e.g., 'BTC/USDT').
+        :param timeframe: The timeframe for the candles (e.g., '1h').
+        :param since: Starting timestamp in milliseconds.
+        :param limit: Maximum number of candles to fetch in one call.
+        :param priority: Scheduler priority of the request (lower is served first).
+        :param weight: Request weight drawn from the exchange budget.
+        :return: The OHLCV data as returned by the exchange.
+        """
+        scheduler = self.schedulers.get(exchange.id)
+
+        async def fetch_func():
+            if scheduler is not None:
+                await scheduler.acquire(weight=weight, priority=priority)
+            return await exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=since, limit=limit)
+
+        return await self.retry_policy.acall(fetch_func, key=exchange.id, headers=lambda: getattr(exchange, 'last_response_headers', None))
+
+    async def fetch_by_limit(self, exchange_name: str, symbol: str, limit: int, timeframe: str = '1d',
+                             priority: int = RequestScheduler.PRIORITY_REALTIME) -> pd.DataFrame:
+        """
+        Async implementation of BaseDataCollector.fetch_by_limit.
+        Up to page_limit candles take a single request, as in CryptoDataCollector.fetch_by_limit.
+        """
+        exchange = await self.load_exchange(exchange_name)
+        timeframe_ms = exchange.parse_timeframe(timeframe) * 1000
+        now = exchange.milliseconds()
+        since = (now // timeframe_ms - limit + 1) * timeframe_ms
+
+        if limit > self.page_limit:
+            df = await self.fetch_by_date(exchange_name, symbol, timeframe, since=since, until=now, priority=priority)
+            return df.tail(limit).reset_index(drop=True)
+
+        if exchange.id not in self._since_required:
+            ohlcv = await self.safe_fetch_ohlcv(exchange, symbol, timeframe, None, limit, priority=priority)
+            if ohlcv and ohlcv[-1][0] < since:
+                logger.info(f"{exchange.id} does not return the latest candles without 'since'; using explicit ranges.")
+                self._since_required.add(exchange.id)
+            else:
+                return ohlcv_to_frame(ohlcv[-limit:])
+
+        ohlcv = await self.safe_fetch_ohlcv(exchange, symbol, timeframe, since, limit, priority=priority)
+        return ohlcv_to_frame(ohlcv[-limit:])
+
+    async def fetch_by_date(self, exchange_name: str, symbol: str, timeframe: str = '1h', since: str | datetime = None, until: str | datetime = None,
+                            priority: int = RequestScheduler.PRIORITY_BACKFILL) -> pd.DataFrame:
+        """
+        Async implementation of BaseDataCollector.fetch_by_date.
+        Pages are fetched concurrently, bounded by max_concurrency and the exchange scheduler.
+        For long ranges prefer aiter_by_date, which does not hold the whole range in memory.
+        """
+        exchange = await self.load_exchange(exchange_name)
+        since, until = self._resolve_range(exchange, since, until)
+        timeframe_ms = exchange.parse_timeframe(timeframe) * 1000
+
+        # Sized for the whole range up front, so pages are copied in exactly once.
+        buffer = CandleBuffer(capacity=(until - since) // timeframe_ms + 1)
+        async with aclosing(self._aiter_pages(exchange, symbol, timeframe, since, until, priority)) as pages:
+            async for ohlcv in pages:
+                buffer.append(ohlcv)
+        buffer.dedupe_sort()
+        logger.info(f"Fetched: {len(buffer)} candles")
+        return buffer.to_frame()
+
+    async def aiter_by_date(self, exchange_name: str, symbol: str, timeframe: str = '1h', since: str | datetime = None, until: str | datetime = None,
+                            priority: int = RequestScheduler.PRIORITY_BACKFILL) -> AsyncIterator[pd.DataFrame]:
+        """
+        Yields the candles in [since, until) as one typed DataFrame per page, in time order,
+        as soon as each page arrives. At most max_concurrency pages are in flight.
+        """
+        exchange = await self.load_exchange(exchange_name)
+        since, until = self._resolve_range(exchange, since, until)
+        # Closed explicitly, so stopping early cancels the in-flight pages right away
+        # rather than whenever the event loop finalizes the inner generator.
+        async with aclosing(self._aiter_pages(exchange, symbol, timeframe, since, until, priority)) as pages:
+            async for ohlcv in pages:
+                yield ohlcv_to_frame(ohlcv)
+
+    @staticmethod
+    def _resolve_range(exchange: ccxt_async.Exchange, since, until) -> tuple[int, int]:
+        since = to_milliseconds(since)
+        until = to_milliseconds(until)
+        if until is None:
+            until = exchange.milliseconds()
+        return since, until
+
+    async def _aiter_pages(self, exchange: ccxt_async.Exchange, symbol: str, timeframe: str, since: int, until: int,
+                           priority: int) -> AsyncIterator[list]:
+        """
+        Fetches the page windows of [since, until) concurrently and yields each non-empty
+        page (raw ccxt rows, trimmed to its window) in time order. Like the sync collector,
+        windows of exchanges with smaller pages are filled with follow-up requests.
+        """
+        timeframe_ms = exchange.parse_timeframe(timeframe) * 1000
+        windows = page_windows(since, until, timeframe_ms, self.page_limit)
+        logger.info(f"Expected: {(until - since) // timeframe_ms} candles in {len(windows)} pages")
+
+        async def fetch_window(start: int, end: int) -> list:
+            ohlcv = []
+            cursor = start
+            while cursor < end:
+                fetch_limit = page_request_limit(cursor, end, timeframe_ms, self.page_limit)
+                page = await self.safe_fetch_ohlcv(exchange, symbol, timeframe, cursor, fetch_limit, priority=priority)
+                ohlcv += trim_to_window(page, cursor, end)
+                if not page or page[-1][0] + timeframe_ms >= end or page[-1][0] < cursor:
+                    break
+                cursor = page[-1][0] + 1
+            if ohlcv:
+                logger.info(f"Fetched up to: {pd.to_datetime(ohlcv[-1][0], unit='ms')}")
+            return ohlcv
+
+        # Tasks are awaited in submission order, so pages come out already sorted.
+        pending = deque()
+        try:
+            for start, end in windows:
+                pending.append(asyncio.ensure_future(fetch_window(start, end)))
+                if len(pending) >= self.max_concurrency:
+                    ohlcv = await pending.popleft()
+                    if ohlcv:
+                        yield ohlcv
+            while pending:
+                ohlcv = await pending.popleft()
+                if ohlcv:
+                    yield ohlcv
+        finally:
+            # The consumer stopped early (or a page failed): drop the in-flight pages, and wait
+            # for them so their cancellation and errors are collected rather than left dangling.
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
@@ -1,7 +1,8 @@
 # base_data_collector.py
 import logging
 from abc import ABC, abstractmethod
-from typing import Callable, Any
+from typing import Awaitable, Callable, Any
+from data.retry_policy import RetryPolicy
 logger = logging.getLogger(__name__)
 
 class BaseDataCollector(ABC):
@@ -9,6 +10,12 @@ class BaseDataCollector(ABC):
     Abstract base class that outlines the structure for all data collectors.
     Enforces the presence of fetch_by_limit and fetch_by_date methods.
     """
+
+    def __init__(self, retry_policy: RetryPolicy | None = None):
+        """
+        :param retry_policy: Retry and circuit breaker policy for API calls (a default one if omitted).
+        """
+        self.retry_policy = retry_policy or RetryPolicy()
     
     @abstractmethod
     def fetch_by_limit(self, *args, **kwargs):
@@ -35,26 +42,44 @@ class BaseDataCollector(ABC):
         **kwargs: dict
     ) -> Any:
         """
-        Example shared retry method that derived classes can use for API calls.
-        This approach encapsulates common retry logic in one place.
+        Shared retry method that derived classes can use for API calls.
+        Retries through self.retry_policy: permanent errors are raised at once, rate limits
+        honour Retry-After, and other transient errors back off exponentially with jitter.
 
         :param func: The function (API call) to attempt.
-        :param max_attempts: How many times to retry.
-        :param delay_seconds: How long to wait between retries.
+        :param max_attempts: How many times to try.
+        :param delay_seconds: Kept for compatibility; delays now follow the retry policy's backoff.
         :param args: Positional arguments to pass to the function.
         :param kwargs: Keyword arguments to pass to the function.
         :return: The result of the function call if successful.
         :raises Exception: If all attempts fail, raise the last encountered exception.
         """
-        last_exception: Exception | None = None
-        for attempt in range(1, max_attempts + 1):
-            try:
-                return func(*args, **kwargs)
-            except Exception as e:
-                logger.warning(f"Attempt {attempt}/{max_attempts} failed: {e}")
-                last_exception = e
-                if attempt < max_attempts:
-                    import time
-                    time.sleep(delay_seconds)
-        # If we reach here, all attempts have failed
-        raise last_exception
\ No newline at end of file
+        return self.retry_policy.call(lambda: func(*args, **kwargs), key=type(self).__name__, max_attempts=max_attempts)
+
+    async def async_safe_retry(
+        self,
+        func: Callable[..., Awaitable[Any]],
+        max_attempts: int = 3,
+        delay_seconds: int = 3,
+        *args: tuple,
+        **kwargs: dict
+    ) -> Any:
+        """
+        Coroutine counterpart of safe_retry for async collectors.
+        Waits with asyncio.sleep so other requests keep running between attempts.
+
+        :param func: The coroutine function (API call) to attempt.
+        :param max_attempts: How many times to try.
+        :param delay_seconds: Kept for compatibility; delays now follow the retry policy's backoff.
+        :param args: Positional arguments to pass to the function.
+        :param kwargs: Keyword arguments to pass to the function.
+        :return: The result of the awaited call if successful.
+        :raises Exception: If all attempts fail, raise the last encountered exception.
+        """
+        return await self.retry_policy.acall(lambda: func(*args, **kwargs), key=type(self).__name__, max_attempts=max_attempts)
+
+    def retry_stats(self) -> dict:
+        """
+        Returns retry, give-up and circuit breaker metrics, per exchange.
+        """
+        return self.retry_policy.stats()
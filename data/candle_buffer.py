@@ -0,0 +1,129 @@
+# candle_buffer.py
+import logging
+import numpy as np
+import pandas as pd
+from typing import Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+VALUE_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+class CandleBuffer:
+    """
+    Growable columnar candle store: one int64 array of epoch-millisecond timestamps and
+    one float64 (n, 5) block of OHLCV values, preallocated and doubled when full.
+
+    Collectors append raw exchange pages straight into it instead of accumulating Python
+    lists, and to_frame() hands the arrays to pandas without copying them.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        """
+        :param capacity: Initial number of candles; pass the expected total to avoid regrowth.
+        """
+        capacity = max(1, int(capacity))
+        self._timestamps = np.empty(capacity, dtype=np.int64)
+        self._values = np.empty((capacity, len(VALUE_COLUMNS)), dtype=np.float64)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def capacity(self) -> int:
+        return len(self._timestamps)
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self._timestamps[:self._size]
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._values[:self._size]
+
+    def _reserve(self, extra: int) -> None:
+        needed = self._size + extra
+        if needed <= self.capacity:
+            return
+        capacity = max(needed, 2 * self.capacity)
+        timestamps = np.empty(capacity, dtype=np.int64)
+        values = np.empty((capacity, len(VALUE_COLUMNS)), dtype=np.float64)
+        timestamps[:self._size] = self._timestamps[:self._size]
+        values[:self._size] = self._values[:self._size]
+        self._timestamps, self._values = timestamps, values
+
+    def append(self, ohlcv) -> None:
+        """
+        Appends rows of [timestamp ms, open, high, low, close, volume], as returned by
+        ccxt fetch_ohlcv (a list of lists or an (n, 6) array). None values become NaN.
+        """
+        rows = np.array(ohlcv, dtype=np.float64).reshape(-1, len(VALUE_COLUMNS) + 1)
+        self.extend(rows[:, 0].astype(np.int64), rows[:, 1:])
+
+    def extend(self, timestamps: np.ndarray, values: np.ndarray) -> None:
+        """
+        Appends epoch-millisecond timestamps and the matching (n, 5) OHLCV values.
+        """
+        count = len(timestamps)
+        self._reserve(count)
+        self._timestamps[self._size:self._size + count] = timestamps
+        self._values[self._size:self._size + count] = values
+        self._size += count
+
+    def dedupe_sort(self) -> None:
+        """
+        Sorts by timestamp in place and keeps the last appended candle of each timestamp.
+        """
+        if self._size == 0:
+            return
+        timestamps = self.timestamps
+        if self._size > 1 and np.all(timestamps[1:] > timestamps[:-1]):
+            return
+        # Stable sort keeps append order among equal timestamps, so the last one wins.
+        order = np.argsort(timestamps, kind='stable')
+        sorted_ts = timestamps[order]
+        keep = np.append(sorted_ts[1:] != sorted_ts[:-1], True)
+        order = order[keep]
+        count = len(order)
+        self._values[:count] = self._values[order]
+        self._timestamps[:count] = sorted_ts[keep]
+        self._size = count
+
+    def clear(self) -> None:
+        self._size = 0
+
+    def to_frame(self, start: int = 0, stop: int | None = None) -> pd.DataFrame:
+        """
+        Returns rows [start, stop) as a candle DataFrame whose columns are views on the
+        buffer, so the buffer must not be appended to or sorted while the frame is in use.
+        """
+        stop = self._size if stop is None else min(stop, self._size)
+        df = pd.DataFrame(self._values[start:stop], columns=VALUE_COLUMNS, copy=False)
+        df.insert(0, 'timestamp', self._timestamps[start:stop].view('datetime64[ms]'))
+        return df
+
+    def iter_frames(self, batch_size: int) -> Iterator[pd.DataFrame]:
+        """
+        Yields consecutive zero-copy frames of at most `batch_size` candles, e.g. one per Mongo write batch.
+        """
+        for start in range(0, self._size, batch_size):
+            yield self.to_frame(start, start + batch_size)
+
+def rebatch_frames(chunks: Iterable[pd.DataFrame], min_rows: int) -> Iterator[pd.DataFrame]:
+    """
+    Concatenates consecutive chunks into frames of at least `min_rows` rows (the last
+    one may be shorter), so consumers write in efficient batches while memory stays
+    bounded by the batch size. Empty chunks are skipped, so no frame is ever empty.
+    """
+    buffer, rows = [], 0
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        buffer.append(chunk)
+        rows += len(chunk)
+        if rows >= min_rows:
+            yield pd.concat(buffer, ignore_index=True)
+            buffer, rows = [], 0
+    if buffer:
+        yield pd.concat(buffer, ignore_index=True)
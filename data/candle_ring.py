@@ -0,0 +1,263 @@
+# candle_ring.py
+import itertools
+import logging
+import re
+import threading
+import time
+from datetime import timedelta
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+import pandas as pd
+from ccxt import Exchange
+from data.candle_buffer import CandleBuffer, VALUE_COLUMNS
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+HEADER_SIZE = 4
+SEQUENCE, COUNT, CAPACITY = 0, 1, 2
+# Readers spin this many times on a busy ring before yielding the CPU between retries.
+READ_SPINS = 1000
+READ_TIMEOUT_SEC = 1.0
+
+def ring_name(exchange: str, symbol: str, timeframe: str, prefix: str = "candles") -> str:
+    """
+    Shared memory name of a pair's ring, e.g. candles_binance_BTCUSDT_1m.
+    Timeframes keep their case, so 1m and 1M get different rings.
+    """
+    return re.sub(r"[^A-Za-z0-9_]", "_", f"{prefix}_{exchange}_{symbol.replace('/', '')}_{timeframe}")
+
+class CandleRing:
+    """
+    The latest `capacity` candles of one pair in a shared memory segment:
+
+        int64[4]                header: sequence, candles written, capacity, unused
+        int64[capacity]         timestamps (epoch ms)
+        float64[capacity, 5]    open, high, low, close, volume
+
+    One process writes it (the updater); any number of threads and processes read it
+    without locks. The writer keeps the sequence odd while it writes, and readers retry
+    until they copied a window under one unchanged even sequence (a seqlock).
+    """
+
+    def __init__(self, name: str, capacity: int = 500, create: bool = False):
+        """
+        :param name: Shared memory name (see ring_name).
+        :param capacity: Number of candles kept; ignored when attaching to an existing ring.
+        :param create: Create the segment (writer side) instead of attaching to it (reader side).
+            An existing segment of the same capacity is reused, e.g. after a writer restart;
+            a sequence left odd by a writer that died mid-update is made even again.
+        """
+        self.name = name
+        self.owner = create
+        size = 8 * (HEADER_SIZE + capacity * (1 + len(VALUE_COLUMNS)))
+        created = False
+        if create:
+            try:
+                self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+                created = True
+            except FileExistsError:
+                self._shm = shared_memory.SharedMemory(name=name)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            # Readers must not unlink the segment when they exit (the tracker would).
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+
+        self._header = np.ndarray((HEADER_SIZE,), dtype=np.int64, buffer=self._shm.buf)
+        if created:
+            self._header[:] = 0
+            self._header[CAPACITY] = capacity
+        elif create and self._header[CAPACITY] != capacity:
+            stored = int(self._header[CAPACITY])
+            self._release()
+            raise ValueError(f"Ring {name} exists with capacity {stored}, not {capacity}")
+        elif create and self._header[SEQUENCE] % 2:
+            # The previous writer died inside update(); without this readers would wait forever.
+            logger.warning(f"Ring {name} was left mid-update by its previous writer; its last update may be partial.")
+            self._header[SEQUENCE] += 1
+        self.capacity = int(self._header[CAPACITY])
+        offset = 8 * HEADER_SIZE
+        self._timestamps = np.ndarray((self.capacity,), dtype=np.int64, buffer=self._shm.buf, offset=offset)
+        self._values = np.ndarray((self.capacity, len(VALUE_COLUMNS)), dtype=np.float64, buffer=self._shm.buf,
+                                  offset=offset + 8 * self.capacity)
+        self._write_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return min(int(self._header[COUNT]), self.capacity)
+
+    def _slots(self, count: int) -> np.ndarray:
+        # Ring slots of the stored candles, oldest first.
+        return np.arange(max(0, count - self.capacity), count) % self.capacity
+
+    def update(self, timestamps: np.ndarray, values: np.ndarray) -> None:
+        """
+        Writes candles sorted by timestamp. Newer candles are appended (the oldest fall
+        out), and candles already in the ring, such as the still-open one, are overwritten.
+        Older candles that are no longer in the ring are ignored.
+        """
+        if len(timestamps) == 0:
+            return
+        with self._write_lock:
+            self._header[SEQUENCE] += 1
+            try:
+                count = int(self._header[COUNT])
+                slots = self._slots(count)
+                last = self._timestamps[slots[-1]] if count else np.iinfo(np.int64).min
+                newer = timestamps > last
+
+                if not newer.all() and count:
+                    known = self._timestamps[slots]
+                    positions = np.searchsorted(known, timestamps[~newer])
+                    found = positions < len(known)
+                    found[found] = known[positions[found]] == timestamps[~newer][found]
+                    self._values[slots[positions[found]]] = values[~newer][found]
+
+                new_timestamps, new_values = timestamps[newer][-self.capacity:], values[newer][-self.capacity:]
+                skipped = int(newer.sum()) - len(new_timestamps)
+                new_slots = (count + skipped + np.arange(len(new_timestamps))) % self.capacity
+                self._timestamps[new_slots] = new_timestamps
+                self._values[new_slots] = new_values
+                self._header[COUNT] = count + skipped + len(new_timestamps)
+            finally:
+                self._header[SEQUENCE] += 1
+
+    def update_frame(self, df: pd.DataFrame) -> None:
+        """
+        Writes a candle DataFrame (timestamp column plus OHLCV columns).
+        """
+        if df is None or df.empty:
+            return
+        buffer = CandleBuffer(capacity=len(df))
+        timestamps = pd.to_datetime(df["timestamp"], utc=True).dt.tz_localize(None)
+        buffer.extend(timestamps.to_numpy().astype("datetime64[ms]").astype(np.int64),
+                      df.reindex(columns=VALUE_COLUMNS).to_numpy(dtype=np.float64))
+        buffer.dedupe_sort()
+        self.update(buffer.timestamps, buffer.values)
+
+    def latest(self, n: int | None = None, timeout: float = READ_TIMEOUT_SEC) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns copies of the timestamps and OHLCV values of the latest `n` candles
+        (all of them by default), oldest first.
+
+        :param timeout: Seconds to wait for a consistent copy while the writer is busy.
+        :raises TimeoutError: If the ring stayed mid-update for `timeout` seconds.
+        """
+        deadline = None
+        for attempt in itertools.count():
+            if attempt >= READ_SPINS:
+                # Busy for longer than an update takes: back off, and give up eventually.
+                deadline = deadline or time.monotonic() + timeout
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Ring {self.name} stayed mid-update for {timeout}s")
+                time.sleep(0)
+            sequence = int(self._header[SEQUENCE])
+            if sequence % 2:
+                continue
+            slots = self._slots(int(self._header[COUNT]))
+            if n is not None:
+                slots = slots[len(slots) - min(n, len(slots)):]
+            timestamps, values = self._timestamps[slots], self._values[slots]
+            if int(self._header[SEQUENCE]) == sequence:
+                return timestamps, values
+
+    def to_frame(self, n: int | None = None) -> pd.DataFrame:
+        """
+        Returns the latest `n` candles as a typed DataFrame, oldest first.
+        """
+        timestamps, values = self.latest(n)
+        buffer = CandleBuffer(capacity=len(timestamps))
+        buffer.extend(timestamps, values)
+        return buffer.to_frame()
+
+    def _release(self) -> None:
+        self._header = self._timestamps = self._values = None
+        self._shm.close()
+
+    def close(self, unlink: bool | None = None) -> None:
+        """
+        Detaches from the segment; the writer also removes it unless unlink=False.
+        """
+        unlink = self.owner if unlink is None else unlink
+        self._release()
+        if unlink:
+            self._shm.unlink()
+
+class CandleRingStore:
+    """
+    One CandleRing per (exchange, symbol, timeframe). The updater process creates the
+    rings (create=True), warm-loads them from Mongo and keeps them current; indicator and
+    strategy code in any thread or process opens a store with create=False and reads
+    recent windows straight from shared memory.
+    """
+
+    def __init__(self, capacity: int = 500, create: bool = False, prefix: str = "candles"):
+        """
+        :param capacity: Candles kept per pair.
+        :param create: Writer side (creates the rings) or reader side (attaches to them).
+        :param prefix: Shared memory name prefix, to run several independent stores.
+        """
+        self.capacity = capacity
+        self.create = create
+        self.prefix = prefix
+        self._rings: dict[tuple[str, str, str], CandleRing] = {}
+        self._warmed: set[tuple[str, str, str]] = set()
+        self._lock = threading.Lock()
+
+    def ring(self, exchange: str, symbol: str, timeframe: str) -> CandleRing:
+        """
+        Returns the ring of a pair, creating or attaching to it on first use.
+
+        :raises FileNotFoundError: On the reader side, if no writer created the ring yet.
+        """
+        pair = (exchange, symbol, timeframe)
+        ring = self._rings.get(pair)
+        if ring is not None:
+            return ring
+        with self._lock:
+            ring = self._rings.get(pair)
+            if ring is None:
+                ring = CandleRing(ring_name(exchange, symbol, timeframe, self.prefix), self.capacity, create=self.create)
+                self._rings[pair] = ring
+        return ring
+
+    def update_frame(self, df: pd.DataFrame, exchange: str, symbol: str, timeframe: str) -> None:
+        self.ring(exchange, symbol, timeframe).update_frame(df)
+
+    def latest(self, exchange: str, symbol: str, timeframe: str, n: int | None = None) -> pd.DataFrame:
+        """
+        Returns the latest `n` candles of a pair as a DataFrame, oldest first.
+        """
+        return self.ring(exchange, symbol, timeframe).to_frame(n)
+
+    def warm_load(self, mongo_handler, pairs) -> int:
+        """
+        Fills the rings of pairs not loaded yet with their latest stored candles.
+
+        :param mongo_handler: Instance of MongoDBHandler.
+        :param pairs: Iterable of (exchange, symbol, timeframe) tuples.
+        :return: Number of candles loaded.
+        """
+        pairs = [pair for pair in pairs if pair not in self._warmed]
+        if not pairs:
+            return 0
+        loaded = 0
+        for pair, latest in mongo_handler.get_latest_timestamps(pairs).items():
+            exchange, symbol, timeframe = pair
+            if latest is not None:
+                # Months are shorter than parse_timeframe's 30 days at most by 10%.
+                span = timedelta(seconds=Exchange.parse_timeframe(timeframe) * self.capacity * 1.1)
+                df = mongo_handler.get_ohlcv(exchange, symbol, timeframe, start=latest - span)
+                self.update_frame(df, exchange, symbol, timeframe)
+                loaded += len(df)
+            self._warmed.add(pair)
+        logger.info(f"Warm-loaded {loaded} candles into {len(pairs)} rings.")
+        return loaded
+
+    def close(self) -> None:
+        """
+        Detaches from every ring; the writer side also removes them.
+        """
+        with self._lock:
+            for ring in self._rings.values():
+                ring.close()
+            self._rings = {}
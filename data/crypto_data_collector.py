@@ -1,141 +1,296 @@
 # crypto_data_collector.py
 import logging
-import time
 import pandas as pd
 import ccxt
 from dateutil.parser import parse
 from datetime import datetime, timezone
 import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
 from data.base_data_collector import BaseDataCollector
+from data.candle_buffer import CandleBuffer
+from data.market_cache import MarketMetadataCache
+from data.rate_limiter import RequestScheduler
+from data.retry_policy import RetryPolicy
 from pytz import utc
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+def to_milliseconds(value: str | datetime | int | None) -> int | None:
+    """
+    Converts a date string, datetime or millisecond timestamp to UTC milliseconds.
+    """
+    if isinstance(value, str):
+        value = parse(value).astimezone(utc)
+    if isinstance(value, datetime):
+        value = int(value.timestamp() * 1000)
+    return value
+
+def page_windows(since: int, until: int, timeframe_ms: int, page_limit: int) -> list[tuple[int, int]]:
+    """
+    Splits [since, until) into consecutive windows of at most `page_limit` candles,
+    so that every window can be fetched with a single request.
+    """
+    page_ms = page_limit * timeframe_ms
+    return [(start, min(start + page_ms, until)) for start in range(since, until, page_ms)]
+
+def page_request_limit(start: int, end: int, timeframe_ms: int, page_limit: int) -> int:
+    """
+    Number of candles to ask for in the window [start, end). One extra candle covers
+    calendar timeframes (1M) whose real length differs from parse_timeframe.
+    """
+    return min(page_limit, -(-(end - start) // timeframe_ms) + 1)
+
+def trim_to_window(ohlcv: list, start: int, end: int) -> list:
+    """
+    Exchanges skip over holes, so a page can run past its window; trim it
+    so neighbouring windows never return the same candle twice.
+    """
+    return [candle for candle in ohlcv if start <= candle[0] < end]
+
+def ohlcv_to_frame(ohlcv: list) -> pd.DataFrame:
+    """
+    Builds a typed candle DataFrame (datetime64 timestamps, float64 OHLCV) from raw
+    exchange rows in one NumPy conversion. Missing values (None) become NaN.
+    """
+    buffer = CandleBuffer(capacity=len(ohlcv))
+    buffer.append(ohlcv)
+    return buffer.to_frame()
+
 class CryptoDataCollector(BaseDataCollector):
     
-    def __init__(self, exchange_names=None):
-        super().__init__()  # Call base class initializer if needed
+    def __init__(self, exchange_names=None, max_workers: int = 4, page_limit: int = 1000,
+                 market_cache: MarketMetadataCache | None = None, retry_policy: RetryPolicy | None = None):
+        super().__init__(retry_policy=retry_policy)
         self.exchanges = {}
-        exchange_names = exchange_names or [name.strip() for name in os.getenv('ALLOWED_EXCHANGES', 'binance').split(',')]
-        logger.info(f"Initializing exchanges: {exchange_names}")
-        for name in exchange_names:
-            try:
-                self.exchanges[name] = getattr(ccxt, name)()
-                logger.info(f"Initialized exchange: {name}")
-            except AttributeError:
-                logger.error(f"Exchange '{name}' is not supported by ccxt.")
-            except Exception as e:
-                logger.error(f"Failed to initialize {name}: {e}")
+        self.schedulers = {}
+        self.max_workers = max_workers
+        self.page_limit = page_limit
+        self.market_cache = market_cache or MarketMetadataCache()
+        # Exchange ids that need an explicit `since` to return the latest candles.
+        self._since_required = set()
+        self._exchanges_lock = threading.Lock()
+        # Exchanges are created on first use (see check_exchange), so startup costs nothing.
+        self.exchange_names = exchange_names or [name.strip() for name in os.getenv('ALLOWED_EXCHANGES', 'binance').split(',')]
+        logger.info(f"Allowed exchanges: {self.exchange_names}")
+
+    def _init_exchange(self, name: str) -> ccxt.Exchange | None:
+        try:
+            exchange = getattr(ccxt, name)()
+        except AttributeError:
+            logger.error(f"Exchange '{name}' is not supported by ccxt.")
+            return None
+        # Pacing is done by the shared scheduler below; ccxt's own throttle
+        # is per-call and not thread-aware, so it would only add dead time.
+        exchange.enableRateLimit = False
+        try:
+            # Cached markets spare the exchange its load_markets download on the first request.
+            if not self.market_cache.apply(exchange):
+                self.market_cache.ensure_index(exchange)
+        except Exception as e:
+            logger.warning(f"Could not load markets of {name} up front: {e}")
+        # check_exchange reads self.exchanges without the lock, so the scheduler must be in
+        # place before the exchange is published, or a caller could fetch unthrottled.
+        self.schedulers[name] = RequestScheduler.from_exchange(exchange)
+        self.exchanges[name] = exchange
+        logger.info(f"Initialized exchange: {name}")
+        return exchange
 
-    def safe_fetch_ohlcv(self, exchange: ccxt.Exchange, symbol: str, timeframe: str, since: int, limit: int):
+    def safe_fetch_ohlcv(self, exchange: ccxt.Exchange, symbol: str, timeframe: str, since: int, limit: int,
+                         priority: int = RequestScheduler.PRIORITY_DEFAULT, weight: float = 1):
         """
-        Fetches OHLCV data using the exchange's API with a retry mechanism.
-        This method now uses the safe_retry method from BaseDataCollector.
+        Fetches OHLCV data using the exchange's API through the retry policy.
+        Retries, Retry-After hints and the circuit breaker are tracked per exchange.
         
         :param exchange: The exchange instance.
         :param symbol: The trading pair symbol (e.g., 'BTC/USDT').
         :param timeframe: The timeframe for the candles (e.g., '1h').
         :param since: Starting timestamp in milliseconds.
         :param limit: Maximum number of candles to fetch in one call.
+        :param priority: Scheduler priority of the request (lower is served first).
+        :param weight: Request weight drawn from the exchange budget.
         :return: The OHLCV data as returned by the exchange.
-        :raises RuntimeError: If maximum retry attempts are exceeded.
+        :raises CircuitOpenError: If the exchange's circuit breaker stays open too long.
         """
+        scheduler = self.schedulers.get(exchange.id)
+
         def fetch_func():
+            if scheduler is not None:
+                scheduler.acquire(weight=weight, priority=priority)
             return exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=since, limit=limit)
         
-        return self.safe_retry(fetch_func, max_attempts=3, delay_seconds=3)
+        return self.retry_policy.call(fetch_func, key=exchange.id, headers=lambda: getattr(exchange, 'last_response_headers', None))
+
+    def scheduler_stats(self) -> dict:
+        """
+        Returns queue depth and wait-time statistics for every exchange scheduler.
+        """
+        return {name: scheduler.stats() for name, scheduler in self.schedulers.items()}
 
     def check_symbol_and_timeframe(self, exchange_name: str, symbol: str, timeframe: str):
-        exchange = self.check_exchange(exchange_name)
-        exchange.load_markets()
-        
-        if symbol not in exchange.symbols:
-            return (f"{symbol} not supported on {exchange.id}")
-        
-        if hasattr(exchange, 'timeframes') and timeframe not in exchange.timeframes:
-            return (f"Timeframe '{timeframe}' not supported on {exchange.id}")
-             
-                
+        """
+        Returns an error message if the exchange does not list the symbol or timeframe, else None.
+        """
+        return self.validate_pairs([{"exchange": exchange_name, "symbol": symbol, "timeframe": timeframe}]).get(
+            (exchange_name, symbol, timeframe))
+
+    def validate_pairs(self, crypto_tests) -> dict:
+        """
+        Checks a whole config of pairs with one metadata lookup per exchange, served from
+        the market cache while it is fresh.
+
+        :param crypto_tests: List of dicts with keys "exchange", "symbol", "timeframe".
+        :return: Error message per invalid (exchange, symbol, timeframe); empty if all are valid.
+        """
+        errors = {}
+        indexes = {}
+        for test in crypto_tests:
+            pair = (test["exchange"], test["symbol"], test["timeframe"])
+            exchange_name, symbol, timeframe = pair
+            if exchange_name not in indexes:
+                indexes[exchange_name] = None
+                if exchange_name in self.exchange_names or exchange_name in self.exchanges:
+                    indexes[exchange_name] = (self.market_cache.index(exchange_name)
+                                              or self.market_cache.ensure_index(self.check_exchange(exchange_name)))
+            index = indexes[exchange_name]
+            if index is None:
+                errors[pair] = f"Exchange '{exchange_name}' not initialized."
+            elif symbol not in index["symbols"]:
+                errors[pair] = f"{symbol} not supported on {exchange_name}"
+            elif index["timeframes"] and timeframe not in index["timeframes"]:
+                errors[pair] = f"Timeframe '{timeframe}' not supported on {exchange_name}"
+        return errors
+
     def check_exchange(self, exchange_name:str) -> ccxt.Exchange:
         exchange = self.exchanges.get(exchange_name)
+        if exchange is None and exchange_name in self.exchange_names:
+            with self._exchanges_lock:
+                exchange = self.exchanges.get(exchange_name) or self._init_exchange(exchange_name)
         if not exchange:
-            return ValueError(f"Exchange '{exchange_name}' not initialized.")
+            raise ValueError(f"Exchange '{exchange_name}' not initialized.")
         return exchange
-    
-    def fetch_by_limit(self, exchange_name: str, symbol: str, limit: int, timeframe: str ='1d') -> pd.DataFrame:
+
+    def fetch_by_limit(self, exchange_name: str, symbol: str, limit: int, timeframe: str ='1d',
+                       priority: int = RequestScheduler.PRIORITY_REALTIME) -> pd.DataFrame:
         """
         Concrete implementation of the abstract method from BaseDataCollector.
+        Requests default to real-time priority, since this is what the tail updaters call.
+
+        Up to page_limit candles take a single request without `since`, which returns the
+        latest candles on most exchanges. Larger limits are fetched as concurrent pages.
+        Pacing is left to the exchange's RequestScheduler, so no call sleeps afterwards.
         """
         exchange = self.check_exchange(exchange_name)
-        
-        all_ohlcv = []
-        max_limit = 1000
-        since = exchange.milliseconds() - (limit * exchange.parse_timeframe(timeframe) * 1000)
-
-        while len(all_ohlcv) < limit:
-            fetch_limit = min(max_limit, limit - len(all_ohlcv))
-            ohlcv = self.safe_fetch_ohlcv(exchange, symbol, timeframe, since, fetch_limit)
-            if not ohlcv:
-                break
+        timeframe_ms = exchange.parse_timeframe(timeframe) * 1000
+        now = exchange.milliseconds()
+        # Open time of the oldest of the `limit` latest candles (the open one included).
+        since = (now // timeframe_ms - limit + 1) * timeframe_ms
 
-            all_ohlcv += ohlcv
-            last_timestamp = ohlcv[-1][0]
-            logger.info(f"Fetched up to: {pd.to_datetime(last_timestamp, unit='ms')}")
-            since = last_timestamp + 1
-            # Respect rate limit
-            time.sleep(max(exchange.rateLimit / 1000, 1))
+        if limit > self.page_limit:
+            return self.fetch_by_date(exchange_name, symbol, timeframe, since=since, until=now, priority=priority).tail(limit).reset_index(drop=True)
 
-            if len(ohlcv) < fetch_limit:
-                break
+        if exchange.id not in self._since_required:
+            ohlcv = self.safe_fetch_ohlcv(exchange, symbol, timeframe, None, limit, priority=priority)
+            # Some exchanges answer a missing `since` with their oldest candles; remember
+            # those and ask them with an explicit `since` from now on.
+            if ohlcv and ohlcv[-1][0] < since:
+                logger.info(f"{exchange.id} does not return the latest candles without 'since'; using explicit ranges.")
+                self._since_required.add(exchange.id)
+            else:
+                return ohlcv_to_frame(ohlcv[-limit:])
 
-        df = pd.DataFrame(all_ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        return df
+        ohlcv = self.safe_fetch_ohlcv(exchange, symbol, timeframe, since, limit, priority=priority)
+        return ohlcv_to_frame(ohlcv[-limit:])
 
-    def fetch_by_date(self, exchange_name: str, symbol: str, timeframe : str ='1h', since : str | datetime = None, until : str | datetime = None) -> pd.DataFrame:
+    def fetch_by_date(self, exchange_name: str, symbol: str, timeframe : str ='1h', since : str | datetime = None, until : str | datetime = None,
+                      priority: int = RequestScheduler.PRIORITY_BACKFILL) -> pd.DataFrame:
         """
         Concrete implementation of the abstract method from BaseDataCollector.
+        Requests default to backfill priority; pass PRIORITY_REALTIME for short tail fetches.
+        For long ranges prefer iter_by_date, which does not hold the whole range in memory.
         """
         exchange = self.check_exchange(exchange_name)
+        since, until = self._resolve_range(exchange, since, until)
+        timeframe_ms = exchange.parse_timeframe(timeframe) * 1000
+
+        # Sized for the whole range up front, so pages are copied in exactly once.
+        buffer = CandleBuffer(capacity=(until - since) // timeframe_ms + 1)
+        for ohlcv in self._iter_pages(exchange, symbol, timeframe, since, until, priority):
+            buffer.append(ohlcv)
+        buffer.dedupe_sort()
+        logger.info(f"Fetched: {len(buffer)} candles")
+        return buffer.to_frame()
 
-        # Convert 'since' and 'until' to ms
-        if isinstance(since, str):
-            since = parse(since).astimezone(utc)
-        if isinstance(until, str):
-            until = parse(until).astimezone(utc)
+    def iter_by_date(self, exchange_name: str, symbol: str, timeframe: str = '1h', since: str | datetime = None, until: str | datetime = None,
+                     priority: int = RequestScheduler.PRIORITY_BACKFILL) -> Iterator[pd.DataFrame]:
+        """
+        Yields the candles in [since, until) as one typed DataFrame per page, in time order,
+        as soon as each page arrives. At most max_workers pages are in flight, so memory
+        stays flat whatever the range and consumers can write after the first page.
+        """
+        exchange = self.check_exchange(exchange_name)
+        since, until = self._resolve_range(exchange, since, until)
+        for ohlcv in self._iter_pages(exchange, symbol, timeframe, since, until, priority):
+            yield ohlcv_to_frame(ohlcv)
 
-        if isinstance(since, datetime):
-            since = int(since.timestamp() * 1000)
-        if until and isinstance(until, datetime):
-            until = int(until.timestamp() * 1000)
+    @staticmethod
+    def _resolve_range(exchange: ccxt.Exchange, since, until) -> tuple[int, int]:
+        # Convert 'since' and 'until' to ms; an open end means up to now.
+        since = to_milliseconds(since)
+        until = to_milliseconds(until)
+        if until is None:
+            until = exchange.milliseconds()
+        return since, until
 
-        all_ohlcv = []
-        limit = 1000
+    def _iter_pages(self, exchange: ccxt.Exchange, symbol: str, timeframe: str, since: int, until: int,
+                    priority: int) -> Iterator[list]:
+        """
+        Fetches the page windows of [since, until) concurrently and yields each non-empty
+        page (raw ccxt rows, trimmed to its window) in time order. Exchanges returning
+        fewer than page_limit candles per call (Kraken 720, Coinbase 300, ...) get follow-up
+        requests until their window is filled.
+        """
         timeframe_ms = exchange.parse_timeframe(timeframe) * 1000
-        
-        if until:
-            total_expected = (until - since) // timeframe_ms
-        else:
-            total_expected = float('inf')
-        logger.info(f"Expected: {total_expected} candles")
-        
-        while len(all_ohlcv) < total_expected:
-            fetch_limit = min(limit, total_expected - len(all_ohlcv))
-            logger.info(f"Fetching {fetch_limit} rows")
-            ohlcv = self.safe_fetch_ohlcv(exchange, symbol, timeframe, since, fetch_limit)
-            if not ohlcv:
-                break
-
-            all_ohlcv += ohlcv
-            last_timestamp = ohlcv[-1][0]
-            logger.info(f"Fetched up to: {pd.to_datetime(last_timestamp, unit='ms')}")
-            since = last_timestamp + 1
-            time.sleep(max(exchange.rateLimit / 1000, 1))
-            if len(ohlcv) < fetch_limit:
-                break
-            
-        df = pd.DataFrame(all_ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        logger.info(f"Fetched: {len(df)} candles")
-        return df
+        windows = page_windows(since, until, timeframe_ms, self.page_limit)
+        total_expected = (until - since) // timeframe_ms
+        logger.info(f"Expected: {total_expected} candles in {len(windows)} pages")
+
+        def fetch_window(window):
+            start, end = window
+            ohlcv = []
+            cursor = start
+            while cursor < end:
+                fetch_limit = page_request_limit(cursor, end, timeframe_ms, self.page_limit)
+                page = self.safe_fetch_ohlcv(exchange, symbol, timeframe, cursor, fetch_limit, priority=priority)
+                ohlcv += trim_to_window(page, cursor, end)
+                # An empty page means no more candles; a page reaching past the window fills it.
+                # Otherwise the exchange capped the page, so continue after its last candle
+                # (from the next millisecond, since calendar months are not timeframe_ms long).
+                if not page or page[-1][0] + timeframe_ms >= end or page[-1][0] < cursor:
+                    break
+                cursor = page[-1][0] + 1
+            if ohlcv:
+                logger.info(f"Fetched up to: {pd.to_datetime(ohlcv[-1][0], unit='ms')}")
+            return ohlcv
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(windows)))) as pool:
+            # Futures are consumed in submission order, so pages come out already sorted.
+            pending = deque()
+            try:
+                for window in windows:
+                    pending.append(pool.submit(fetch_window, window))
+                    if len(pending) >= self.max_workers:
+                        ohlcv = pending.popleft().result()
+                        if ohlcv:
+                            yield ohlcv
+                while pending:
+                    ohlcv = pending.popleft().result()
+                    if ohlcv:
+                        yield ohlcv
+            finally:
+                # The consumer stopped early (or a page failed): drop the queued pages.
+                for future in pending:
+                    future.cancel()
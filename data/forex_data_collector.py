@@ -1,18 +1,122 @@
 import logging
+import os
+import numpy as np
 import pandas as pd
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-import time
+from requests.adapters import HTTPAdapter
 from data.base_data_collector import BaseDataCollector
+from data.candle_buffer import CandleBuffer, VALUE_COLUMNS
+from data.rate_limiter import RequestScheduler, TokenBucket
+from data.retry_policy import RetryPolicy, APIError, RATE_LIMIT, EXCHANGE_DOWN, PERMANENT
 
 # Set up logging for the module
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Twelve Data limits: candles per time_series call and symbols per batch call.
+MAX_OUTPUT_SIZE = 5000
+MAX_BATCH_SYMBOLS = 120
+# Credits per minute of the free plan; every symbol in a time_series call costs one credit.
+DEFAULT_CREDITS_PER_MINUTE = 8
+
+def parse_values(values: list[dict]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Parses Twelve Data "values" rows into int64 ms timestamps and a float64 OHLCV matrix
+    in one vectorized pass. Forex pairs usually come without volume; missing fields become NaN.
+    """
+    if not values:
+        return np.empty(0, dtype=np.int64), np.empty((0, len(VALUE_COLUMNS)), dtype=np.float64)
+    frame = pd.DataFrame.from_records(values)
+    timestamps = pd.to_datetime(frame['datetime']).to_numpy().astype('datetime64[ms]').astype(np.int64)
+    ohlcv = frame.reindex(columns=VALUE_COLUMNS).to_numpy(dtype=np.float64)
+    return timestamps, ohlcv
+
 class ForexDataCollector(BaseDataCollector):
-    def __init__(self, api_key):
+    """
+    Twelve Data collector. Requests share one pooled HTTP session, run concurrently
+    (windows and symbol batches) and are paced by a credit scheduler refilling at the
+    plan's per-minute credit budget, so backfills run at the API's ceiling without
+    tripping its limit.
+    """
+
+    def __init__(self, api_key, retry_policy: RetryPolicy | None = None, credits_per_minute: int | None = None,
+                 max_workers: int = 4, batch_size: int = MAX_BATCH_SYMBOLS,
+                 base_url: str = "https://api.twelvedata.com/time_series"):
+        """
+        :param api_key: Twelve Data API key.
+        :param retry_policy: Retry and circuit breaker policy for API calls.
+        :param credits_per_minute: Credit budget of the plan (defaults to TWELVEDATA_CREDITS_PER_MINUTE or 8).
+        :param max_workers: Maximum number of requests in flight.
+        :param batch_size: Maximum number of symbols per batch request.
+        :param base_url: time_series endpoint (overridable for a local stub server).
+        """
+        super().__init__(retry_policy=retry_policy)
         self.api_key = api_key
-        self.base_url = "https://api.twelvedata.com/time_series"
+        self.base_url = base_url
+        self.max_workers = max_workers
+        self.batch_size = min(batch_size, MAX_BATCH_SYMBOLS)
+        credits = credits_per_minute or int(os.getenv('TWELVEDATA_CREDITS_PER_MINUTE', DEFAULT_CREDITS_PER_MINUTE))
+        # Credits reset every minute; a bucket without burst capacity never spends more than
+        # the budget in any minute, which a full one-minute burst after an idle period would.
+        self.scheduler = RequestScheduler(TokenBucket(rate=credits / 60, capacity=1))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def scheduler_stats(self) -> dict:
+        """
+        Returns queue depth and wait-time statistics of the credit scheduler.
+        """
+        return self.scheduler.stats()
+
+    @staticmethod
+    def _raise_for_error(data: dict) -> None:
+        # Twelve Data reports errors in the body (HTTP 200 with a "code").
+        if data.get("status") != "error" and "code" not in data:
+            return
+        code = data.get("code") if isinstance(data.get("code"), int) else 0
+        error_class = RATE_LIMIT if code == 429 else EXCHANGE_DOWN if code >= 500 else PERMANENT
+        raise APIError(f"[!] Error fetching data: {data}", error_class=error_class)
+
+    @staticmethod
+    def _is_empty_range(data: dict) -> bool:
+        # A window without candles (e.g. a weekend) is reported as a 400 error.
+        return data.get("code") == 400 and "no data is available" in str(data.get("message", "")).lower()
+
+    def _request(self, symbols: list[str], params: dict, priority: int = RequestScheduler.PRIORITY_DEFAULT) -> dict[str, list]:
+        """
+        Calls the time series endpoint for one or more symbols through the credit
+        scheduler and the retry policy.
+
+        :return: The raw "values" rows of every symbol.
+        """
+        params = dict(params, symbol=",".join(symbols), apikey=self.api_key, format="JSON")
+
+        def fetch_func():
+            self.scheduler.acquire(weight=len(symbols), priority=priority)
+            response = self.session.get(self.base_url, params=params, timeout=30)
+            response.raise_for_status()
+            data = response.json()
+            if len(symbols) == 1:
+                responses = {symbols[0]: data}
+            else:
+                # Batch responses are keyed by symbol, unless the whole request failed.
+                self._raise_for_error(data)
+                responses = data
+            values = {}
+            for symbol in symbols:
+                item = responses.get(symbol, {"status": "error", "message": f"No response for {symbol}"})
+                if self._is_empty_range(item):
+                    values[symbol] = []
+                    continue
+                self._raise_for_error(item)
+                values[symbol] = item.get("values", [])
+            return values
+
+        return self.retry_policy.call(fetch_func, key="twelvedata")
 
     def _get_timedelta_from_interval(self, interval : str) -> timedelta | None:
         mapping = {
@@ -27,78 +131,90 @@ class ForexDataCollector(BaseDataCollector):
         }
         return mapping.get(interval)
 
-    def fetch_by_limit(self, base : str ='EUR', quote : str = 'USD', interval : str = '1h', limit : int = 100) -> pd.DataFrame:
-        symbol = f"{base}/{quote}"
-        params = {
-            "symbol": symbol,
-            "interval": interval,
-            "outputsize": limit,
-            "apikey": self.api_key,
-            "format": "JSON"
-        }
-        response = requests.get(self.base_url, params=params)
-        data = response.json()
-        if "values" not in data:
-            raise ValueError(f"[!] Error fetching data: {data}")
-        df = pd.DataFrame(data["values"])
-        df.rename(columns={
-            'datetime': 'timestamp',
-            'open': 'open',
-            'high': 'high',
-            'low': 'low',
-            'close': 'close',
-            'volume': 'volume'
-        }, inplace=True)
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df = df.sort_values(by='timestamp').reset_index(drop=True)
-        return df
+    def _batches(self, symbols: list[str]) -> list[list[str]]:
+        return [symbols[i:i + self.batch_size] for i in range(0, len(symbols), self.batch_size)]
 
-    def fetch_by_date(self, base : str = 'EUR', quote : str = 'USD', interval : str = '1h', start_date : str | datetime = None, end_date : str | datetime = None)-> pd.DataFrame:
-        symbol = f"{base}/{quote}"
+    def _collect(self, requests_params: list[tuple[list[str], dict]], buffers: dict[str, CandleBuffer], priority: int) -> None:
+        """
+        Runs the requests concurrently and parses each response into the buffers of its symbols.
+        Buffers are only touched from this thread.
+        """
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(requests_params)))) as pool:
+            futures = [pool.submit(self._request, symbols, params, priority) for symbols, params in requests_params]
+            try:
+                for future in futures:
+                    for symbol, values in future.result().items():
+                        buffers[symbol].extend(*parse_values(values))
+            finally:
+                # A request failed: drop the queued ones.
+                for future in futures:
+                    future.cancel()
+        for buffer in buffers.values():
+            # Windows overlap on their boundary candle and come back newest first.
+            buffer.dedupe_sort()
+
+    def fetch_batch_by_limit(self, symbols: list[str], interval: str = '1h', limit: int = 100,
+                             priority: int = RequestScheduler.PRIORITY_REALTIME) -> dict[str, pd.DataFrame]:
+        """
+        Fetches the latest `limit` candles of several symbols (e.g. 'EUR/USD'),
+        up to MAX_BATCH_SYMBOLS per request.
+
+        :return: One DataFrame per symbol, oldest candle first.
+        """
+        limit = min(limit, MAX_OUTPUT_SIZE)
+        buffers = {symbol: CandleBuffer(capacity=limit) for symbol in symbols}
+        self._collect([(batch, {"interval": interval, "outputsize": limit}) for batch in self._batches(symbols)],
+                      buffers, priority)
+        return {symbol: buffer.to_frame() for symbol, buffer in buffers.items()}
+
+    def fetch_batch_by_date(self, symbols: list[str], interval: str = '1h', start_date: str | datetime = None,
+                            end_date: str | datetime = None, priority: int = RequestScheduler.PRIORITY_BACKFILL) -> dict[str, pd.DataFrame]:
+        """
+        Fetches the candles of several symbols between two dates. Every window of up to
+        MAX_OUTPUT_SIZE - 1 candles and every batch of symbols is a separate request, and
+        up to max_workers of them run at once.
+
+        :return: One DataFrame per symbol, oldest candle first.
+        """
         interval_td = self._get_timedelta_from_interval(interval)
         if not interval_td:
             raise ValueError(f"Unsupported interval: {interval}")
-        
+
         # Calculate expected number of rows
         dt_start = pd.to_datetime(start_date)
         dt_end = pd.to_datetime(end_date)
         expected = int((dt_end - dt_start) / interval_td)
-        logger.info(f"Expected: {expected} candles")
+        logger.info(f"Expected: {expected} candles per symbol")
 
-        all_data = []
+        windows = []
         batch_start = dt_start
-
         while batch_start < dt_end:
-            batch_end = min(batch_start + interval_td * 4999, dt_end)
-            logger.info(f"[+] Fetching: {batch_start} to {batch_end}")
-
-            params = {
-                "symbol": symbol,
-                "interval": interval,
-                "start_date": batch_start.strftime('%Y-%m-%d %H:%M:%S'),
-                "end_date": batch_end.strftime('%Y-%m-%d %H:%M:%S'),
-                "apikey": self.api_key,
-                "format": "JSON"
-            }
-
-            response = requests.get(self.base_url, params=params)
-            data = response.json()
-            if "values" not in data:
-                raise ValueError(f"[!] Error fetching data: {data}")
-
-            df = pd.DataFrame(data["values"])
-            df.rename(columns={'datetime': 'timestamp'}, inplace=True)
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-            df = df.sort_values(by='timestamp')
-            all_data.append(df)
-
+            batch_end = min(batch_start + interval_td * (MAX_OUTPUT_SIZE - 1), dt_end)
+            windows.append((batch_start, batch_end))
             # Advance to next window
             batch_start = batch_end + interval_td
-            time.sleep(1)  # prevent rate-limit
 
-        final_df = pd.concat(all_data).drop_duplicates(subset='timestamp').reset_index(drop=True)
-        logger.info(f"Fetched: {len(final_df)} candles")
-        return final_df
+        requests_params = [(batch, {
+            "interval": interval,
+            "start_date": start.strftime('%Y-%m-%d %H:%M:%S'),
+            "end_date": end.strftime('%Y-%m-%d %H:%M:%S'),
+            "outputsize": MAX_OUTPUT_SIZE,
+        }) for batch in self._batches(symbols) for start, end in windows]
+        logger.info(f"[+] Fetching {len(symbols)} symbol(s) from {dt_start} to {dt_end} in {len(requests_params)} requests")
+
+        buffers = {symbol: CandleBuffer(capacity=expected + len(windows)) for symbol in symbols}
+        self._collect(requests_params, buffers, priority)
+        frames = {symbol: buffer.to_frame() for symbol, buffer in buffers.items()}
+        logger.info(f"Fetched: {sum(len(df) for df in frames.values())} candles")
+        return frames
+
+    def fetch_by_limit(self, base : str ='EUR', quote : str = 'USD', interval : str = '1h', limit : int = 100) -> pd.DataFrame:
+        symbol = f"{base}/{quote}"
+        return self.fetch_batch_by_limit([symbol], interval=interval, limit=limit)[symbol]
+
+    def fetch_by_date(self, base : str = 'EUR', quote : str = 'USD', interval : str = '1h', start_date : str | datetime = None, end_date : str | datetime = None)-> pd.DataFrame:
+        symbol = f"{base}/{quote}"
+        return self.fetch_batch_by_date([symbol], interval=interval, start_date=start_date, end_date=end_date)[symbol]
     
     def fill_missing_candles(self, df: pd.DataFrame, interval: str) -> pd.DataFrame:
         """
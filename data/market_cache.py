@@ -0,0 +1,109 @@
+# market_cache.py
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "candlecollector", "markets")
+
+class MarketMetadataCache:
+    """
+    On-disk cache of exchange market metadata, shared by every exchange, collector and
+    process pointing at the same directory. Each exchange gets two files:
+
+        <id>.json          {"fetched_at": epoch sec, "symbols": [...], "timeframes": [...]}
+        <id>.markets.json  {"markets": {...}, "currencies": {...}}
+
+    The small index answers symbol/timeframe validation without creating the exchange,
+    and the full markets are handed to new exchange instances with set_markets, so
+    neither needs a load_markets download while the cache is younger than `ttl`.
+    """
+
+    def __init__(self, cache_dir: str | None = None, ttl: float = 24 * 3600):
+        """
+        :param cache_dir: Directory of the cache files (defaults to MARKET_CACHE_DIR or ~/.cache/candlecollector/markets).
+        :param ttl: Seconds after which cached metadata is downloaded again.
+        """
+        self.cache_dir = cache_dir or os.getenv("MARKET_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.ttl = ttl
+        self._indexes: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, exchange_id: str, suffix: str = "") -> str:
+        return os.path.join(self.cache_dir, f"{exchange_id}{suffix}.json")
+
+    def _fresh(self, index: dict | None) -> bool:
+        return index is not None and time.time() - index.get("fetched_at", 0) < self.ttl
+
+    def _read(self, path: str) -> dict | None:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable market cache file {path}: {e}")
+            return None
+
+    def _write(self, path: str, data: dict) -> None:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def index(self, exchange_id: str) -> dict | None:
+        """
+        Returns the cached symbol/timeframe index of an exchange, or None if missing or expired.
+        """
+        with self._lock:
+            index = self._indexes.get(exchange_id)
+            if not self._fresh(index):
+                index = self._read(self._path(exchange_id))
+                if not self._fresh(index):
+                    return None
+                index["symbols"] = set(index["symbols"])
+                self._indexes[exchange_id] = index
+            return index
+
+    def store(self, exchange) -> dict:
+        """
+        Saves the markets an exchange has loaded and returns the new index.
+        """
+        index = {"fetched_at": time.time(), "symbols": sorted(exchange.symbols or []),
+                 "timeframes": sorted(getattr(exchange, "timeframes", None) or [])}
+        with self._lock:
+            self._write(self._path(exchange.id, ".markets"), {"markets": exchange.markets, "currencies": exchange.currencies})
+            self._write(self._path(exchange.id), index)
+            index = dict(index, symbols=set(index["symbols"]))
+            self._indexes[exchange.id] = index
+        logger.info(f"Cached {len(index['symbols'])} markets of {exchange.id}.")
+        return index
+
+    def apply(self, exchange) -> bool:
+        """
+        Loads fresh cached markets into an exchange instance.
+
+        :return: True if the exchange now has markets, False if it must call load_markets itself.
+        """
+        if self.index(exchange.id) is None:
+            return False
+        cached = self._read(self._path(exchange.id, ".markets"))
+        if cached is None:
+            return False
+        exchange.set_markets(cached["markets"], cached.get("currencies"))
+        return True
+
+    def ensure_index(self, exchange) -> dict:
+        """
+        Returns the index of an exchange, downloading and caching its markets if needed.
+        """
+        index = self.index(exchange.id)
+        if index is None:
+            exchange.load_markets(reload=True)
+            index = self.store(exchange)
+        return index
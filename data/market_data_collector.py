@@ -1,8 +1,10 @@
 from data.forex_data_collector  import ForexDataCollector
 from data.crypto_data_collector import CryptoDataCollector
+from data.ohlcv_cache import OHLCVCache, CachedCryptoDataCollector
 from db.data_exporter import DataExporter
 class MarketDataCollector:
-    def __init__(self, api_key : str | None =None):
-        self.crypto = CryptoDataCollector()
+    def __init__(self, api_key : str | None =None, cache_dir: str | None = None, cache_max_bytes: int = 2 * 1024 ** 3):
+        # With a cache_dir, closed candles are served from a local disk cache instead of the exchange.
+        self.crypto = CachedCryptoDataCollector(OHLCVCache(cache_dir, max_bytes=cache_max_bytes)) if cache_dir else CryptoDataCollector()
         self.forex = ForexDataCollector(api_key=api_key) if api_key else None
         self.exporter = DataExporter()
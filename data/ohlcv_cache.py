@@ -0,0 +1,327 @@
+# ohlcv_cache.py
+import json
+import logging
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+from typing import Iterator
+from data.candle_buffer import CandleBuffer, VALUE_COLUMNS
+from data.crypto_data_collector import CryptoDataCollector, to_milliseconds
+from data.rate_limiter import RequestScheduler
+from db.timeframe_resampler import bucket_start
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+CANDLE_DTYPE = np.dtype([
+    ("timestamp", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+])
+# Candle files are preallocated with room to grow, so new candles are appended in place.
+MIN_CAPACITY = 1024
+GROWTH_FACTOR = 1.5
+
+def merge_intervals(intervals: list) -> list:
+    """
+    Merges overlapping or touching [start, end) intervals.
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def subtract_intervals(start: int, end: int, covered: list) -> list:
+    """
+    Returns the parts of [start, end) not covered by the (merged, sorted) `covered` intervals.
+    """
+    missing = []
+    cursor = start
+    for cov_start, cov_end in covered:
+        if cov_end <= cursor:
+            continue
+        if cov_start >= end:
+            break
+        if cov_start > cursor:
+            missing.append((cursor, cov_start))
+        cursor = max(cursor, cov_end)
+    if cursor < end:
+        missing.append((cursor, end))
+    return missing
+
+class OHLCVCache:
+    """
+    Local on-disk store of closed candles, keyed by (exchange, symbol, timeframe).
+
+    Each key is one .npy file of CANDLE_DTYPE records sorted by timestamp and read through
+    a memory map, plus an entry in index.json listing the [start, end) millisecond
+    intervals known to be complete and the number of valid records. Files are
+    preallocated beyond that count, so candles newer than the stored ones are written in
+    place; the file is only rewritten to merge older or overlapping candles, or to grow.
+    Total size is capped; the least recently used keys are evicted first.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 2 * 1024 ** 3):
+        """
+        :param cache_dir: Directory holding the candle files and index.json.
+        :param max_bytes: Size cap over all candle files.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index_path = os.path.join(cache_dir, "index.json")
+        self._index = self._load_index()
+
+    def _load_index(self) -> dict:
+        if not os.path.exists(self._index_path):
+            return {}
+        try:
+            with open(self._index_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache index {self._index_path}: {e}")
+            return {}
+
+    def _save_index(self) -> None:
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self._index_path)
+
+    @staticmethod
+    def _key(exchange: str, symbol: str, timeframe: str) -> str:
+        return f"{exchange}|{symbol}|{timeframe}"
+
+    def _path(self, key: str) -> str:
+        exchange, symbol, timeframe = key.split("|")
+        # Timeframes are case sensitive (1m vs 1M), so they are kept verbatim in a suffix.
+        return os.path.join(self.cache_dir, exchange, f"{symbol.replace('/', '')}_{timeframe}.npy")
+
+    def covered(self, exchange: str, symbol: str, timeframe: str) -> list:
+        with self._lock:
+            entry = self._index.get(self._key(exchange, symbol, timeframe))
+            return [tuple(i) for i in entry["intervals"]] if entry else []
+
+    def missing(self, exchange: str, symbol: str, timeframe: str, start: int, end: int) -> list:
+        """
+        Returns the [start, end) millisecond ranges that must still be fetched.
+        """
+        return subtract_intervals(start, end, self.covered(exchange, symbol, timeframe))
+
+    def read(self, exchange: str, symbol: str, timeframe: str, start: int, end: int) -> np.ndarray:
+        """
+        Returns the cached candles with start <= timestamp < end.
+        """
+        key = self._key(exchange, symbol, timeframe)
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None or not os.path.exists(self._path(key)):
+                return np.empty(0, dtype=CANDLE_DTYPE)
+            entry["last_access"] = time.time()
+            data = self._valid(np.load(self._path(key), mmap_mode="r"), entry)
+            lo, hi = np.searchsorted(data["timestamp"], [start, end], side="left")
+            return np.array(data[lo:hi])
+
+    @staticmethod
+    def _valid(data: np.ndarray, entry: dict) -> np.ndarray:
+        # Files written before preallocation have no count and are full.
+        return data[:min(entry.get("count", len(data)), len(data))]
+
+    def write(self, exchange: str, symbol: str, timeframe: str, candles: np.ndarray, start: int, end: int) -> None:
+        """
+        Merges `candles` into the cache and marks [start, end) as complete.
+        Callers must only pass closed candles and ranges that were fully fetched.
+        """
+        key = self._key(exchange, symbol, timeframe)
+        path = self._path(key)
+        candles = self._dedupe_sort(candles.astype(CANDLE_DTYPE))
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is not None and os.path.exists(path):
+                count = self._write_existing(path, entry, candles)
+            else:
+                entry = {"intervals": []}
+                count = self._rewrite(path, candles)
+
+            # The index is saved after the candles, so a crash in between only loses the new candles.
+            entry["count"] = count
+            entry["intervals"] = merge_intervals([list(i) for i in entry["intervals"]] + [[start, end]])
+            entry["bytes"] = os.path.getsize(path)
+            entry["last_access"] = time.time()
+            self._index[key] = entry
+            self._evict(keep=key)
+            self._save_index()
+
+    @staticmethod
+    def _dedupe_sort(candles: np.ndarray) -> np.ndarray:
+        # Keeps the newest copy of each timestamp, sorted.
+        _, last_index = np.unique(candles["timestamp"][::-1], return_index=True)
+        return candles[::-1][last_index]
+
+    def _write_existing(self, path: str, entry: dict, candles: np.ndarray) -> int:
+        # Appends in place when all candles are newer than the stored ones and fit, else rewrites.
+        data = np.load(path, mmap_mode="r+")
+        stored = self._valid(data, entry)
+        count = len(stored)
+        if len(candles) == 0:
+            return count
+        if count == 0 or candles["timestamp"][0] > stored["timestamp"][-1]:
+            if count + len(candles) <= len(data):
+                data[count:count + len(candles)] = candles
+                data.flush()
+                return count + len(candles)
+            merged = np.concatenate([stored, candles])
+        else:
+            merged = self._dedupe_sort(np.concatenate([stored, candles]))
+        # The map must be closed before the file is replaced.
+        del data, stored
+        return self._rewrite(path, merged)
+
+    @staticmethod
+    def _rewrite(path: str, candles: np.ndarray) -> int:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        capacity = max(MIN_CAPACITY, int(len(candles) * GROWTH_FACTOR))
+        tmp_path = path + ".tmp.npy"
+        data = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=CANDLE_DTYPE, shape=(capacity,))
+        data[:len(candles)] = candles
+        data.flush()
+        del data
+        os.replace(tmp_path, path)
+        return len(candles)
+
+    def _evict(self, keep: str) -> None:
+        total = sum(entry.get("bytes", 0) for entry in self._index.values())
+        for key in sorted(self._index, key=lambda k: self._index[k].get("last_access", 0)):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._index[key].get("bytes", 0)
+            del self._index[key]
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            logger.info(f"Evicted {key} from the OHLCV cache.")
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return sum(entry.get("bytes", 0) for entry in self._index.values())
+
+class CachedCryptoDataCollector(CryptoDataCollector):
+    """
+    CryptoDataCollector with a read-through OHLCVCache in front of the exchange.
+
+    fetch_by_date and iter_by_date serve whatever the cache covers and fetch only the
+    missing pieces. Closed candles never change, so only those are cached; the still-open
+    candle is always fetched fresh.
+    """
+
+    def __init__(self, cache: OHLCVCache, exchange_names=None, **kwargs):
+        super().__init__(exchange_names=exchange_names, **kwargs)
+        self.cache = cache
+
+    def fetch_by_date(self, exchange_name: str, symbol: str, timeframe: str = '1h', since: str | datetime = None, until: str | datetime = None,
+                      priority: int = RequestScheduler.PRIORITY_BACKFILL) -> pd.DataFrame:
+        """
+        Same contract as CryptoDataCollector.fetch_by_date, served from the cache where possible.
+        """
+        exchange = self.check_exchange(exchange_name)
+        since, until = self._resolve_range(exchange, since, until)
+        closed_until = min(until, self._open_candle_start(exchange, timeframe))
+
+        frames = []
+        for start, end in self.cache.missing(exchange_name, symbol, timeframe, since, until):
+            df = super().fetch_by_date(exchange_name, symbol, timeframe, since=start, until=end, priority=priority)
+            frames.append(df)
+            cacheable_end = min(end, closed_until)
+            if cacheable_end > start:
+                ts = df['timestamp'].to_numpy().astype('datetime64[ms]').astype(np.int64)
+                closed = df[ts < cacheable_end]
+                self.cache.write(exchange_name, symbol, timeframe, self._to_records(closed), start, cacheable_end)
+
+        cached = self.cache.read(exchange_name, symbol, timeframe, since, until)
+        buffer = CandleBuffer(capacity=len(cached) + sum(len(f) for f in frames))
+        buffer.extend(cached["timestamp"], np.stack([cached[field] for field in VALUE_COLUMNS], axis=1))
+        for frame in frames:
+            buffer.extend(frame['timestamp'].to_numpy().astype('datetime64[ms]').astype(np.int64), frame[VALUE_COLUMNS].to_numpy(dtype=float))
+        # Fetched candles are appended last, so they win over cached ones on equal timestamps.
+        buffer.dedupe_sort()
+        logger.info(f"Served {len(cached)} cached and {sum(len(f) for f in frames)} fetched candles for {symbol} on {exchange_name} ({timeframe}).")
+        return buffer.to_frame()
+
+    def iter_by_date(self, exchange_name: str, symbol: str, timeframe: str = '1h', since: str | datetime = None, until: str | datetime = None,
+                     priority: int = RequestScheduler.PRIORITY_BACKFILL) -> Iterator[pd.DataFrame]:
+        """
+        Same contract as CryptoDataCollector.iter_by_date, served from the cache where possible.
+        Cached ranges are yielded in frames of at most page_limit candles. Fetched pages are
+        cached as they arrive, so an interrupted backfill keeps what it already fetched.
+        """
+        exchange = self.check_exchange(exchange_name)
+        since, until = self._resolve_range(exchange, since, until)
+        closed_until = min(until, self._open_candle_start(exchange, timeframe))
+        missing = self.cache.missing(exchange_name, symbol, timeframe, since, until)
+        cached = subtract_intervals(since, until, missing)
+        for start, end in sorted(missing + cached):
+            if (start, end) in missing:
+                yield from self._iter_fetched(exchange_name, symbol, timeframe, start, end, min(end, closed_until), priority)
+                continue
+            records = self.cache.read(exchange_name, symbol, timeframe, start, end)
+            for i in range(0, len(records), self.page_limit):
+                yield self._to_frame(records[i:i + self.page_limit])
+
+    def _iter_fetched(self, exchange_name: str, symbol: str, timeframe: str, start: int, end: int, cacheable_end: int,
+                      priority: int) -> Iterator[pd.DataFrame]:
+        # Pages arrive in time order, so everything from `start` to the end of the latest page is complete.
+        timeframe_ms = self.check_exchange(exchange_name).parse_timeframe(timeframe) * 1000
+        cursor = start
+        for frame in super().iter_by_date(exchange_name, symbol, timeframe, since=start, until=end, priority=priority):
+            ts = frame['timestamp'].to_numpy().astype('datetime64[ms]').astype(np.int64)
+            complete = min(int(ts[-1]) + timeframe_ms, cacheable_end)
+            if complete > cursor:
+                self.cache.write(exchange_name, symbol, timeframe, self._to_records(frame[ts < complete]), cursor, complete)
+                cursor = complete
+            yield frame
+        if cacheable_end > cursor:
+            self.cache.write(exchange_name, symbol, timeframe, np.empty(0, dtype=CANDLE_DTYPE), cursor, cacheable_end)
+
+    @staticmethod
+    def _open_candle_start(exchange, timeframe: str) -> int:
+        # Candles opening before this are closed. bucket_start follows the exchange's calendar
+        # (weeks from Monday, months from the 1st), which the epoch grid does not.
+        now = datetime.fromtimestamp(exchange.milliseconds() / 1000, tz=timezone.utc)
+        return int(bucket_start(now, timeframe).replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+    @staticmethod
+    def _to_frame(records: np.ndarray) -> pd.DataFrame:
+        buffer = CandleBuffer(capacity=len(records))
+        buffer.extend(records["timestamp"], np.stack([records[field] for field in VALUE_COLUMNS], axis=1))
+        return buffer.to_frame()
+
+    def fetch_by_limit(self, exchange_name: str, symbol: str, limit: int, timeframe: str = '1d',
+                       priority: int = RequestScheduler.PRIORITY_REALTIME) -> pd.DataFrame:
+        """
+        Same contract as CryptoDataCollector.fetch_by_limit, served from the cache where possible.
+        """
+        exchange = self.check_exchange(exchange_name)
+        since = exchange.milliseconds() - limit * exchange.parse_timeframe(timeframe) * 1000
+        df = self.fetch_by_date(exchange_name, symbol, timeframe, since=since, until=None, priority=priority)
+        return df.tail(limit).reset_index(drop=True)
+
+    @staticmethod
+    def _to_records(df: pd.DataFrame) -> np.ndarray:
+        records = np.empty(len(df), dtype=CANDLE_DTYPE)
+        records["timestamp"] = df['timestamp'].to_numpy().astype('datetime64[ms]').astype(np.int64)
+        for field in VALUE_COLUMNS:
+            records[field] = df[field].to_numpy(dtype=float)
+        return records
@@ -0,0 +1,239 @@
+# rate_limiter.py
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+
+class TokenBucket:
+    """
+    Thread-safe token bucket used to pace requests against a single exchange.
+
+    Tokens refill continuously at `rate` tokens per second up to `capacity`.
+    Every request consumes `weight` tokens, where one token is one ccxt `rateLimit`
+    interval. Candle requests use weight 1; ccxt's per-endpoint `cost` is not applied.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        """
+        :param rate: Refill rate in tokens per second.
+        :param capacity: Maximum burst size in tokens (defaults to one second of budget).
+        """
+        if rate <= 0:
+            raise ValueError(f"Token bucket rate must be positive, got {rate}")
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity is not None else max(self.rate, 1.0)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_exchange(cls, exchange, capacity: float | None = None) -> "TokenBucket":
+        """
+        Builds a bucket from a ccxt exchange instance.
+        ccxt's `rateLimit` is the number of milliseconds between two weight-1 requests.
+        """
+        rate_limit_ms = getattr(exchange, 'rateLimit', None) or 1000
+        return cls(rate=1000 / rate_limit_ms, capacity=capacity)
+
+    def set_rate(self, rate: float) -> None:
+        """
+        Changes the refill rate, e.g. when an exchange budget is split between more workers.
+        Tokens accrued so far are kept at the old rate.
+        """
+        if rate <= 0:
+            raise ValueError(f"Token bucket rate must be positive, got {rate}")
+        with self._lock:
+            self._refill()
+            self.rate = float(rate)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def wait_time(self, weight: float = 1) -> float:
+        """
+        Returns how many seconds until `weight` tokens are available (0 if they are now).
+        Weights above `capacity` are treated as a full bucket, otherwise they could never run.
+        """
+        with self._lock:
+            self._refill()
+            missing = min(weight, self.capacity) - self._tokens
+            return max(missing, 0.0) / self.rate
+
+    def consume(self, weight: float = 1) -> None:
+        """
+        Takes `weight` tokens unconditionally; the bucket may go into debt.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= weight
+
+    def reserve(self, weight: float = 1) -> float:
+        """
+        Takes `weight` tokens immediately, going into debt if needed, and returns
+        how many seconds the caller must wait before issuing the request.
+        Reserving up front keeps callers in arrival order without a condition variable.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= weight
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, weight: float = 1) -> float:
+        """
+        Blocks until `weight` tokens are available.
+
+        :param weight: Request weight in tokens.
+        :return: Seconds spent waiting.
+        """
+        wait = self.reserve(weight)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class RequestScheduler:
+    """
+    Hands out request slots on one exchange to any number of threads.
+
+    Waiting requests are served by priority (lower value first), then in arrival order,
+    and each grant draws its weight from a shared TokenBucket. This lets many symbols and
+    timeframes share a single exchange budget, with real-time tail fetches jumping ahead
+    of long backfills.
+    """
+
+    PRIORITY_REALTIME = 0
+    PRIORITY_DEFAULT = 5
+    PRIORITY_BACKFILL = 10
+
+    def __init__(self, bucket: TokenBucket):
+        """
+        :param bucket: Token bucket holding the exchange's request budget.
+        """
+        self.bucket = bucket
+        self._queue: list[tuple[int, int]] = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._granted = 0
+        self._granted_weight = 0.0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    @classmethod
+    def from_exchange(cls, exchange, capacity: float | None = None) -> "RequestScheduler":
+        return cls(TokenBucket.from_exchange(exchange, capacity=capacity))
+
+    def acquire(self, weight: float = 1, priority: int = PRIORITY_DEFAULT) -> float:
+        """
+        Blocks until this request is at the head of the queue and the budget allows it.
+
+        :param weight: Request weight in tokens.
+        :param priority: Lower values are served first (see the PRIORITY_* constants).
+        :return: Seconds spent waiting.
+        """
+        enqueued = time.monotonic()
+        with self._cond:
+            entry = (priority, next(self._counter))
+            heapq.heappush(self._queue, entry)
+            # A new head may have arrived; let the current head re-check its place.
+            self._cond.notify_all()
+            while True:
+                if self._queue[0] == entry:
+                    wait = self.bucket.wait_time(weight)
+                    if wait <= 0:
+                        self.bucket.consume(weight)
+                        heapq.heappop(self._queue)
+                        self._cond.notify_all()
+                        break
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait()
+
+            waited = time.monotonic() - enqueued
+            self._record_grant(weight, waited)
+        return waited
+
+    def _record_grant(self, weight: float, waited: float) -> None:
+        # Callers hold self._cond.
+        self._granted += 1
+        self._granted_weight += weight
+        self._total_wait += waited
+        self._max_wait = max(self._max_wait, waited)
+
+    def stats(self) -> dict:
+        """
+        Returns a snapshot of queue depth and wait-time statistics.
+        """
+        with self._cond:
+            waiting_by_priority: dict[int, int] = {}
+            for priority, _ in self._queue:
+                waiting_by_priority[priority] = waiting_by_priority.get(priority, 0) + 1
+            return {
+                "queue_depth": len(self._queue),
+                "waiting_by_priority": waiting_by_priority,
+                "granted": self._granted,
+                "granted_weight": self._granted_weight,
+                "avg_wait_sec": self._total_wait / self._granted if self._granted else 0.0,
+                "max_wait_sec": self._max_wait,
+            }
+
+
+class AsyncRequestScheduler(RequestScheduler):
+    """
+    asyncio flavour of RequestScheduler with the same priorities and statistics.
+    Waiting coroutines park on an asyncio.Condition instead of blocking a thread.
+    The thread lock is only held for short bookkeeping and is never awaited while held,
+    so stats() can still be read from any thread.
+    """
+
+    def __init__(self, bucket: TokenBucket):
+        super().__init__(bucket)
+        self._async_cond = asyncio.Condition()
+
+    async def acquire(self, weight: float = 1, priority: int = RequestScheduler.PRIORITY_DEFAULT) -> float:
+        """
+        Waits until this request is at the head of the queue and the budget allows it.
+
+        :param weight: Request weight in tokens.
+        :param priority: Lower values are served first (see the PRIORITY_* constants).
+        :return: Seconds spent waiting.
+        """
+        enqueued = time.monotonic()
+        async with self._async_cond:
+            with self._cond:
+                entry = (priority, next(self._counter))
+                heapq.heappush(self._queue, entry)
+            self._async_cond.notify_all()
+            try:
+                while True:
+                    if self._queue[0] == entry:
+                        wait = self.bucket.wait_time(weight)
+                        if wait <= 0:
+                            self.bucket.consume(weight)
+                            with self._cond:
+                                heapq.heappop(self._queue)
+                            self._async_cond.notify_all()
+                            break
+                        try:
+                            await asyncio.wait_for(self._async_cond.wait(), wait)
+                        except asyncio.TimeoutError:
+                            pass
+                    else:
+                        await self._async_cond.wait()
+            except asyncio.CancelledError:
+                # Drop the cancelled entry, otherwise it would block the queue forever.
+                with self._cond:
+                    if entry in self._queue:
+                        self._queue.remove(entry)
+                        heapq.heapify(self._queue)
+                self._async_cond.notify_all()
+                raise
+
+        waited = time.monotonic() - enqueued
+        with self._cond:
+            self._record_grant(weight, waited)
+        return waited
@@ -0,0 +1,325 @@
+# retry_policy.py
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable
+import ccxt
+import requests
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+RATE_LIMIT = "rate_limit"
+NETWORK = "network"
+EXCHANGE_DOWN = "exchange_down"
+PERMANENT = "permanent"
+UNKNOWN = "unknown"
+
+# How often callers re-check a half-open breaker while its trial call is in flight.
+HALF_OPEN_POLL_SEC = 0.05
+
+class APIError(Exception):
+    """
+    Error raised by collectors for APIs that report failures in the response body.
+
+    :param error_class: One of RATE_LIMIT, NETWORK, EXCHANGE_DOWN, PERMANENT, UNKNOWN.
+    :param retry_after: Seconds the server asked us to wait, if it said so.
+    """
+
+    def __init__(self, message: str, error_class: str = UNKNOWN, retry_after: float | None = None):
+        super().__init__(message)
+        self.error_class = error_class
+        self.retry_after = retry_after
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised instead of calling an exchange whose circuit breaker is open.
+    """
+
+def classify_error(exc: BaseException) -> str:
+    """
+    Maps a ccxt, requests or APIError exception to an error class.
+    Subclasses are checked before their bases (ccxt's rate limit and outage errors are NetworkErrors).
+    """
+    if isinstance(exc, APIError):
+        return exc.error_class
+    if isinstance(exc, CircuitOpenError):
+        return EXCHANGE_DOWN
+    if isinstance(exc, (ccxt.RateLimitExceeded, ccxt.DDoSProtection)):
+        return RATE_LIMIT
+    if isinstance(exc, ccxt.ExchangeNotAvailable):
+        return EXCHANGE_DOWN
+    if isinstance(exc, ccxt.NetworkError):
+        return NETWORK
+    if isinstance(exc, ccxt.BaseError):
+        # BadSymbol, BadRequest, AuthenticationError, NotSupported, ...: retrying cannot help.
+        return PERMANENT
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        status = exc.response.status_code
+        if status == 429:
+            return RATE_LIMIT
+        if status >= 500:
+            return EXCHANGE_DOWN
+        return PERMANENT
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError)):
+        return NETWORK
+    if isinstance(exc, (ValueError, TypeError, KeyError)):
+        return PERMANENT
+    return UNKNOWN
+
+def parse_retry_after(value) -> float | None:
+    """
+    Parses a Retry-After header value (seconds or an HTTP date) into seconds from now.
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def retry_after_hint(exc: BaseException, headers: dict | None = None) -> float | None:
+    """
+    Returns the wait the server asked for, from the exception or the last response headers.
+    """
+    if getattr(exc, "retry_after", None) is not None:
+        return exc.retry_after
+    response = getattr(exc, "response", None)
+    if response is not None and getattr(response, "headers", None):
+        headers = response.headers
+    if not headers:
+        return None
+    for name, value in headers.items():
+        if name.lower() == "retry-after":
+            return parse_retry_after(value)
+    return None
+
+class CircuitBreaker:
+    """
+    Per-exchange breaker. After `failure_threshold` consecutive transient failures it opens
+    for `reset_timeout` seconds (or for as long as a rate-limit hint asks). Once that time
+    has passed it is half-open: acquire() hands the trial slot to a single caller, and the
+    others keep waiting until the trial succeeds (closing the breaker) or fails (opening
+    it again after a trip, or passing the slot on after a rate-limit pause). A trial that
+    never reports back is given up after `reset_timeout`.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_until = 0.0
+        self.opens = 0
+        # monotonic() start of the half-open trial call in flight, or None.
+        self.trial_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_until == 0.0:
+            return "closed"
+        return "open" if time.monotonic() < self.opened_until else "half_open"
+
+    def remaining(self) -> float:
+        """
+        Seconds until the breaker turns half-open (0 if it is not open).
+        """
+        return max(0.0, self.opened_until - time.monotonic())
+
+    def acquire(self) -> float:
+        """
+        Asks to make a call. Returns 0 when the caller may go ahead (the breaker is closed,
+        or this caller got the half-open trial slot), else the seconds to wait before asking again.
+        """
+        with self._lock:
+            if self.opened_until == 0.0:
+                return 0.0
+            now = time.monotonic()
+            if now < self.opened_until:
+                return self.opened_until - now
+            if self.trial_started is None or now - self.trial_started > self.reset_timeout:
+                self.trial_started = now
+                return 0.0
+            return HALF_OPEN_POLL_SEC
+
+    def release_trial(self) -> None:
+        """
+        Frees the trial slot without judging the exchange, e.g. after a permanent error.
+        """
+        with self._lock:
+            self.trial_started = None
+
+    def open_for(self, seconds: float) -> None:
+        with self._lock:
+            until = time.monotonic() + seconds
+            if until > self.opened_until:
+                if self.remaining() == 0.0:
+                    self.opens += 1
+                self.opened_until = until
+            self.trial_started = None
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_until = 0.0
+            self.trial_started = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            # Failures are only reset by a success, so a failed trial after a trip opens
+            # the breaker again; after a rate-limit pause the next caller gets the slot.
+            self.trial_started = None
+            trip = self.failures >= self.failure_threshold
+        if trip:
+            self.open_for(self.reset_timeout)
+
+class RetryPolicy:
+    """
+    Retries calls according to the class of the error they raise:
+
+    - permanent errors are raised at once;
+    - rate limits wait for the server's Retry-After hint (or the backoff, if longer)
+      and pause the whole exchange through its breaker, so other threads back off too;
+    - network errors and exchange outages back off exponentially with full jitter and
+      count towards the exchange's circuit breaker.
+
+    Counters per key (exchange) are available from stats().
+    """
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 0.5, max_delay: float = 60.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0, max_breaker_wait: float = 30.0):
+        """
+        :param max_attempts: Attempts per call, the first one included.
+        :param base_delay: Backoff before the second attempt; doubles with every attempt.
+        :param max_delay: Upper bound of a single backoff.
+        :param failure_threshold: Consecutive transient failures that open an exchange's breaker.
+        :param reset_timeout: Seconds a tripped breaker stays open.
+        :param max_breaker_wait: Calls wait up to this long for an open breaker, then fail with CircuitOpenError.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_breaker_wait = max_breaker_wait
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._metrics: dict[str, dict] = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def breaker(self, key: str) -> CircuitBreaker:
+        with self._lock:
+            if key not in self._breakers:
+                self._breakers[key] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[key]
+
+    def _count(self, key: str, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self._metrics[key][name] += amount
+
+    def _breaker_wait(self, key: str, waited: float) -> float:
+        # Seconds to wait before asking the breaker again (0: call now), or CircuitOpenError
+        # once the call would have waited more than max_breaker_wait in total.
+        wait = self.breaker(key).acquire()
+        if wait > 0 and waited + wait > self.max_breaker_wait:
+            self._count(key, "rejected")
+            raise CircuitOpenError(f"Circuit for {key} is open for another {wait:.1f}s")
+        return wait
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: spreads the retries of many callers instead of synchronizing them.
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def _on_failure(self, key: str, exc: Exception, attempt: int, max_attempts: int, headers) -> float:
+        """
+        Records a failed attempt and returns the delay before the next one; re-raises when giving up.
+        """
+        error_class = classify_error(exc)
+        self._count(key, f"errors_{error_class}")
+        breaker = self.breaker(key)
+        if error_class in (NETWORK, EXCHANGE_DOWN, UNKNOWN):
+            breaker.record_failure()
+        if error_class == PERMANENT or attempt >= max_attempts:
+            # The caller may hold the half-open trial slot; let the next caller try.
+            breaker.release_trial()
+            self._count(key, "giveups")
+            logger.warning(f"Giving up on {key} after attempt {attempt}/{max_attempts} ({error_class}): {exc}")
+            raise exc
+
+        delay = self._backoff(attempt)
+        if error_class == RATE_LIMIT:
+            hint = retry_after_hint(exc, headers() if headers else None)
+            delay = max(delay, hint or 0.0, self.base_delay)
+            breaker.open_for(delay)
+        self._count(key, "retries")
+        self._count(key, "retry_sleep_sec", delay)
+        logger.warning(f"Attempt {attempt}/{max_attempts} on {key} failed ({error_class}), retrying in {delay:.2f}s: {exc}")
+        return delay
+
+    def call(self, func: Callable[[], Any], key: str = "default", headers: Callable[[], dict] | None = None,
+             max_attempts: int | None = None) -> Any:
+        """
+        Calls `func` until it succeeds, a permanent error occurs or the attempts run out.
+
+        :param key: Breaker and metrics key, usually the exchange id.
+        :param headers: Returns the last response headers, for Retry-After hints (e.g. ccxt's last_response_headers).
+        :param max_attempts: Overrides the policy's attempt count for this call.
+        """
+        max_attempts = max_attempts or self.max_attempts
+        self._count(key, "calls")
+        for attempt in range(1, max_attempts + 1):
+            waited, wait = 0.0, self._breaker_wait(key, 0.0)
+            while wait > 0:
+                time.sleep(wait)
+                waited += wait
+                wait = self._breaker_wait(key, waited)
+            try:
+                result = func()
+            except Exception as e:
+                time.sleep(self._on_failure(key, e, attempt, max_attempts, headers))
+                continue
+            self.breaker(key).record_success()
+            self._count(key, "successes")
+            return result
+
+    async def acall(self, func: Callable[[], Awaitable[Any]], key: str = "default", headers: Callable[[], dict] | None = None,
+                    max_attempts: int | None = None) -> Any:
+        """
+        Coroutine counterpart of call(); waits with asyncio.sleep.
+        """
+        max_attempts = max_attempts or self.max_attempts
+        self._count(key, "calls")
+        for attempt in range(1, max_attempts + 1):
+            waited, wait = 0.0, self._breaker_wait(key, 0.0)
+            while wait > 0:
+                await asyncio.sleep(wait)
+                waited += wait
+                wait = self._breaker_wait(key, waited)
+            try:
+                result = await func()
+            except Exception as e:
+                await asyncio.sleep(self._on_failure(key, e, attempt, max_attempts, headers))
+                continue
+            self.breaker(key).record_success()
+            self._count(key, "successes")
+            return result
+
+    def stats(self) -> dict:
+        """
+        Returns per-key call, success, retry and give-up counts, errors by class,
+        total retry sleep and breaker state.
+        """
+        with self._lock:
+            metrics = {key: dict(values) for key, values in self._metrics.items()}
+            breakers = dict(self._breakers)
+        for key, breaker in breakers.items():
+            metrics.setdefault(key, {}).update({"breaker": breaker.state, "breaker_opens": breaker.opens})
+        return metrics
@@ -0,0 +1,189 @@
+# bucket_storage.py
+import logging
+import numpy as np
+import pandas as pd
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+OHLCV_FIELDS = ["open", "high", "low", "close", "volume"]
+EPOCH = datetime(1970, 1, 1)
+DUPLICATE_KEY = 11000
+
+class BucketConflictError(RuntimeError):
+    """
+    Raised when buckets kept changing under a write for more than `max_retries` attempts.
+    """
+
+def naive_utc(value) -> pd.Timestamp | None:
+    """
+    Normalizes a datetime-like value to a naive UTC Timestamp, which is how pymongo returns dates.
+    """
+    if value is None:
+        return None
+    ts = pd.Timestamp(value)
+    return ts.tz_convert("UTC").tz_localize(None) if ts.tzinfo is not None else ts
+
+class BucketStore:
+    """
+    Packs candles into bucket documents, one per fixed time span, holding parallel arrays:
+
+        {"bucket": <span start>, "first": <datetime>, "last": <datetime>, "count": n, "version": v,
+         "t": [ms, ...], "open": [...], "high": [...], "low": [...], "close": [...], "volume": [...]}
+
+    A span holds `candles_per_bucket` candles (1440 one-minute candles = one day), so a
+    multi-year 1m history is a few thousand documents instead of millions. `version` is
+    bumped by every write, so concurrent writers of one bucket detect each other.
+    """
+
+    def __init__(self, candles_per_bucket: int = 1440, batch_size: int = 500, max_retries: int = 5):
+        """
+        :param candles_per_bucket: Number of candles covered by one bucket document.
+        :param batch_size: Maximum number of bucket documents per bulk_write call.
+        :param max_retries: Times the buckets changed by another writer are re-read and merged again.
+        """
+        self.candles_per_bucket = candles_per_bucket
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+
+    def span_ms(self, timeframe_sec: int) -> int:
+        return timeframe_sec * 1000 * self.candles_per_bucket
+
+    @staticmethod
+    def ensure_indexes(coll) -> None:
+        coll.create_index([("bucket", 1)], unique=True)
+
+    @staticmethod
+    def _to_datetime(ms: int) -> datetime:
+        return EPOCH + timedelta(milliseconds=int(ms))
+
+    def upsert(self, coll, df: pd.DataFrame, timeframe_sec: int) -> int:
+        """
+        Merges candles into their buckets. Existing buckets are read once, merged in pandas
+        (new values win on equal timestamps) and written back with one ReplaceOne each.
+
+        Each replace only matches the bucket version that was read. When another writer
+        changed the bucket in between, the upsert collides with the unique bucket index
+        instead, and the candles of that bucket are merged into the new version and written
+        again, up to `max_retries` times.
+
+        :return: Number of bucket documents written.
+        """
+        if df is None or df.empty:
+            return 0
+        span = self.span_ms(timeframe_sec)
+        frame = pd.DataFrame({
+            "t": pd.to_datetime(df["timestamp"], utc=True).dt.tz_localize(None).to_numpy().astype("datetime64[ms]").astype(np.int64),
+            **{field: df[field].to_numpy(dtype=float) for field in OHLCV_FIELDS},
+        })
+        frame["bucket"] = frame["t"] // span * span
+
+        written = 0
+        for attempt in range(self.max_retries + 1):
+            count, conflicts = self._write_buckets(coll, frame)
+            written += count
+            if not conflicts:
+                break
+            logger.info(f"{len(conflicts)} buckets in collection {coll.name} changed while being written, merging again.")
+            frame = frame[frame["bucket"].isin(conflicts)]
+        else:
+            raise BucketConflictError(f"{len(conflicts)} buckets in collection {coll.name} still conflict after {self.max_retries} retries")
+        logger.info(f"Wrote {written} buckets ({len(df)} candles) in collection {coll.name}.")
+        return written
+
+    def _write_buckets(self, coll, frame: pd.DataFrame) -> tuple[int, set]:
+        # One read-merge-replace pass; returns the number of buckets written and the
+        # (millisecond) buckets another writer changed since they were read.
+        bucket_ids = [self._to_datetime(b) for b in frame["bucket"].unique().tolist()]
+        existing = {doc["bucket"]: doc for doc in coll.find({"bucket": {"$in": bucket_ids}}, {"_id": 0})}
+
+        operations, buckets = [], []
+        for bucket_ms, group in frame.groupby("bucket", sort=True):
+            bucket_id = self._to_datetime(bucket_ms)
+            old = existing.get(bucket_id)
+            # Buckets written before versioning have no version field, which {"version": None} matches.
+            version = old.get("version") if old is not None else None
+            if old is not None:
+                group = pd.concat([pd.DataFrame({k: old[k] for k in ["t"] + OHLCV_FIELDS}), group[["t"] + OHLCV_FIELDS]])
+            group = group.drop_duplicates(subset="t", keep="last").sort_values("t")
+            doc = {
+                "bucket": bucket_id,
+                "first": self._to_datetime(int(group["t"].iloc[0])),
+                "last": self._to_datetime(int(group["t"].iloc[-1])),
+                "count": len(group),
+                "version": (version or 0) + 1,
+                "t": group["t"].tolist(),
+                **{field: group[field].tolist() for field in OHLCV_FIELDS},
+            }
+            operations.append(ReplaceOne({"bucket": bucket_id, "version": version}, doc, upsert=True))
+            buckets.append(bucket_ms)
+
+        written, conflicts = 0, set()
+        for i in range(0, len(operations), self.batch_size):
+            batch = operations[i:i + self.batch_size]
+            try:
+                coll.bulk_write(batch, ordered=False)
+                written += len(batch)
+            except BulkWriteError as bwe:
+                errors = bwe.details.get("writeErrors", [])
+                clashing = {buckets[i + e["index"]] for e in errors if e.get("code") == DUPLICATE_KEY}
+                conflicts |= clashing
+                written += len(batch) - len(errors)
+                if len(clashing) < len(errors):
+                    logger.error("Bulk write error in %s: %s", coll.name, bwe.details)
+        return written, conflicts
+
+    @staticmethod
+    def latest_timestamp(coll) -> datetime | None:
+        doc = coll.find_one(sort=[("bucket", -1)], projection={"last": 1})
+        return doc["last"] if doc else None
+
+    def _range_query(self, timeframe_sec: int, start: pd.Timestamp | None, end: pd.Timestamp | None) -> dict:
+        query = {}
+        if start is not None:
+            span = self.span_ms(timeframe_sec)
+            start_ms = start.value // 1_000_000
+            query.setdefault("bucket", {})["$gte"] = self._to_datetime(start_ms // span * span)
+        if end is not None:
+            query.setdefault("bucket", {})["$lt"] = end.to_pydatetime()
+        return query
+
+    def read_timestamps(self, coll, timeframe_sec: int, start: datetime | None = None, end: datetime | None = None) -> np.ndarray:
+        """
+        Returns the candle timestamps in [start, end) as int64 epoch milliseconds,
+        projecting only the timestamp arrays of the overlapping buckets.
+        """
+        start = naive_utc(start)
+        end = naive_utc(end)
+        docs = coll.find(self._range_query(timeframe_sec, start, end), {"_id": 0, "t": 1}).sort("bucket", 1)
+        arrays = [np.asarray(doc["t"], dtype=np.int64) for doc in docs]
+        timestamps = np.concatenate(arrays) if arrays else np.empty(0, dtype=np.int64)
+        if start is not None:
+            timestamps = timestamps[timestamps >= start.value // 1_000_000]
+        if end is not None:
+            timestamps = timestamps[timestamps < end.value // 1_000_000]
+        return timestamps
+
+    def read(self, coll, timeframe_sec: int, start: datetime | None = None, end: datetime | None = None) -> pd.DataFrame:
+        """
+        Returns the candles in [start, end) by unpacking the overlapping buckets.
+        """
+        start = naive_utc(start)
+        end = naive_utc(end)
+        docs = list(coll.find(self._range_query(timeframe_sec, start, end), {"_id": 0}).sort("bucket", 1))
+
+        if not docs:
+            return pd.DataFrame(columns=["timestamp"] + OHLCV_FIELDS)
+        timestamps = np.concatenate([np.asarray(doc["t"], dtype=np.int64) for doc in docs]).astype("datetime64[ms]")
+        mask = np.ones(len(timestamps), dtype=bool)
+        if start is not None:
+            mask &= timestamps >= start.to_datetime64()
+        if end is not None:
+            mask &= timestamps < end.to_datetime64()
+        return pd.DataFrame({
+            "timestamp": timestamps[mask],
+            **{field: np.concatenate([np.asarray(doc[field], dtype=float) for doc in docs])[mask] for field in OHLCV_FIELDS},
+        })
@@ -1,12 +1,24 @@
 import os
+import glob
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import logging
+from db.bucket_storage import naive_utc
+from data.candle_buffer import rebatch_frames
 
 # Set up logging for the module
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
 class DataExporter:
+    # A partition is compacted into one file once appends have split it into this many files.
+    MAX_FILES_PER_PARTITION = 64
+    # About a month of 1m candles per row group, so range reads skip most of a partition.
+    ROW_GROUP_SIZE = 50_000
+
     @staticmethod
     def save_to_csv(df, name, timeframe, exchange):
         folder = os.path.join("data", exchange, name)
@@ -30,3 +42,98 @@ class DataExporter:
         # Save merged dataframe
         combined_df.to_csv(path, index=False)
         logger.info(f"[✓] Data saved to {path} ({len(combined_df)} total rows)")
+
+    @staticmethod
+    def parquet_folder(name, timeframe, exchange):
+        # Timeframe folders keep their case, since 1m and 1M are different timeframes.
+        return os.path.join("data", exchange, name, timeframe)
+
+    @staticmethod
+    def _part_range(path):
+        # Part files are named part-<first ms>-<last ms>.parquet, so overlaps are found without opening them.
+        first, last = os.path.basename(path)[len("part-"):-len(".parquet")].split("-")
+        return int(first), int(last)
+
+    @staticmethod
+    def _write_part(frame, partition):
+        ms = frame['timestamp'].to_numpy().astype('datetime64[ms]').astype('int64')
+        path = os.path.join(partition, f"part-{ms[0]}-{ms[-1]}.parquet")
+        # The year lives in the directory name only; a year column in the file breaks hive reads.
+        table = pa.Table.from_pandas(frame[COLUMNS], preserve_index=False)
+        pq.write_table(table.cast(table.schema.set(0, pa.field('timestamp', pa.timestamp('ms')))), path,
+                       row_group_size=DataExporter.ROW_GROUP_SIZE)
+        return path
+
+    @staticmethod
+    def save_to_parquet(df, name, timeframe, exchange):
+        """
+        Saves candles as Parquet partitioned by year under data/<exchange>/<name>/<timeframe>/year=YYYY/.
+
+        New candles that do not overlap a stored file are written as a new part file, so
+        appending the latest candles never touches older data. Only a partition whose files
+        overlap the new candles is read back, merged and rewritten.
+
+        :param df: DataFrame with timestamp, open, high, low, close and volume columns.
+        :return: Number of rows written.
+        """
+        if df is None or df.empty:
+            return 0
+        frame = df[COLUMNS].copy()
+        frame['timestamp'] = pd.to_datetime(frame['timestamp'], utc=True).dt.tz_localize(None)
+        frame = frame.drop_duplicates(subset='timestamp', keep='last').sort_values('timestamp')
+        folder = DataExporter.parquet_folder(name, timeframe, exchange)
+
+        for year, group in frame.groupby(frame['timestamp'].dt.year):
+            partition = os.path.join(folder, f"year={year}")
+            os.makedirs(partition, exist_ok=True)
+            parts = sorted(glob.glob(os.path.join(partition, "part-*.parquet")))
+            first = group['timestamp'].iloc[0].value // 1_000_000
+            last = group['timestamp'].iloc[-1].value // 1_000_000
+            overlapping = [p for p in parts if DataExporter._part_range(p)[0] <= last and DataExporter._part_range(p)[1] >= first]
+
+            if not overlapping and len(parts) < DataExporter.MAX_FILES_PER_PARTITION:
+                path = DataExporter._write_part(group, partition)
+                logger.info(f"[✓] Appended {len(group)} rows to {path}")
+                continue
+
+            # Overlap or too many small files: rewrite the whole partition as one file.
+            # Without partitioning=None, pyarrow would add the year=YYYY directory as a column.
+            existing = pd.read_parquet(parts, columns=COLUMNS, partitioning=None) if parts else group.iloc[0:0]
+            combined = pd.concat([existing, group], ignore_index=True)
+            combined = combined.drop_duplicates(subset='timestamp', keep='last').sort_values('timestamp')
+            path = DataExporter._write_part(combined, partition)
+            for part in parts:
+                if part != path:
+                    os.remove(part)
+            logger.info(f"[✓] Rewrote partition {partition} ({len(combined)} total rows)")
+        return len(frame)
+
+    @staticmethod
+    def save_stream_to_parquet(chunks, name, timeframe, exchange, flush_rows=100_000):
+        """
+        Saves candle chunks (e.g. from CryptoDataCollector.iter_by_date) as they arrive,
+        in batches of about `flush_rows` so each batch becomes one appended part file.
+
+        :return: Number of rows written.
+        """
+        return sum(DataExporter.save_to_parquet(frame, name, timeframe, exchange) for frame in rebatch_frames(chunks, flush_rows))
+
+    @staticmethod
+    def read_parquet(name, timeframe, exchange, start=None, end=None):
+        """
+        Reads candles in [start, end) from the Parquet export. Whole years outside the
+        range are skipped by partition, and the timestamp filter is pushed down to the
+        row groups of the remaining files.
+        """
+        folder = DataExporter.parquet_folder(name, timeframe, exchange)
+        if not os.path.isdir(folder):
+            return pd.DataFrame(columns=COLUMNS)
+        filters = []
+        if start is not None:
+            start = naive_utc(start)
+            filters += [('year', '>=', start.year), ('timestamp', '>=', start)]
+        if end is not None:
+            end = naive_utc(end)
+            filters += [('year', '<=', end.year), ('timestamp', '<', end)]
+        df = pd.read_parquet(folder, columns=COLUMNS, filters=filters or None, partitioning='hive')
+        return df.sort_values('timestamp').reset_index(drop=True)
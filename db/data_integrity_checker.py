@@ -1,8 +1,20 @@
 # data_integrity_checker.py
 import logging
-import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta, timezone
 from typing import List, Tuple
+from pymongo.errors import OperationFailure
+from db.refetch_planner import RefetchPlanner
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def _to_ms(ts: datetime) -> int:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return (ts - EPOCH) // timedelta(milliseconds=1)
+
+def _from_ms(ms: int) -> datetime:
+    return EPOCH + timedelta(milliseconds=int(ms))
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -17,75 +29,105 @@ class DataIntegrityChecker:
         self.collector = collector
         self.mongo_handler = mongo_handler
         self.tolerance_sec = tolerance_sec
+        self.planner = RefetchPlanner(collector, mongo_handler)
+
+    def find_gaps(self, exchange: str, symbol: str, timeframe: str,
+                  period_start: datetime, period_end: datetime) -> List[Tuple[datetime, datetime]]:
+        """
+        Returns the missing intervals in [period_start, period_end] as compact (start, end) pairs.
+
+        Gaps between stored candles are found inside MongoDB with $setWindowFields/$shift over
+        the timestamp index (MongoDB 5.0+), so only the gap boundaries cross the wire. Bucketed
+        storage, or a server without window functions, falls back to a NumPy diff over a
+        timestamps-only projection.
+        """
+        # Use the exchange's parse_timeframe to determine expected duration (in seconds)
+        exchange_inst = self.collector.crypto.check_exchange(exchange)
+        threshold_ms = (exchange_inst.parse_timeframe(timeframe) + self.tolerance_sec) * 1000
+        start_ms, end_ms = _to_ms(period_start), _to_ms(period_end)
+
+        coll = self.mongo_handler.get_collection(exchange, symbol, timeframe)
+        bounds = None
+        if self.mongo_handler.storage_mode != "bucket":
+            try:
+                bounds = self._server_side_gaps(coll, period_start, period_end, threshold_ms)
+            except OperationFailure as e:
+                logger.warning(f"Server-side gap detection unavailable for {coll.name}, using NumPy fallback: {e}")
+        if bounds is None:
+            bounds = self._numpy_gaps(exchange, symbol, timeframe, period_start, period_end, threshold_ms)
+        first_ms, last_ms, inner_gaps = bounds
+
+        missing_intervals: List[Tuple[datetime, datetime]] = []
+        # If no data exists, consider the entire period missing.
+        if first_ms is None:
+            return [(period_start, period_end)]
+        # Check for a gap between period_start and the first stored candle.
+        if first_ms - start_ms > threshold_ms:
+            missing_intervals.append((period_start, _from_ms(first_ms - 1)))
+        # Gaps between consecutive stored candles.
+        for current, next_time in inner_gaps:
+            missing_intervals.append((_from_ms(current + 1), _from_ms(next_time - 1)))
+        # Check the gap between the last stored candle and period_end.
+        if end_ms - last_ms > threshold_ms:
+            missing_intervals.append((_from_ms(last_ms + 1), period_end))
+        return missing_intervals
+
+    def _server_side_gaps(self, coll, period_start: datetime, period_end: datetime, threshold_ms: int):
+        time_filter = {"timestamp": {"$gte": period_start, "$lte": period_end}}
+        first = coll.find_one(time_filter, sort=[("timestamp", 1)], projection={"_id": 0, "timestamp": 1})
+        if first is None:
+            return None, None, []
+        last = coll.find_one(time_filter, sort=[("timestamp", -1)], projection={"_id": 0, "timestamp": 1})
+        pipeline = [
+            {"$match": time_filter},
+            {"$project": {"_id": 0, "timestamp": 1}},
+            {"$setWindowFields": {
+                "sortBy": {"timestamp": 1},
+                "output": {"prev": {"$shift": {"output": "$timestamp", "by": -1}}},
+            }},
+            # Date minus date is a number of milliseconds; null for the first candle.
+            {"$match": {"$expr": {"$gt": [{"$subtract": ["$timestamp", "$prev"]}, threshold_ms]}}},
+        ]
+        inner_gaps = [(_to_ms(doc["prev"]), _to_ms(doc["timestamp"])) for doc in coll.aggregate(pipeline, allowDiskUse=True)]
+        return _to_ms(first["timestamp"]), _to_ms(last["timestamp"]), inner_gaps
+
+    def _numpy_gaps(self, exchange: str, symbol: str, timeframe: str,
+                    period_start: datetime, period_end: datetime, threshold_ms: int):
+        timestamps = self.mongo_handler.get_timestamps(exchange, symbol, timeframe, start=period_start,
+                                                       end=period_end + timedelta(milliseconds=1))
+        if len(timestamps) == 0:
+            return None, None, []
+        gap_index = np.flatnonzero(np.diff(timestamps) > threshold_ms)
+        inner_gaps = list(zip(timestamps[gap_index].tolist(), timestamps[gap_index + 1].tolist()))
+        return int(timestamps[0]), int(timestamps[-1]), inner_gaps
 
     def check_and_fetch_missing(self, exchange: str, symbol: str, timeframe: str, 
-                                  period_start: datetime, period_end: datetime) -> None:
+                                  period_start: datetime, period_end: datetime, dry_run: bool = False) -> dict | None:
         """
         Checks for missing candles in the given period for the specified exchange, symbol, and timeframe.
         If gaps are detected (i.e. a gap larger than the expected candle duration plus a tolerance),
-        it fetches the missing candles and upserts them into MongoDB.
+        nearby gaps are coalesced into as few pages as possible (see RefetchPlanner), fetched
+        concurrently and upserted into MongoDB.
         
         :param exchange: Exchange name (e.g. "binance")
         :param symbol: Trading pair symbol (e.g. "BTC/USDT")
         :param timeframe: Candle timeframe (e.g. "1m", "5m", "1h", etc.)
         :param period_start: Start datetime of the period to check (timezone-aware)
         :param period_end: End datetime of the period to check (timezone-aware)
+        :param dry_run: Only report the planned request cost, without fetching anything.
+        :return: The refetch report, or None when nothing is missing.
         """
-        # Get the collection data for this pair/timeframe.
-        coll = self.mongo_handler.get_collection(exchange, symbol, timeframe)
-        stored_docs = list(coll.find({"timestamp": {"$gte": period_start, "$lte": period_end}}).sort("timestamp", 1))
-        
-        # Extract stored timestamps
-        stored_times: List[datetime] = []
-        for doc in stored_docs:
-            ts = doc["timestamp"]
-            if ts.tzinfo is None:
-                ts = ts.replace(tzinfo=timezone.utc)
-            stored_times.append(ts)
-        
-        # Use the exchange's parse_timeframe to determine expected duration (in seconds)
-        exchange_inst = self.collector.crypto.check_exchange(exchange)
-        candle_duration = exchange_inst.parse_timeframe(timeframe)
-        
-        missing_intervals: List[Tuple[datetime, datetime]] = []
-        # If no data exists, consider the entire period missing.
-        if not stored_times:
-            missing_intervals.append((period_start, period_end))
-        else:
-            # Check for a gap between period_start and the first stored candle.
-            first_time = stored_times[0]
-            if (first_time - period_start).total_seconds() > candle_duration + self.tolerance_sec:
-                missing_intervals.append((period_start, first_time - timedelta(milliseconds=1)))
-            # Check gaps between consecutive stored candles.
-            for i in range(len(stored_times) - 1):
-                current = stored_times[i]
-                next_time = stored_times[i + 1]
-                if (next_time - current).total_seconds() > candle_duration + self.tolerance_sec:
-                    missing_intervals.append((current + timedelta(milliseconds=1), next_time - timedelta(milliseconds=1)))
-            # Check the gap between the last stored candle and period_end.
-            last_time = stored_times[-1]
-            if (period_end - last_time).total_seconds() > candle_duration + self.tolerance_sec:
-                missing_intervals.append((last_time + timedelta(milliseconds=1), period_end))
+        missing_intervals = self.find_gaps(exchange, symbol, timeframe, period_start, period_end)
         
-        if missing_intervals:
-            for interval in missing_intervals:
-                start_interval, end_interval = interval
-                logger.info(f"Missing candles detected for {symbol} on {exchange} ({timeframe}) from {start_interval} to {end_interval}. Fetching missing data.")
-                try:
-                    df_missing = self.collector.crypto.fetch_by_date(
-                        exchange_name=exchange,
-                        symbol=symbol,
-                        timeframe=timeframe,
-                        since=start_interval,
-                        until=end_interval
-                    )
-                    records = df_missing.to_dict("records")
-                    for r in records:
-                        if not hasattr(r["timestamp"], "tzinfo") or r["timestamp"].tzinfo is None:
-                            r["timestamp"] = pd.to_datetime(r["timestamp"]).to_pydatetime().replace(tzinfo=timezone.utc)
-                    self.mongo_handler.upsert_ohlcv(records, exchange, symbol, timeframe)
-                    logger.info(f"Upserted {len(records)} missing candles for {symbol} on {exchange} ({timeframe}) from {start_interval} to {end_interval}.")
-                except Exception as e:
-                    logger.error(f"Error fetching missing candles for {symbol} on {exchange} ({timeframe}) from {start_interval} to {end_interval}: {e}")
-        else:
+        if not missing_intervals:
             logger.info(f"No missing candles detected for {symbol} on {exchange} ({timeframe}) between {period_start} and {period_end}.")
+            return None
+
+        for start_interval, end_interval in missing_intervals:
+            logger.info(f"Missing candles detected for {symbol} on {exchange} ({timeframe}) from {start_interval} to {end_interval}.")
+        plan = self.planner.plan(exchange, timeframe, missing_intervals)
+        try:
+            return self.planner.execute(symbol, plan, dry_run=dry_run)
+        except Exception as e:
+            logger.error(f"Error fetching missing candles for {symbol} on {exchange} ({timeframe}) between {period_start} and {period_end}: {e}")
+            return plan["report"]
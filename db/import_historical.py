@@ -1,48 +1,224 @@
 # import_historical.py (updated)
-import pandas as pd
-from datetime import datetime, timedelta
 import logging
+import os
+import socket
+import uuid
+import numpy as np
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pymongo import ReturnDocument, UpdateOne
+from data.candle_buffer import rebatch_frames
+from data.crypto_data_collector import to_milliseconds
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-def import_full_historical(collector, mongo_handler, crypto_tests, periods) -> None:
+class LeaseLostError(RuntimeError):
     """
-    For each crypto test case and period, check the latest candle in MongoDB and
-    fetch only data newer than that timestamp. Convert the data to dictionaries and
-    upsert them into the corresponding collection.
+    Raised when another worker took over a chunk whose lease expired.
     """
-    for test in crypto_tests:
-        exchange = test["exchange"]
-        symbol = test["symbol"]
-        timeframe = test["timeframe"]
-        for period_label, period_since, period_until in periods:
-            try:
-                # Check the DB for the latest timestamp in this collection.
-                latest = mongo_handler.get_latest_timestamp(exchange, symbol, timeframe)
+
+class HistoricalImporter:
+    """
+    Imports historical candles as a resumable job.
+
+    Every (pair, period) range is split into chunks of `chunk_candles` candles aligned to
+    a fixed grid, and each chunk has a checkpoint document in Mongo:
+
+        {"_id": "<exchange>|<symbol>|<timeframe>|<period>|<grid start>", "start": ms, "end": ms,
+         "resume_from": ms, "status": "pending" | "running" | "done" | "failed",
+         "owner": <worker id>, "lease_until": datetime,
+         "attempts": n, "candles": n, "error": str, "updated_at": datetime}
+
+    resume_from advances after every written batch, so a restarted job continues exactly
+    where it stopped. Chunks run on one worker pool per exchange. Workers claim chunks
+    atomically and hold them under a lease renewed with every written batch, so several
+    importers (or a restart next to a live one) never run the same chunk, and the
+    running chunks of a crashed importer are taken over once their lease expired.
+    """
+
+    def __init__(self, collector, mongo_handler, chunk_candles: int = 100000, workers_per_exchange: int | dict = 2,
+                 max_attempts: int = 3, flush_rows: int = 50000, checkpoint_collection: str = "import_checkpoints",
+                 lease_seconds: float = 600.0, worker_id: str | None = None):
+        """
+        :param collector: Instance of MarketDataCollector.
+        :param mongo_handler: Instance of MongoDBHandler.
+        :param chunk_candles: Number of candles per chunk.
+        :param workers_per_exchange: Concurrent chunks per exchange, as one number or a dict by exchange name.
+        :param max_attempts: Failed chunks are retried on later runs until they failed this many times.
+        :param flush_rows: Candles written (and checkpointed) per batch.
+        :param checkpoint_collection: Name of the collection holding the checkpoints.
+        :param lease_seconds: Seconds a claimed chunk stays owned without a written batch; must
+            exceed the time it takes to fetch and write `flush_rows` candles.
+        :param worker_id: Unique name of this importer (defaults to host-pid-random).
+        """
+        self.collector = collector
+        self.mongo_handler = mongo_handler
+        self.chunk_candles = chunk_candles
+        self.workers_per_exchange = workers_per_exchange
+        self.max_attempts = max_attempts
+        self.flush_rows = flush_rows
+        self.lease_seconds = lease_seconds
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.checkpoints = mongo_handler.db[checkpoint_collection]
+        self.checkpoints.create_index([("exchange", 1), ("symbol", 1), ("timeframe", 1), ("status", 1)])
+
+    def _workers(self, exchange: str) -> int:
+        if isinstance(self.workers_per_exchange, dict):
+            return self.workers_per_exchange.get(exchange, 1)
+        return self.workers_per_exchange
+
+    def plan(self, crypto_tests, periods) -> int:
+        """
+        Creates the checkpoints of every chunk not stored yet. Existing checkpoints are
+        left untouched, so planning again after a restart keeps their progress.
+        Ranges before the latest stored candle are skipped, as the previous importer did.
+
+        :return: Number of newly created chunks.
+        """
+        operations = []
+        for test in crypto_tests:
+            exchange, symbol, timeframe = test["exchange"], test["symbol"], test["timeframe"]
+            timeframe_ms = self.collector.crypto.check_exchange(exchange).parse_timeframe(timeframe) * 1000
+            chunk_ms = self.chunk_candles * timeframe_ms
+            latest = self.mongo_handler.get_latest_timestamp(exchange, symbol, timeframe)
+            for period_label, period_since, period_until in periods:
+                since, until = to_milliseconds(period_since), to_milliseconds(period_until)
                 if latest is not None:
-                    # If the latest is within the period, adjust 'since' accordingly.
-                    # If the latest is after the period, skip this period.
-                    if latest >= period_until:
-                        continue
-                    adjusted_since = latest + timedelta(milliseconds=1)
-                else:
-                    adjusted_since = period_since
-                    logger.info(f"Importing {symbol} on {exchange} ({timeframe}) from {adjusted_since} for period {period_label} (no existing data).")
-                
-                df = collector.crypto.fetch_by_date(
-                    exchange_name=exchange,
-                    symbol=symbol,
-                    timeframe=timeframe,
-                    since=adjusted_since,
-                    until=period_until
-                )
-                records = df.to_dict("records")
-                # Ensure each record's timestamp is a Python datetime object.
-                for r in records:
-                    if not isinstance(r["timestamp"], datetime):
-                        r["timestamp"] = pd.to_datetime(r["timestamp"]).to_pydatetime()
-                mongo_handler.upsert_ohlcv(records, exchange, symbol, timeframe)
-                logger.info(f"Imported {len(records)} candles for {symbol} ({period_label}).")
-            except Exception as e:
-                logger.error(f"Error importing historical data for {symbol} on {exchange} for period {period_label}: {e}")
+                    since = max(since, to_milliseconds(latest) + timeframe_ms)
+                for grid_start in range(since // chunk_ms * chunk_ms, until, chunk_ms):
+                    start, end = max(grid_start, since), min(grid_start + chunk_ms, until)
+                    chunk = {"exchange": exchange, "symbol": symbol, "timeframe": timeframe, "period": period_label,
+                             "start": start, "end": end, "resume_from": start, "status": "pending",
+                             "attempts": 0, "candles": 0, "error": None}
+                    chunk_id = f"{exchange}|{symbol}|{timeframe}|{period_label}|{grid_start}"
+                    operations.append(UpdateOne({"_id": chunk_id}, {"$setOnInsert": chunk}, upsert=True))
+        if not operations:
+            return 0
+        created = self.checkpoints.bulk_write(operations, ordered=False).upserted_count
+        logger.info(f"Planned {created} new import chunks ({len(operations)} in total).")
+        return created
+
+    def _lease_until(self) -> datetime:
+        return datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds)
+
+    def _claim(self, pairs: list, skip: list) -> dict | None:
+        """
+        Atomically takes the oldest runnable chunk of `pairs`: pending or failed fewer than
+        max_attempts times, else one running under an expired lease (a crashed importer).
+        Chunks in `skip` (already tried by this run) are left for later runs.
+
+        Taking over counts as an attempt, since the chunk itself may have crashed its
+        importer (e.g. out of memory); otherwise such a chunk would be re-claimed forever.
+        """
+        now = datetime.now(timezone.utc)
+        runnable = [{"$or": pairs}, {"_id": {"$nin": skip}, "attempts": {"$lt": self.max_attempts}}]
+        claim = {"$set": {"status": "running", "owner": self.worker_id, "lease_until": self._lease_until(), "updated_at": now}}
+        chunk = self.checkpoints.find_one_and_update(
+            {"$and": runnable + [{"status": {"$in": ["pending", "failed"]}}]},
+            claim,
+            sort=[("start", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if chunk is not None:
+            return chunk
+        return self.checkpoints.find_one_and_update(
+            # A missing lease_until (checkpoints of older importers) counts as expired.
+            {"$and": runnable + [{"status": "running", "$or": [{"lease_until": {"$lt": now}}, {"lease_until": None}]}]},
+            dict(claim, **{"$inc": {"attempts": 1}}),
+            sort=[("start", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _checkpoint(self, chunk: dict, update: dict) -> None:
+        # Only the lease owner may move a chunk on; anyone else lost it to a takeover.
+        result = self.checkpoints.update_one({"_id": chunk["_id"], "owner": self.worker_id}, update)
+        if result.matched_count == 0:
+            raise LeaseLostError(f"Chunk {chunk['_id']} was taken over by another importer")
+
+    def _run_chunk(self, chunk: dict) -> int:
+        exchange, symbol, timeframe = chunk["exchange"], chunk["symbol"], chunk["timeframe"]
+        written = 0
+        try:
+            chunks = self.collector.crypto.iter_by_date(exchange_name=exchange, symbol=symbol, timeframe=timeframe,
+                                                        since=chunk["resume_from"], until=chunk["end"])
+            for frame in rebatch_frames(chunks, self.flush_rows):
+                self.mongo_handler.upsert_frame(frame, exchange, symbol, timeframe)
+                written += len(frame)
+                resume_from = int(frame["timestamp"].to_numpy()[-1].astype("datetime64[ms]").astype(np.int64)) + 1
+                self._checkpoint(chunk, {
+                    "$set": {"resume_from": resume_from, "lease_until": self._lease_until(),
+                             "updated_at": datetime.now(timezone.utc)},
+                    "$inc": {"candles": len(frame)},
+                })
+            self._checkpoint(chunk, {"$set": {
+                "status": "done", "resume_from": chunk["end"], "error": None, "owner": None,
+                "updated_at": datetime.now(timezone.utc)}})
+            logger.info(f"Imported chunk {chunk['_id']}: {written} candles.")
+        except LeaseLostError as e:
+            logger.warning(f"Stopped chunk {chunk['_id']} after {written} candles: {e}")
+        except Exception as e:
+            try:
+                self._checkpoint(chunk, {
+                    "$set": {"status": "failed", "error": str(e), "owner": None, "updated_at": datetime.now(timezone.utc)},
+                    "$inc": {"attempts": 1},
+                })
+            except LeaseLostError:
+                pass
+            logger.error(f"Error importing chunk {chunk['_id']} after {written} candles: {e}")
+        return written
+
+    def _work(self, pairs: list, claimed: list) -> int:
+        # One worker of an exchange pool: claims and runs chunks until none is left.
+        written = 0
+        while True:
+            chunk = self._claim(pairs, claimed)
+            if chunk is None:
+                return written
+            claimed.append(chunk["_id"])
+            written += self._run_chunk(chunk)
+
+    def run(self, crypto_tests, periods) -> dict:
+        """
+        Plans the chunks, then runs every unfinished one (pending, interrupted while
+        running with an expired lease, or failed fewer than max_attempts times) on the
+        per-exchange pools. Chunks are claimed one at a time, so importers started
+        side by side split the work between them.
+
+        :return: Number of chunks run, done and failed, and candles written.
+        """
+        self.plan(crypto_tests, periods)
+        by_exchange = defaultdict(list)
+        for t in crypto_tests:
+            by_exchange[t["exchange"]].append({"exchange": t["exchange"], "symbol": t["symbol"], "timeframe": t["timeframe"]})
+        if not by_exchange:
+            return {"chunks": 0, "done": 0, "failed": 0, "candles": 0}
+        logger.info(f"Importing chunks on {len(by_exchange)} exchange(s) as {self.worker_id}.")
+
+        # Chunk ids this run claimed, shared by the workers of an exchange (list.append is atomic).
+        claimed = {exchange: [] for exchange in by_exchange}
+        pools = {exchange: ThreadPoolExecutor(max_workers=max(1, self._workers(exchange))) for exchange in by_exchange}
+        try:
+            futures = [pools[exchange].submit(self._work, pairs, claimed[exchange])
+                       for exchange, pairs in by_exchange.items() for _ in range(max(1, self._workers(exchange)))]
+            candles = sum(f.result() for f in futures)
+        finally:
+            for pool in pools.values():
+                pool.shutdown()
+
+        run_ids = [chunk_id for ids in claimed.values() for chunk_id in ids]
+        done = self.checkpoints.count_documents({"_id": {"$in": run_ids}, "status": "done"})
+        summary = {"chunks": len(run_ids), "done": done, "failed": len(run_ids) - done, "candles": candles}
+        logger.info(f"Historical import finished: {summary}")
+        return summary
+
+def import_full_historical(collector, mongo_handler, crypto_tests, periods) -> dict:
+    """
+    For each crypto test case and period, fetch the data newer than the latest stored
+    candle and stream it into the corresponding collection.
+
+    Runs as a checkpointed HistoricalImporter job, so an interrupted import resumes
+    where it stopped on the next call.
+    """
+    return HistoricalImporter(collector, mongo_handler).run(crypto_tests, periods)
@@ -0,0 +1,181 @@
+# lease_coordinator.py
+import logging
+import math
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from pymongo import ReturnDocument, UpdateOne
+from db.real_time_updater import RealTimeScheduler
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+class LeaseCoordinator:
+    """
+    Shares (exchange, symbol, timeframe) pairs between worker processes, on one host or
+    several, through lease documents in Mongo:
+
+        {"_id": "<exchange>|<symbol>|<timeframe>", "exchange": ..., "symbol": ..., "timeframe": ...,
+         "owner": <worker id> | None, "expires_at": datetime}
+
+    Every worker also keeps a heartbeat document in "<collection>_workers". On each
+    heartbeat a worker renews its leases, gives back pairs above its fair share
+    (pairs / live workers) and takes over free or expired leases up to that share, so
+    pairs of a dead worker move to the others once its leases expire, and a new worker
+    gets its share within a heartbeat or two. A worker only counts and claims the pairs
+    it registered, so leases of other configs in the same collection are left alone.
+    Hosts must agree on the time to well within `lease_ttl`.
+    """
+
+    def __init__(self, mongo_handler, worker_id: str | None = None, lease_ttl: float = 30.0,
+                 heartbeat_interval: float = 10.0, collection: str = "pair_leases"):
+        """
+        :param mongo_handler: Instance of MongoDBHandler.
+        :param worker_id: Unique name of this worker (defaults to host-pid-random).
+        :param lease_ttl: Seconds a lease stays valid without renewal.
+        :param heartbeat_interval: Seconds between two heartbeats; must be well below lease_ttl.
+        :param collection: Name of the lease collection.
+        """
+        if heartbeat_interval >= lease_ttl:
+            raise ValueError(f"heartbeat_interval ({heartbeat_interval}) must be shorter than lease_ttl ({lease_ttl})")
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.lease_ttl = lease_ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.leases = mongo_handler.db[collection]
+        self.workers = mongo_handler.db[f"{collection}_workers"]
+        self.leases.create_index([("owner", 1)])
+        self.leases.create_index([("expires_at", 1)])
+        self.owned: set[tuple[str, str, str]] = set()
+        # Lease ids of the registered pairs, the only ones this worker counts and claims.
+        self.pair_ids: list[str] = []
+        self.live_workers = 1
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _pair(doc: dict) -> tuple[str, str, str]:
+        return doc["exchange"], doc["symbol"], doc["timeframe"]
+
+    def register(self, pairs) -> int:
+        """
+        Creates a free lease for every pair that has none yet.
+
+        :param pairs: Iterable of (exchange, symbol, timeframe) tuples.
+        :return: Number of newly registered pairs.
+        """
+        pairs = list(pairs)
+        operations = [UpdateOne({"_id": "|".join(pair)}, {"$setOnInsert": {
+            "exchange": pair[0], "symbol": pair[1], "timeframe": pair[2], "owner": None, "expires_at": EPOCH}}, upsert=True)
+            for pair in pairs]
+        if not operations:
+            return 0
+        self.pair_ids = sorted(set(self.pair_ids) | {"|".join(pair) for pair in pairs})
+        return self.leases.bulk_write(operations, ordered=False).upserted_count
+
+    def heartbeat(self) -> tuple[set, set]:
+        """
+        Renews this worker's leases and rebalances them to its fair share.
+
+        :return: Pairs gained and pairs lost since the previous heartbeat.
+        """
+        now = datetime.now(timezone.utc)
+        expires = now + timedelta(seconds=self.lease_ttl)
+        self.workers.update_one({"_id": self.worker_id}, {"$set": {"heartbeat_at": now, "expires_at": expires}}, upsert=True)
+        self.live_workers = max(1, self.workers.count_documents({"expires_at": {"$gt": now}}))
+
+        # Leases that expired and were taken over by another worker are not renewed.
+        self.leases.update_many({"owner": self.worker_id}, {"$set": {"expires_at": expires}})
+        owned = {self._pair(doc) for doc in self.leases.find({"owner": self.worker_id}, {"exchange": 1, "symbol": 1, "timeframe": 1})}
+        share = math.ceil(self.leases.count_documents({"_id": {"$in": self.pair_ids}}) / self.live_workers)
+
+        for pair in sorted(owned)[share:]:
+            self.leases.update_one({"_id": "|".join(pair), "owner": self.worker_id}, {"$set": {"owner": None, "expires_at": EPOCH}})
+            owned.discard(pair)
+        while len(owned) < share:
+            # Longest-expired first, so pairs left by a dead worker are picked up in the order they lapsed.
+            doc = self.leases.find_one_and_update(
+                {"_id": {"$in": self.pair_ids}, "expires_at": {"$lte": now}},
+                {"$set": {"owner": self.worker_id, "expires_at": expires}},
+                sort=[("expires_at", 1)],
+                return_document=ReturnDocument.AFTER,
+            )
+            if doc is None:
+                break
+            owned.add(self._pair(doc))
+
+        added, removed = owned - self.owned, self.owned - owned
+        self.owned = owned
+        if added or removed:
+            logger.info(f"Worker {self.worker_id} now holds {len(owned)} pairs (+{len(added)}, -{len(removed)}, "
+                        f"{self.live_workers} live workers).")
+        return added, removed
+
+    def release_all(self) -> None:
+        """
+        Frees every lease of this worker so the others can take them over immediately.
+        """
+        self.leases.update_many({"owner": self.worker_id}, {"$set": {"owner": None, "expires_at": EPOCH}})
+        self.workers.delete_one({"_id": self.worker_id})
+        self.owned = set()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run(self, on_change) -> None:
+        """
+        Heartbeats every heartbeat_interval seconds until stop() is called, then releases all leases.
+
+        :param on_change: Called as on_change(added, removed) after every successful heartbeat.
+        """
+        try:
+            while not self._stop.is_set():
+                try:
+                    on_change(*self.heartbeat())
+                except Exception as e:
+                    logger.error(f"Lease heartbeat failed for worker {self.worker_id}: {e}")
+                self._stop.wait(self.heartbeat_interval)
+        finally:
+            self.release_all()
+
+def sharded_real_time_updater(collector, mongo_handler, crypto_tests, worker_id: str | None = None,
+                              settle_delay: float = 2.0, max_workers: int = 8,
+                              lease_ttl: float = 30.0, heartbeat_interval: float = 10.0, ring_store=None) -> None:
+    """
+    Runs the real-time updater on this worker's share of `crypto_tests`.
+
+    Start the same call in any number of processes or hosts against the same database;
+    pairs are spread through LeaseCoordinator leases. Each exchange's request budget
+    is split evenly between the live workers, so adding workers adds pair capacity
+    without exceeding the exchange limits.
+
+    :param crypto_tests: List of test cases (each a dict with keys: "exchange", "symbol", "timeframe").
+    :param worker_id: Unique name of this worker (defaults to host-pid-random).
+    :param ring_store: Writer-side CandleRingStore kept current for this worker's pairs.
+    """
+    coordinator = LeaseCoordinator(mongo_handler, worker_id=worker_id, lease_ttl=lease_ttl, heartbeat_interval=heartbeat_interval)
+    coordinator.register((test["exchange"], test["symbol"], test["timeframe"]) for test in crypto_tests)
+    scheduler = RealTimeScheduler(collector, mongo_handler, [], settle_delay=settle_delay, max_workers=max_workers,
+                                  ring_store=ring_store)
+    # Exchanges are created on first use, so their full rates are recorded as they appear.
+    base_rates = {}
+
+    def on_change(added, removed):
+        for pair in removed:
+            scheduler.remove_pair(pair)
+        for pair in added:
+            scheduler.add_pair(pair)
+        for name, exchange_scheduler in list(collector.crypto.schedulers.items()):
+            rate = base_rates.setdefault(name, exchange_scheduler.bucket.rate)
+            exchange_scheduler.bucket.set_rate(rate / coordinator.live_workers)
+
+    heartbeat = threading.Thread(target=coordinator.run, args=(on_change,), name=f"lease-{coordinator.worker_id}", daemon=True)
+    heartbeat.start()
+    try:
+        scheduler.run()
+    finally:
+        scheduler.stop()
+        coordinator.stop()
+        heartbeat.join()
@@ -1,20 +1,59 @@
 # mongo_storage.py
+import os
+import threading
 import pymongo
 import logging
+import numpy as np
+import pandas as pd
+from ccxt import Exchange
 from pymongo import UpdateOne
 from pymongo.errors import BulkWriteError
-from datetime import datetime
-from typing import List, Dict, Any
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from db.bucket_storage import BucketStore
+from data.candle_buffer import rebatch_frames
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+STORAGE_MODES = ("document", "bucket", "timeseries")
+# One document per candle collection: {"_id": name, "version": n, "writes": [{"first", "last"}, ...]},
+# the last WRITE_LOG_SIZE written ranges, newest last. Lets readers in other processes (CandleQueryService)
+# invalidate caches. Kept only by handlers with version_log on (or MONGODB_VERSION_LOG=1), at one extra
+# update_one round trip per write call (not per batch or flush) on a document of WRITE_LOG_SIZE entries.
+VERSIONS_COLLECTION = "collection_versions"
+WRITE_LOG_SIZE = 64
+
 class MongoDBHandler:
-    def __init__(self, uri: str = "mongodb://localhost:27017", db_name: str = "algo_trade"):
+    def __init__(self, uri: str = "mongodb://localhost:27017", db_name: str = "algo_trade",
+                 storage_mode: str = "document", candles_per_bucket: int = 1440, version_log: bool | None = None):
+        """
+        :param uri: MongoDB connection string (falls back to MONGODB_URI when None).
+        :param db_name: Database holding one collection per exchange/symbol/timeframe.
+        :param storage_mode: "document" stores one document per candle, "bucket" packs
+            `candles_per_bucket` candles into array documents (see BucketStore), and
+            "timeseries" uses MongoDB native time-series collections (MongoDB 7.0+ for
+            rewriting overlapping ranges). The mode applies to the whole database.
+        :param candles_per_bucket: Bucket size for the "bucket" mode.
+        :param version_log: Log every write in VERSIONS_COLLECTION, which a CandleQueryService
+            in another process needs to notice it. Off unless MONGODB_VERSION_LOG=1 when None.
+        """
+        if storage_mode not in STORAGE_MODES:
+            raise ValueError(f"Unknown storage mode '{storage_mode}', expected one of {STORAGE_MODES}")
         if uri is None:
             uri = os.environ.get("MONGODB_URI", "mongodb://localhost:27017/algo_trade")
         self.client = pymongo.MongoClient(uri)
         self.db = self.client[db_name]
+        self.storage_mode = storage_mode
+        if version_log is None:
+            version_log = os.environ.get("MONGODB_VERSION_LOG", "0").lower() in ("1", "true", "yes")
+        self.version_log = version_log
+        self.bucket_store = BucketStore(candles_per_bucket) if storage_mode == "bucket" else None
+        # Collections whose indexes were already ensured by this process.
+        self._collections: Dict[str, Any] = {}
+        self._collections_lock = threading.Lock()
+        self._write_listeners: List[Callable[[str, datetime | None, datetime | None], None]] = []
     
     def _collection_name(self, exchange: str, symbol: str, timeframe: str) -> str:
         # Normalize values: lowercase, remove '/' from symbol
@@ -26,14 +65,90 @@ class MongoDBHandler:
     def get_collection(self, exchange: str, symbol: str, timeframe: str):
         """
         Returns the collection for the specified exchange, symbol, and timeframe.
-        Creates a unique index on the timestamp field.
+        Creates a unique index on the timestamp field (on the bucket start in bucket mode,
+        or a native time-series collection in timeseries mode).
+        Indexes are ensured once per process; later calls are served from a registry
+        without any server round trip.
         """
         collection_name = self._collection_name(exchange, symbol, timeframe)
+        coll = self._collections.get(collection_name)
+        if coll is not None:
+            return coll
+        with self._collections_lock:
+            coll = self._collections.get(collection_name)
+            if coll is None:
+                coll = self._ensure_collection(collection_name, timeframe)
+                self._collections[collection_name] = coll
+        return coll
+
+    def _ensure_collection(self, collection_name: str, timeframe: str):
+        if self.storage_mode == "timeseries":
+            if collection_name not in self.db.list_collection_names():
+                granularity = "minutes" if Exchange.parse_timeframe(timeframe) < 3600 else "hours"
+                self.db.create_collection(collection_name, timeseries={"timeField": "timestamp", "granularity": granularity})
+            return self.db[collection_name]
         coll = self.db[collection_name]
-        # Create a unique index on timestamp
-        coll.create_index([("timestamp", 1)], unique=True)
+        if self.storage_mode == "bucket":
+            BucketStore.ensure_indexes(coll)
+        else:
+            # Create a unique index on timestamp
+            coll.create_index([("timestamp", 1)], unique=True)
         return coll
 
+    def invalidate_collection(self, exchange: str, symbol: str, timeframe: str) -> None:
+        """
+        Forgets a registered collection so the next get_collection ensures its indexes again.
+        Call this after dropping or recreating a collection outside this handler.
+        """
+        with self._collections_lock:
+            self._collections.pop(self._collection_name(exchange, symbol, timeframe), None)
+
+    def drop_collection(self, exchange: str, symbol: str, timeframe: str) -> None:
+        """
+        Drops the collection and removes it from the registry.
+        """
+        self.db.drop_collection(self._collection_name(exchange, symbol, timeframe))
+        self.invalidate_collection(exchange, symbol, timeframe)
+        self._record_write(self._collection_name(exchange, symbol, timeframe), None, None)
+
+    def add_write_listener(self, callback: Callable[[str, datetime | None, datetime | None], None]) -> None:
+        """
+        Registers a callback run after every write of this handler, as
+        callback(collection_name, first, last) with the naive UTC bounds of the written
+        candles (both None when the whole collection changed).
+        """
+        self._write_listeners.append(callback)
+
+    @property
+    def _tracks_writes(self) -> bool:
+        return self.version_log or bool(self._write_listeners)
+
+    def _record_write(self, collection_name: str, first: datetime | None, last: datetime | None) -> None:
+        # Bumps the collection version and logs the written range (if enabled), then notifies local listeners.
+        if self.version_log:
+            self.db[VERSIONS_COLLECTION].update_one(
+                {"_id": collection_name},
+                {"$inc": {"version": 1}, "$push": {"writes": {"$each": [{"first": first, "last": last}], "$slice": -WRITE_LOG_SIZE}}},
+                upsert=True,
+            )
+        for callback in self._write_listeners:
+            callback(collection_name, first, last)
+
+    @staticmethod
+    def _frame_bounds(df: pd.DataFrame) -> tuple[datetime, datetime]:
+        timestamps = pd.to_datetime(df["timestamp"], utc=True).dt.tz_localize(None)
+        return timestamps.min().to_pydatetime(), timestamps.max().to_pydatetime()
+
+    def _record_frame_write(self, collection_name: str, df: pd.DataFrame) -> None:
+        if self._tracks_writes:
+            self._record_write(collection_name, *self._frame_bounds(df))
+
+    def get_collection_versions(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns the version document of every written collection in one round trip.
+        """
+        return {doc["_id"]: doc for doc in self.db[VERSIONS_COLLECTION].find()}
+
     def upsert_ohlcv(self, data: List[Dict[str, Any]], exchange: str, symbol: str, timeframe: str) -> None:
         """
         Upsert a list of OHLCV documents into the specific MongoDB collection.
@@ -41,6 +156,9 @@ class MongoDBHandler:
         """
         if not data:
             return
+        if self.storage_mode != "document":
+            self.upsert_frame(pd.DataFrame(data), exchange, symbol, timeframe)
+            return
         
         collection = self.get_collection(exchange, symbol, timeframe)
         operations = []
@@ -54,6 +172,146 @@ class MongoDBHandler:
             logger.info(f"Upserted {result.upserted_count} documents, modified {result.modified_count} in collection {collection.name}.")
         except BulkWriteError as bwe:
             logger.error("Bulk write error in %s: %s", collection.name, bwe.details)
+        if self._tracks_writes:
+            timestamps = [pd.Timestamp(doc["timestamp"]) for doc in data]
+            first, last = (ts.tz_convert("UTC").tz_localize(None) if ts.tzinfo else ts for ts in (min(timestamps), max(timestamps)))
+            self._record_write(collection.name, first.to_pydatetime(), last.to_pydatetime())
+
+    @staticmethod
+    def frame_to_documents(df: pd.DataFrame) -> List[Dict[str, Any]]:
+        """
+        Converts a candle DataFrame to Mongo documents column by column.
+        Timestamps become naive UTC datetimes (what pymongo stores) in one vectorized cast,
+        instead of a per-row pd.to_datetime call.
+        """
+        timestamps = pd.to_datetime(df["timestamp"], utc=True).dt.tz_localize(None)
+        columns = [c for c in df.columns if c != "timestamp"]
+        times = timestamps.to_numpy().astype("datetime64[ms]").tolist()
+        values = df[columns].to_numpy().tolist()
+        keys = ["timestamp"] + columns
+        return [dict(zip(keys, [ts] + row)) for ts, row in zip(times, values)]
+
+    def upsert_frame(self, df: pd.DataFrame, exchange: str, symbol: str, timeframe: str,
+                     batch_size: int = 5000, max_workers: int = 1) -> Dict[str, int]:
+        """
+        Writes a candle DataFrame with as few server-side updates as possible.
+
+        Candles newer than the latest stored one (or older than the earliest) cannot collide,
+        so they go through insert_many. Only candles inside the stored range are upserted.
+        Both are sent in batches of at most `batch_size`, optionally from several threads.
+
+        The whole call is logged as one write in collection_versions.
+
+        :param df: DataFrame with a timestamp column plus OHLCV columns.
+        :param batch_size: Maximum number of documents per insert/bulk_write call.
+        :param max_workers: Number of batches submitted concurrently.
+        :return: Counts of inserted, upserted and modified documents.
+        """
+        if df is None or df.empty:
+            return {"inserted": 0, "upserted": 0, "modified": 0}
+        counts = self._write_frame(df, exchange, symbol, timeframe, batch_size, max_workers)
+        self._record_frame_write(self._collection_name(exchange, symbol, timeframe), df)
+        return counts
+
+    def _write_frame(self, df: pd.DataFrame, exchange: str, symbol: str, timeframe: str,
+                     batch_size: int, max_workers: int) -> Dict[str, int]:
+        # upsert_frame without the collection_versions bookkeeping, which callers do once per call.
+        counts = {"inserted": 0, "upserted": 0, "modified": 0}
+        collection = self.get_collection(exchange, symbol, timeframe)
+        if self.storage_mode == "bucket":
+            counts["upserted"] = self.bucket_store.upsert(collection, df, Exchange.parse_timeframe(timeframe))
+            return counts
+        if self.storage_mode == "timeseries":
+            return self._replace_timeseries_range(collection, df, batch_size)
+        docs = self.frame_to_documents(df.drop_duplicates(subset="timestamp", keep="last"))
+        first = collection.find_one(sort=[("timestamp", 1)], projection={"timestamp": 1})
+        last = collection.find_one(sort=[("timestamp", -1)], projection={"timestamp": 1})
+
+        if first is None:
+            # An empty collection may have been dropped and recreated behind our back,
+            # so re-ensure its indexes before relying on them for duplicate detection.
+            self.invalidate_collection(exchange, symbol, timeframe)
+            collection = self.get_collection(exchange, symbol, timeframe)
+            appends, overlaps = docs, []
+        else:
+            appends = [d for d in docs if d["timestamp"] > last["timestamp"] or d["timestamp"] < first["timestamp"]]
+            overlaps = [d for d in docs if first["timestamp"] <= d["timestamp"] <= last["timestamp"]]
+
+        def insert_batch(batch):
+            try:
+                result = collection.insert_many(batch, ordered=False)
+                return {"inserted": len(result.inserted_ids)}
+            except BulkWriteError as bwe:
+                # Another writer got there first; fall back to upserts for the clashing candles.
+                inserted = bwe.details.get("nInserted", 0)
+                clashing = [batch[e["index"]] for e in bwe.details.get("writeErrors", []) if e.get("code") == 11000]
+                result = upsert_batch(clashing) if clashing else {}
+                return {"inserted": inserted, **result}
+
+        def upsert_batch(batch):
+            operations = [
+                UpdateOne({"timestamp": d["timestamp"]},
+                          {"$set": {k: v for k, v in d.items() if k != "timestamp" and k != "_id"}},
+                          upsert=True)
+                for d in batch
+            ]
+            try:
+                result = collection.bulk_write(operations, ordered=False)
+                return {"upserted": result.upserted_count, "modified": result.modified_count}
+            except BulkWriteError as bwe:
+                logger.error("Bulk write error in %s: %s", collection.name, bwe.details)
+                return {}
+
+        jobs = [(insert_batch, appends[i:i + batch_size]) for i in range(0, len(appends), batch_size)]
+        jobs += [(upsert_batch, overlaps[i:i + batch_size]) for i in range(0, len(overlaps), batch_size)]
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            for result in pool.map(lambda job: job[0](job[1]), jobs):
+                for key, value in result.items():
+                    counts[key] += value
+
+        logger.info(f"Inserted {counts['inserted']}, upserted {counts['upserted']}, modified {counts['modified']} documents in collection {collection.name}.")
+        return counts
+
+    def upsert_stream(self, chunks: Iterable[pd.DataFrame], exchange: str, symbol: str, timeframe: str,
+                      flush_rows: int = 50000, batch_size: int = 5000, max_workers: int = 1) -> Dict[str, int]:
+        """
+        Writes candle chunks (e.g. from CryptoDataCollector.iter_by_date) as they arrive.
+        Chunks are grouped into upsert_frame calls of about `flush_rows` candles, so only
+        one batch is held in memory at a time. The whole stream is logged as one write in
+        collection_versions, covering all written candles, once it ends (or fails).
+
+        :param batch_size: Maximum number of documents per insert/bulk_write call.
+        :param max_workers: Number of batches submitted concurrently.
+        :return: Counts of inserted, upserted and modified documents over all batches.
+        """
+        counts = {"inserted": 0, "upserted": 0, "modified": 0}
+        first = last = None
+        try:
+            for frame in rebatch_frames(chunks, flush_rows):
+                if frame.empty:
+                    continue
+                if self._tracks_writes:
+                    low, high = self._frame_bounds(frame)
+                    first = low if first is None else min(first, low)
+                    last = high if last is None else max(last, high)
+                for key, value in self._write_frame(frame, exchange, symbol, timeframe, batch_size, max_workers).items():
+                    counts[key] += value
+        finally:
+            if first is not None:
+                self._record_write(self._collection_name(exchange, symbol, timeframe), first, last)
+        return counts
+
+    def _replace_timeseries_range(self, collection, df: pd.DataFrame, batch_size: int) -> Dict[str, int]:
+        # Time-series collections have no unique index and no upsert, so the covered
+        # range is deleted and rewritten instead.
+        docs = self.frame_to_documents(df.drop_duplicates(subset="timestamp", keep="last"))
+        first, last = min(d["timestamp"] for d in docs), max(d["timestamp"] for d in docs)
+        deleted = collection.delete_many({"timestamp": {"$gte": first, "$lte": last}}).deleted_count
+        inserted = 0
+        for i in range(0, len(docs), batch_size):
+            inserted += len(collection.insert_many(docs[i:i + batch_size], ordered=False).inserted_ids)
+        logger.info(f"Replaced {deleted} with {inserted} documents in time-series collection {collection.name}.")
+        return {"inserted": inserted, "upserted": 0, "modified": min(deleted, inserted)}
 
     def get_latest_timestamp(self, exchange: str, symbol: str, timeframe: str) -> datetime | None:
         """
@@ -62,12 +320,94 @@ class MongoDBHandler:
         Ensures the returned datetime is timezone-aware (UTC).
         """
         coll = self.get_collection(exchange, symbol, timeframe)
-        doc = coll.find_one(sort=[("timestamp", -1)])
-        if doc:
+        if self.storage_mode == "bucket":
+            doc = {"timestamp": BucketStore.latest_timestamp(coll)}
+        else:
+            doc = coll.find_one(sort=[("timestamp", -1)])
+        if doc and doc["timestamp"] is not None:
             ts = doc["timestamp"]
             # If ts is naive, assume it's in UTC and convert it
             if ts.tzinfo is None:
-                from datetime import timezone
                 ts = ts.replace(tzinfo=timezone.utc)
             return ts
-        return None
\ No newline at end of file
+        return None
+
+    def get_latest_timestamps(self, pairs: List[tuple], batch_size: int = 100) -> Dict[tuple, datetime | None]:
+        """
+        Returns the latest timestamp of many (exchange, symbol, timeframe) pairs.
+        Each batch of pairs is answered by a single aggregation that chains the
+        per-collection lookups with $unionWith (MongoDB 4.4+), instead of one
+        round trip per pair.
+
+        :param pairs: Iterable of (exchange, symbol, timeframe) tuples.
+        :param batch_size: Maximum number of collections per aggregation.
+        :return: Mapping from each pair to its latest timestamp (UTC-aware) or None.
+        """
+        pairs = list(pairs)
+        names = {pair: self._collection_name(*pair) for pair in pairs}
+        if self.storage_mode == "bucket":
+            sort_field, latest_field = "bucket", "$last"
+        else:
+            sort_field, latest_field = "timestamp", "$timestamp"
+
+        def latest_stage(name):
+            return [
+                {"$sort": {sort_field: -1}},
+                {"$limit": 1},
+                {"$project": {"_id": 0, "collection": {"$literal": name}, "timestamp": latest_field}},
+            ]
+
+        latest_by_name: Dict[str, datetime] = {}
+        unique_names = list(dict.fromkeys(names.values()))
+        for i in range(0, len(unique_names), batch_size):
+            batch = unique_names[i:i + batch_size]
+            pipeline = latest_stage(batch[0])
+            for name in batch[1:]:
+                pipeline.append({"$unionWith": {"coll": name, "pipeline": latest_stage(name)}})
+            for doc in self.db[batch[0]].aggregate(pipeline):
+                latest_by_name[doc["collection"]] = doc["timestamp"]
+
+        result = {}
+        for pair, name in names.items():
+            ts = latest_by_name.get(name)
+            if ts is not None and ts.tzinfo is None:
+                ts = ts.replace(tzinfo=timezone.utc)
+            result[pair] = ts
+        return result
+
+    def get_timestamps(self, exchange: str, symbol: str, timeframe: str,
+                       start: datetime | None = None, end: datetime | None = None) -> np.ndarray:
+        """
+        Returns the sorted candle timestamps in [start, end) as int64 epoch milliseconds,
+        projecting only the timestamp field (or the timestamp arrays of buckets).
+        """
+        coll = self.get_collection(exchange, symbol, timeframe)
+        if self.storage_mode == "bucket":
+            return self.bucket_store.read_timestamps(coll, Exchange.parse_timeframe(timeframe), start=start, end=end)
+        time_filter = {}
+        if start is not None:
+            time_filter["$gte"] = start
+        if end is not None:
+            time_filter["$lt"] = end
+        query = {"timestamp": time_filter} if time_filter else {}
+        cursor = coll.find(query, {"_id": 0, "timestamp": 1}).sort("timestamp", 1)
+        timestamps = np.array([doc["timestamp"] for doc in cursor], dtype="datetime64[ms]")
+        return timestamps.astype(np.int64)
+
+    def get_ohlcv(self, exchange: str, symbol: str, timeframe: str,
+                  start: datetime | None = None, end: datetime | None = None) -> pd.DataFrame:
+        """
+        Returns the candles in [start, end) as a DataFrame sorted by timestamp.
+        Either bound may be omitted to read from the beginning or up to the latest candle.
+        """
+        coll = self.get_collection(exchange, symbol, timeframe)
+        if self.storage_mode == "bucket":
+            return self.bucket_store.read(coll, Exchange.parse_timeframe(timeframe), start=start, end=end)
+        time_filter = {}
+        if start is not None:
+            time_filter["$gte"] = start
+        if end is not None:
+            time_filter["$lt"] = end
+        query = {"timestamp": time_filter} if time_filter else {}
+        docs = list(coll.find(query, {"_id": 0}).sort("timestamp", 1))
+        return pd.DataFrame(docs, columns=["timestamp", "open", "high", "low", "close", "volume"])
@@ -1,7 +1,10 @@
 # price_data_updater.py
 import logging
+import warnings
 from db.import_historical import import_full_historical
 from db.real_time_updater import real_time_updater
+from db.lease_coordinator import sharded_real_time_updater
+from db.stream_updater import streaming_updater
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -15,19 +18,37 @@ class PriceDataUpdater:
       - a list of crypto test cases (each with keys: exchange, symbol, timeframe)
       - a list of historical periods (tuples of (label, since, until))
     """
-    def __init__(self, collector, mongo_handler, crypto_tests, historical_periods, real_time_sleep: int = 60):
+    def __init__(self, collector, mongo_handler, crypto_tests, historical_periods, settle_delay: float = 2.0,
+                 sharded: bool = False, worker_id: str | None = None, streaming: bool = False, ring_store=None,
+                 real_time_sleep: float | None = None):
         """
         :param collector: Instance of MarketDataCollector.
         :param mongo_handler: Instance of MongoDBHandler.
         :param crypto_tests: List of dictionaries, each with keys "exchange", "symbol", "timeframe".
         :param historical_periods: List of tuples: (period_label, since, until).
-        :param real_time_sleep: Sleep interval in seconds between real-time updater cycles.
+        :param settle_delay: Seconds the real-time updater waits after each candle close before fetching.
+        :param sharded: Share the real-time pairs with other workers through Mongo leases
+            (see LeaseCoordinator) instead of updating all of them in this process.
+        :param worker_id: Unique worker name in sharded mode (defaults to host-pid-random).
+        :param streaming: Follow the pairs over exchange WebSocket kline streams (see StreamingUpdater)
+            instead of polling REST at every candle close.
+        :param ring_store: Writer-side CandleRingStore the real-time updater keeps current in shared
+            memory (see data.candle_ring), for readers that need recent windows without Mongo.
+        :param real_time_sleep: Deprecated and ignored; the real-time updater now runs at every
+            candle close instead of sleeping between cycles.
         """
+        if real_time_sleep is not None:
+            warnings.warn("real_time_sleep is deprecated and ignored: real-time updates run at candle closes; "
+                          "use settle_delay to tune them", DeprecationWarning, stacklevel=2)
         self.collector = collector
         self.mongo_handler = mongo_handler
         self.crypto_tests = crypto_tests
         self.historical_periods = historical_periods
-        self.real_time_sleep = real_time_sleep
+        self.settle_delay = settle_delay
+        self.sharded = sharded
+        self.worker_id = worker_id
+        self.streaming = streaming
+        self.ring_store = ring_store
 
     def run(self):
         """
@@ -43,4 +64,11 @@ class PriceDataUpdater:
         
         logger.info("Starting real-time updater...")
         # This function runs indefinitely. You might add signal handling for graceful shutdown later.
-        real_time_updater(self.collector, self.mongo_handler, self.crypto_tests, sleep_interval=self.real_time_sleep)
+        if self.streaming:
+            streaming_updater(self.collector, self.mongo_handler, self.crypto_tests, ring_store=self.ring_store)
+        elif self.sharded:
+            sharded_real_time_updater(self.collector, self.mongo_handler, self.crypto_tests,
+                                      worker_id=self.worker_id, settle_delay=self.settle_delay, ring_store=self.ring_store)
+        else:
+            real_time_updater(self.collector, self.mongo_handler, self.crypto_tests, settle_delay=self.settle_delay,
+                              ring_store=self.ring_store)
@@ -1,100 +1,293 @@
-# real_time_updater.py (updated with per-timeframe sleep intervals)
+# real_time_updater.py (event-driven, aligned to candle close times)
+import heapq
+import itertools
+import threading
 import time
-import pandas as pd
-from datetime import datetime, timedelta, timezone
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 import logging
+from data.rate_limiter import RequestScheduler
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-def real_time_updater(collector, mongo_handler, crypto_tests, default_sleep_interval: int = 60, sleep_intervals: dict = None) -> None:
+# Binance and most ccxt exchanges open weekly candles on Monday 00:00 UTC,
+# while the Unix epoch fell on a Thursday.
+WEEK_OFFSET_SEC = 4 * 86400
+
+# Seconds until a pair whose next close could not be computed is run (and scheduled) again.
+RESCHEDULE_RETRY_SEC = 30.0
+
+def next_candle_close(timeframe: str, duration_sec: int, now: datetime) -> datetime:
+    """
+    Returns the first candle-close boundary strictly after `now`.
+    Monthly candles close on calendar month starts and weekly ones on Mondays;
+    everything else closes on multiples of the duration since the epoch.
+
+    :param timeframe: Candle timeframe (e.g. "1m", "1w", "1M").
+    :param duration_sec: Candle duration in seconds, as returned by parse_timeframe.
+    :param now: Current time (timezone-aware).
+    """
+    if timeframe.endswith('M'):
+        months = int(timeframe[:-1] or 1)
+        month_index = now.year * 12 + now.month - 1
+        next_index = (month_index // months + 1) * months
+        return datetime(next_index // 12, next_index % 12 + 1, 1, tzinfo=timezone.utc)
+
+    offset = WEEK_OFFSET_SEC if timeframe.endswith('w') else 0
+    now_sec = now.timestamp()
+    boundary = ((now_sec - offset) // duration_sec + 1) * duration_sec + offset
+    return datetime.fromtimestamp(boundary, tz=timezone.utc)
+
+# Marks that the caller did not look the latest stored timestamp up in advance.
+NOT_LOOKED_UP = object()
+
+def update_pair(collector, mongo_handler, exchange: str, symbol: str, timeframe: str, now: datetime | None = None,
+                latest: datetime | None = NOT_LOOKED_UP, ring_store=None) -> int:
+    """
+    Fetches every candle from the latest stored one up to now and upserts them.
+    The latest stored candle is fetched again because it was still open when it was
+    stored, so its final OHLCV values are only known now.
+
+    :param latest: Latest stored timestamp if the caller already knows it (e.g. from
+        MongoDBHandler.get_latest_timestamps); looked up otherwise.
+    :param ring_store: CandleRingStore that also receives the fetched candles.
+    :return: Number of upserted candles.
+    """
+    now = now or datetime.now(timezone.utc)
+    if latest is NOT_LOOKED_UP:
+        latest = mongo_handler.get_latest_timestamp(exchange, symbol, timeframe)
+
+    if latest is None:
+        # If no data exists, fetch an initial candle.
+        df = collector.crypto.fetch_by_limit(
+            exchange_name=exchange,
+            symbol=symbol,
+            limit=1,
+            timeframe=timeframe
+        )
+    else:
+        logger.info(f"Fetching {symbol} on {exchange} ({timeframe}) from {latest} to {now}.")
+        df = collector.crypto.fetch_by_date(
+            exchange_name=exchange,
+            symbol=symbol,
+            timeframe=timeframe,
+            since=latest,
+            until=now,
+            priority=RequestScheduler.PRIORITY_REALTIME
+        )
+    # Upsert the new data into the corresponding collection.
+    mongo_handler.upsert_frame(df, exchange, symbol, timeframe)
+    if ring_store is not None:
+        ring_store.update_frame(df, exchange, symbol, timeframe)
+    logger.info(f"Real-time update: Upserted {len(df)} candle(s) for {symbol} on {exchange} into collection {mongo_handler._collection_name(exchange, symbol, timeframe)}.")
+    return len(df)
+
+class RealTimeScheduler:
+    """
+    Runs each (exchange, symbol, timeframe) pair right after its next candle closes.
+
+    Pairs sit in a heap keyed by their next due time (close boundary plus a settle delay),
+    and due pairs are handed to a worker pool, so a slow or long timeframe never delays
+    the others. Lateness (time from candle close until the upsert finished) is tracked
+    per pair.
+    """
+
+    def __init__(self, collector, mongo_handler, crypto_tests, settle_delay: float = 2.0, max_workers: int = 8,
+                 ring_store=None):
+        """
+        :param collector: Instance of MarketDataCollector.
+        :param mongo_handler: Instance of MongoDBHandler.
+        :param crypto_tests: List of dicts with keys "exchange", "symbol", "timeframe".
+        :param settle_delay: Seconds to wait after a close so the exchange has finalized the candle.
+        :param max_workers: Number of pairs that may be updated concurrently.
+        :param ring_store: Writer-side CandleRingStore to keep current; pairs are warm-loaded from Mongo when added.
+        """
+        self.collector = collector
+        self.mongo_handler = mongo_handler
+        self.crypto_tests = crypto_tests
+        self.settle_delay = settle_delay
+        self.max_workers = max_workers
+        self.ring_store = ring_store
+        self._heap: list[tuple[float, int, tuple[str, str, str], datetime, int]] = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        # Updated by the pool workers; read by stats() from any thread.
+        self._stats: dict[tuple[str, str, str], dict] = {}
+        self._stats_lock = threading.Lock()
+        # Active pairs and the generation they were added with; heap entries of an older
+        # generation belong to a pair that was removed (and maybe re-added) since.
+        self._active: dict[tuple[str, str, str], int] = {}
+
+    def add_pair(self, pair: tuple[str, str, str]) -> None:
+        """
+        Starts updating a pair. It is caught up right away, then runs at its candle closes.
+        """
+        with self._cond:
+            if pair in self._active:
+                return
+        if self.ring_store is not None:
+            try:
+                self.ring_store.warm_load(self.mongo_handler, [pair])
+            except Exception as e:
+                logger.warning(f"Could not warm-load the ring of {'/'.join(pair)}: {e}")
+        self._activate(pair)
+
+    def _activate(self, pair: tuple[str, str, str]) -> None:
+        now = datetime.now(timezone.utc)
+        with self._cond:
+            if pair in self._active:
+                return
+            generation = next(self._counter)
+            self._active[pair] = generation
+            with self._stats_lock:
+                self._stats.setdefault(pair, {"runs": 0, "errors": 0, "last_lateness_sec": None,
+                                              "max_lateness_sec": 0.0, "total_lateness_sec": 0.0})
+            heapq.heappush(self._heap, (now.timestamp(), next(self._counter), pair, now, generation))
+            self._cond.notify()
+
+    def remove_pair(self, pair: tuple[str, str, str]) -> None:
+        """
+        Stops updating a pair after its current run, if any.
+        """
+        with self._cond:
+            self._active.pop(pair, None)
+
+    def _schedule(self, pair: tuple[str, str, str], now: datetime, generation: int) -> None:
+        exchange, symbol, timeframe = pair
+        duration_sec = self.collector.crypto.check_exchange(exchange).parse_timeframe(timeframe)
+        close_time = next_candle_close(timeframe, duration_sec, now)
+        due = close_time.timestamp() + self.settle_delay
+        with self._cond:
+            if self._active.get(pair) != generation:
+                return
+            heapq.heappush(self._heap, (due, next(self._counter), pair, close_time, generation))
+            self._cond.notify()
+
+    def _schedule_retry(self, pair: tuple[str, str, str], now: datetime, generation: int) -> None:
+        # Runs the pair again a little later rather than dropping it, so a transient
+        # failure (e.g. markets not loaded) does not stop its updates for good.
+        with self._cond:
+            if self._active.get(pair) != generation:
+                return
+            heapq.heappush(self._heap, (now.timestamp() + RESCHEDULE_RETRY_SEC, next(self._counter), pair, now, generation))
+            self._cond.notify()
+
+    def _run_pair(self, pair: tuple[str, str, str], close_time: datetime, generation: int, latest=NOT_LOOKED_UP) -> None:
+        exchange, symbol, timeframe = pair
+        try:
+            update_pair(self.collector, self.mongo_handler, exchange, symbol, timeframe, latest=latest, ring_store=self.ring_store)
+            lateness = (datetime.now(timezone.utc) - close_time).total_seconds()
+            with self._stats_lock:
+                stats = self._stats[pair]
+                stats["runs"] += 1
+                stats["last_lateness_sec"] = lateness
+                stats["max_lateness_sec"] = max(stats["max_lateness_sec"], lateness)
+                stats["total_lateness_sec"] += lateness
+        except Exception as e:
+            with self._stats_lock:
+                self._stats[pair]["errors"] += 1
+            logger.error(f"Real-time update error for {symbol} on {exchange} ({timeframe}): {e}")
+        finally:
+            if not self._stop.is_set():
+                now = datetime.now(timezone.utc)
+                try:
+                    self._schedule(pair, now, generation)
+                except Exception as e:
+                    logger.error(f"Could not schedule {symbol} on {exchange} ({timeframe}), retrying in "
+                                 f"{RESCHEDULE_RETRY_SEC:.0f}s: {e}")
+                    self._schedule_retry(pair, now, generation)
+
+    def stats(self) -> dict:
+        """
+        Returns per-pair run counts, errors and lateness in seconds.
+        """
+        with self._stats_lock:
+            snapshot = {pair: dict(stats) for pair, stats in self._stats.items()}
+        result = {}
+        for pair, stats in snapshot.items():
+            runs = stats["runs"]
+            result["/".join(pair)] = {
+                "runs": runs,
+                "errors": stats["errors"],
+                "last_lateness_sec": stats["last_lateness_sec"],
+                "max_lateness_sec": stats["max_lateness_sec"],
+                "avg_lateness_sec": stats["total_lateness_sec"] / runs if runs else None,
+            }
+        return result
+
+    def _dispatch(self, pool: ThreadPoolExecutor, due: list[tuple[tuple[str, str, str], datetime, int]]) -> None:
+        # Pairs sharing a close boundary (e.g. every 1m pair) are due together, so their
+        # latest timestamps are fetched in one round trip instead of one per pair.
+        try:
+            latest = self.mongo_handler.get_latest_timestamps([pair for pair, _, _ in due])
+        except Exception as e:
+            logger.warning(f"Bulk latest-timestamp lookup failed, falling back to per-pair lookups: {e}")
+            latest = {}
+        for pair, close_time, generation in due:
+            pool.submit(self._run_pair, pair, close_time, generation, latest.get(pair, NOT_LOOKED_UP))
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def run(self) -> None:
+        """
+        Catches every pair up once, then blocks and dispatches pairs at their candle closes until stop() is called.
+        """
+        # Added pairs are due immediately, so the first dispatch catches up on whatever
+        # closed while we were down, with one bulk latest-timestamp lookup.
+        pairs = [(test["exchange"], test["symbol"], test["timeframe"]) for test in self.crypto_tests]
+        if self.ring_store is not None:
+            # One bulk lookup for the initial pairs instead of one per add_pair.
+            try:
+                self.ring_store.warm_load(self.mongo_handler, pairs)
+            except Exception as e:
+                logger.warning(f"Could not warm-load the candle rings: {e}")
+        for pair in pairs:
+            self._activate(pair)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while not self._stop.is_set():
+                with self._cond:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    wait = self._heap[0][0] - time.time()
+                    if wait > 0:
+                        self._cond.wait(wait)
+                        continue
+                    due = []
+                    while self._heap and self._heap[0][0] <= time.time():
+                        _, _, pair, close_time, generation = heapq.heappop(self._heap)
+                        if self._active.get(pair) == generation:
+                            due.append((pair, close_time, generation))
+                if due:
+                    self._dispatch(pool, due)
+
+def real_time_updater(collector, mongo_handler, crypto_tests, default_sleep_interval: int | None = None,
+                      sleep_intervals: dict | None = None, *, settle_delay: float = 2.0, max_workers: int = 8,
+                      ring_store=None) -> None:
     """
     Continuously fetches the latest OHLCV data for each crypto test case and upserts
     it into the specific collection for that exchange/symbol/timeframe.
-    
-    The sleep interval for each test is determined by the timeframe via a provided dictionary.
-    If a timeframe is not specified in the dictionary, a default sleep interval is used.
-    
+
+    Each pair runs right after its candle-close boundary (see RealTimeScheduler),
+    instead of sleeping a fixed interval per pair in series.
+
     :param collector: Instance of your MarketDataCollector.
     :param mongo_handler: Instance of your MongoDBHandler.
     :param crypto_tests: List of test cases (each a dict with keys: "exchange", "symbol", "timeframe").
-    :param default_sleep_interval: Default sleep interval (in seconds) if none is provided for a timeframe.
-    :param sleep_intervals: Dictionary mapping timeframe strings to sleep intervals in seconds.
+    :param default_sleep_interval: Deprecated and ignored; pairs run at their candle closes.
+    :param sleep_intervals: Deprecated and ignored; pairs run at their candle closes.
+    :param settle_delay: Seconds to wait after each candle close before fetching.
+    :param max_workers: Number of pairs that may be updated concurrently.
+    :param ring_store: Writer-side CandleRingStore to keep current.
     """
-    # Define default sleep intervals per timeframe if not provided.
-    if sleep_intervals is None:
-        sleep_intervals = {
-            "1m": 30,   
-            "3m": 30,   
-            "5m": 60,   
-            "15m": 120,  
-            "30m": 180,  
-            "1h": 300,
-            "2h": 600,
-            "4h": 900,
-            "6h": 900,
-            "8h": 1200,
-            "12h": 1800,
-            "1d": 3600,
-            "3d": 3600,
-            "1w": 7200
-        }
-    
-    while True:
-        now = datetime.now(timezone.utc)
-        for test in crypto_tests:
-            exchange = test["exchange"]
-            symbol = test["symbol"]
-            timeframe = test["timeframe"]
-            try:
-                # Get the latest stored candle timestamp for this test case.
-                latest = mongo_handler.get_latest_timestamp(exchange, symbol, timeframe)
-                # Determine the expected candle duration (in seconds) from the exchange.
-                exchange_inst = collector.crypto.check_exchange(exchange)
-                duration_sec = exchange_inst.parse_timeframe(timeframe)
-                
-                if latest is None:
-                    # If no data exists, fetch an initial candle.
-                    df = collector.crypto.fetch_by_limit(
-                        exchange_name=exchange,
-                        symbol=symbol,
-                        limit=1,
-                        timeframe=timeframe
-                    )
-                else:
-                    gap_sec = (now - latest).total_seconds()
-                    if gap_sec > duration_sec:
-                        logger.info(f"Gap ({gap_sec:.2f} sec) for {symbol} on {exchange} ({timeframe}) exceeds interval ({duration_sec} sec). Fetching missing candles.")
-                        # Fetch all candles between latest+1ms and now.
-                        new_since = latest + timedelta(milliseconds=1)
-                        df = collector.crypto.fetch_by_date(
-                            exchange_name=exchange,
-                            symbol=symbol,
-                            timeframe=timeframe,
-                            since=new_since,
-                            until=now
-                        )
-                    else:
-                        logger.info(f"Gap ({gap_sec:.2f} sec) for {symbol} on {exchange} ({timeframe}) is within interval ({duration_sec} sec). Fetching latest candle.")
-                        df = collector.crypto.fetch_by_limit(
-                            exchange_name=exchange,
-                            symbol=symbol,
-                            limit=1,
-                            timeframe=timeframe
-                        )
-                # Convert fetched data to dictionary and ensure timestamps are datetime objects.
-                records = df.to_dict("records")
-                for r in records:
-                    if not isinstance(r["timestamp"], datetime):
-                        r["timestamp"] = pd.to_datetime(r["timestamp"]).to_pydatetime()
-                # Upsert the new data into the corresponding collection.
-                mongo_handler.upsert_ohlcv(records, exchange, symbol, timeframe)
-                logger.info(f"Real-time update: Upserted {len(records)} new candle(s) for {symbol} on {exchange} into collection {mongo_handler._collection_name(exchange, symbol, timeframe)}.")
-            except Exception as e:
-                logger.error(f"Real-time update error for {symbol} on {exchange} ({timeframe}): {e}")
-            
-            # Sleep for this test's specific sleep interval.
-            interval_sleep = sleep_intervals.get(timeframe, default_sleep_interval)
-            logger.info(f"Sleeping for {interval_sleep} seconds for {symbol} on {exchange} ({timeframe}).")
-            time.sleep(interval_sleep)
-        # Optionally, you might add a global sleep here if desired.
+    if default_sleep_interval is not None or sleep_intervals is not None:
+        warnings.warn("default_sleep_interval and sleep_intervals are deprecated and ignored: real-time updates "
+                      "run at candle closes; use settle_delay to tune them", DeprecationWarning, stacklevel=2)
+    RealTimeScheduler(collector, mongo_handler, crypto_tests, settle_delay=settle_delay, max_workers=max_workers,
+                      ring_store=ring_store).run()
@@ -0,0 +1,129 @@
+# refetch_planner.py
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Tuple
+from data.candle_buffer import CandleBuffer
+from data.crypto_data_collector import to_milliseconds, page_request_limit, trim_to_window
+from data.rate_limiter import RequestScheduler
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+def coalesce_gaps(gaps: List[Tuple[int, int]], page_ms: int) -> List[Tuple[int, int]]:
+    """
+    Packs inclusive (start, end) millisecond gaps into as few [start, end) pages as possible.
+
+    A page starts at the first uncovered gap and spans at most `page_ms`; every later gap
+    starting inside it rides along, even if a few stored candles sit in between. A gap that
+    runs past the page end continues in the next page.
+    """
+    pending = deque(sorted(gaps))
+    pages = []
+    while pending:
+        page_start, gap_end = pending.popleft()
+        page_limit = page_start + page_ms
+        page_end = min(gap_end + 1, page_limit)
+        if gap_end + 1 > page_limit:
+            pending.appendleft((page_limit, gap_end))
+        else:
+            while pending and pending[0][0] < page_limit:
+                next_start, next_end = pending.popleft()
+                page_end = max(page_end, min(next_end + 1, page_limit))
+                if next_end + 1 > page_limit:
+                    pending.appendleft((page_limit, next_end))
+                    break
+        pages.append((page_start, page_end))
+    return pages
+
+class RefetchPlanner:
+    """
+    Turns the gaps found by DataIntegrityChecker into a request plan and runs it.
+
+    Nearby gaps are merged into as few `page_limit`-candle pages as possible, the request
+    cost is estimated up front, and the pages are fetched concurrently through the
+    exchange's RequestScheduler at backfill priority.
+    """
+
+    def __init__(self, collector, mongo_handler, page_limit: int = 1000, max_workers: int = 4):
+        """
+        :param collector: Instance of MarketDataCollector.
+        :param mongo_handler: Instance of MongoDBHandler.
+        :param page_limit: Maximum number of candles per request.
+        :param max_workers: Number of pages fetched concurrently.
+        """
+        self.collector = collector
+        self.mongo_handler = mongo_handler
+        self.page_limit = page_limit
+        self.max_workers = max_workers
+
+    def plan(self, exchange: str, timeframe: str, gaps: List[Tuple[datetime, datetime]]) -> dict:
+        """
+        Builds the page plan for the given missing intervals.
+
+        :param gaps: Inclusive (start, end) intervals, as returned by DataIntegrityChecker.find_gaps.
+        :return: Dict with the pages (epoch ms [start, end) windows) and a cost report.
+        """
+        exchange_inst = self.collector.crypto.check_exchange(exchange)
+        timeframe_ms = exchange_inst.parse_timeframe(timeframe) * 1000
+        gaps_ms = [(to_milliseconds(start), to_milliseconds(end)) for start, end in gaps]
+        pages = coalesce_gaps(gaps_ms, self.page_limit * timeframe_ms)
+
+        missing = sum(max(1, (end - start + 1) // timeframe_ms) for start, end in gaps_ms)
+        # One fetch_by_date call per gap used to cost at least one request each.
+        naive_requests = sum(max(1, -(-(end - start + 1) // (self.page_limit * timeframe_ms))) for start, end in gaps_ms)
+        estimated_seconds = 0.0
+        scheduler = self.collector.crypto.schedulers.get(exchange)
+        if scheduler is not None:
+            estimated_seconds = max(0.0, len(pages) - scheduler.bucket.capacity) / scheduler.bucket.rate
+        return {
+            "exchange": exchange,
+            "timeframe": timeframe,
+            "pages": pages,
+            "report": {
+                "gaps": len(gaps_ms),
+                "missing_candles": missing,
+                "requests": len(pages),
+                "naive_requests": naive_requests,
+                "estimated_seconds": round(estimated_seconds, 2),
+            },
+        }
+
+    def execute(self, symbol: str, plan: dict, dry_run: bool = False) -> dict:
+        """
+        Fetches every page of the plan concurrently and upserts the candles in one write.
+
+        :param symbol: Trading pair symbol (e.g. "BTC/USDT").
+        :param plan: Plan returned by plan().
+        :param dry_run: Only log and return the cost report, without any request.
+        :return: The plan's report, plus the number of fetched candles when executed.
+        """
+        exchange, timeframe, pages = plan["exchange"], plan["timeframe"], plan["pages"]
+        report = dict(plan["report"])
+        logger.info(f"Refetch plan for {symbol} on {exchange} ({timeframe}): {report}")
+        if dry_run or not pages:
+            return report
+
+        crypto = self.collector.crypto
+        exchange_inst = crypto.check_exchange(exchange)
+        timeframe_ms = exchange_inst.parse_timeframe(timeframe) * 1000
+
+        def fetch_page(page):
+            start, end = page
+            limit = page_request_limit(start, end, timeframe_ms, self.page_limit)
+            ohlcv = crypto.safe_fetch_ohlcv(exchange_inst, symbol, timeframe, start, limit,
+                                            priority=RequestScheduler.PRIORITY_BACKFILL)
+            return trim_to_window(ohlcv, start, end)
+
+        buffer = CandleBuffer(capacity=sum((end - start) // timeframe_ms + 1 for start, end in pages))
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(pages)))) as pool:
+            for ohlcv in pool.map(fetch_page, pages):
+                buffer.append(ohlcv)
+        buffer.dedupe_sort()
+
+        df = buffer.to_frame()
+        self.mongo_handler.upsert_frame(df, exchange, symbol, timeframe)
+        report["fetched_candles"] = len(df)
+        logger.info(f"Refetched {len(df)} candles for {symbol} on {exchange} ({timeframe}) in {len(pages)} requests.")
+        return report
@@ -0,0 +1,157 @@
+# stream_updater.py
+import asyncio
+import logging
+from collections import defaultdict
+import numpy as np
+from data.candle_buffer import CandleBuffer
+from db.real_time_updater import update_pair
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+class StreamingUpdater:
+    """
+    Streaming alternative to RealTimeScheduler, built on ccxt pro `watch_ohlcv` kline streams.
+
+    A candle is known to be closed as soon as the stream delivers the next one, so each
+    pair's last update of a candle is queued at that moment and a writer task upserts
+    the queue into MongoDBHandler every `flush_interval` seconds. Whenever a stream
+    (re)connects, the pair is first caught up over REST with update_pair, so nothing
+    that closed while it was disconnected is missed.
+    """
+
+    def __init__(self, collector, mongo_handler, crypto_tests, flush_interval: float = 0.5,
+                 reconnect_delay: float = 1.0, max_reconnect_delay: float = 60.0, exchange_factory=None, ring_store=None):
+        """
+        :param collector: Instance of MarketDataCollector (used for the REST catch-up).
+        :param mongo_handler: Instance of MongoDBHandler.
+        :param crypto_tests: List of dicts with keys "exchange", "symbol", "timeframe".
+        :param flush_interval: Seconds between two micro-batch writes.
+        :param reconnect_delay: First delay before reconnecting a failed stream; doubled up to max_reconnect_delay.
+        :param exchange_factory: Builds the streaming exchange from its name (defaults to ccxt.pro).
+        :param ring_store: Writer-side CandleRingStore; it is warm-loaded at start and receives
+            every stream update, the still-open candle included.
+        """
+        self.collector = collector
+        self.mongo_handler = mongo_handler
+        self.crypto_tests = crypto_tests
+        self.flush_interval = flush_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.exchange_factory = exchange_factory or self._pro_exchange
+        self.ring_store = ring_store
+        self.exchanges = {}
+        self._closed: dict[tuple[str, str, str], list] = defaultdict(list)
+        self._stop = asyncio.Event()
+        self.stats = {"closed_candles": 0, "writes": 0, "reconnects": 0, "gap_fills": 0}
+
+    @staticmethod
+    def _pro_exchange(name: str):
+        import ccxt.pro
+        return getattr(ccxt.pro, name)()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    async def _catch_up(self, pair: tuple[str, str, str]) -> None:
+        exchange, symbol, timeframe = pair
+        await asyncio.to_thread(update_pair, self.collector, self.mongo_handler, exchange, symbol, timeframe,
+                                ring_store=self.ring_store)
+        self.stats["gap_fills"] += 1
+
+    async def _watch_pair(self, pair: tuple[str, str, str]) -> None:
+        exchange_name, symbol, timeframe = pair
+        exchange = self.exchanges[exchange_name]
+        delay = self.reconnect_delay
+        while not self._stop.is_set():
+            current = None
+            try:
+                # Subscribe first, then catch up over REST, so no candle falls between the two.
+                updates = await exchange.watch_ohlcv(symbol, timeframe)
+                await self._catch_up(pair)
+                delay = self.reconnect_delay
+                while not self._stop.is_set():
+                    updates = sorted(updates, key=lambda c: c[0])
+                    if self.ring_store is not None and updates:
+                        candles = np.asarray(updates, dtype=np.float64)
+                        self.ring_store.ring(*pair).update(candles[:, 0].astype(np.int64), candles[:, 1:6])
+                    for candle in updates:
+                        if current is None or candle[0] == current[0]:
+                            current = candle
+                        elif candle[0] > current[0]:
+                            # The next candle opened, so the previous update was the final one.
+                            self._closed[pair].append(current)
+                            self.stats["closed_candles"] += 1
+                            current = candle
+                    updates = await exchange.watch_ohlcv(symbol, timeframe)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["reconnects"] += 1
+                logger.warning(f"Stream for {symbol} on {exchange_name} ({timeframe}) failed, reconnecting in {delay}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def flush(self) -> int:
+        """
+        Writes every queued closed candle, one upsert_frame call per pair.
+
+        :return: Number of candles written.
+        """
+        batches, self._closed = self._closed, defaultdict(list)
+        written = 0
+        for (exchange, symbol, timeframe), candles in batches.items():
+            buffer = CandleBuffer(capacity=len(candles))
+            buffer.append(candles)
+            buffer.dedupe_sort()
+            try:
+                await asyncio.to_thread(self.mongo_handler.upsert_frame, buffer.to_frame(), exchange, symbol, timeframe)
+                written += len(buffer)
+            except Exception as e:
+                logger.error(f"Streaming write failed for {symbol} on {exchange} ({timeframe}): {e}")
+                # Keep the candles for the next flush.
+                self._closed[(exchange, symbol, timeframe)] = candles + self._closed[(exchange, symbol, timeframe)]
+        if written:
+            self.stats["writes"] += 1
+        return written
+
+    async def _writer(self) -> None:
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def run(self) -> None:
+        """
+        Streams every pair until stop() is called, then flushes and closes the exchanges.
+        """
+        pairs = [(test["exchange"], test["symbol"], test["timeframe"]) for test in self.crypto_tests]
+        if self.ring_store is not None:
+            await asyncio.to_thread(self.ring_store.warm_load, self.mongo_handler, pairs)
+        for name in {pair[0] for pair in pairs}:
+            self.exchanges[name] = self.exchange_factory(name)
+        watchers = [asyncio.create_task(self._watch_pair(pair)) for pair in pairs]
+        try:
+            await self._writer()
+        finally:
+            for task in watchers:
+                task.cancel()
+            await asyncio.gather(*watchers, return_exceptions=True)
+            await self.flush()
+            for exchange in self.exchanges.values():
+                await exchange.close()
+
+def streaming_updater(collector, mongo_handler, crypto_tests, flush_interval: float = 0.5, ring_store=None) -> None:
+    """
+    Runs StreamingUpdater until interrupted.
+
+    :param collector: Instance of your MarketDataCollector.
+    :param mongo_handler: Instance of your MongoDBHandler.
+    :param crypto_tests: List of test cases (each a dict with keys: "exchange", "symbol", "timeframe").
+    :param flush_interval: Seconds between two micro-batch writes.
+    :param ring_store: Writer-side CandleRingStore to keep current.
+    """
+    asyncio.run(StreamingUpdater(collector, mongo_handler, crypto_tests, flush_interval=flush_interval,
+                                 ring_store=ring_store).run())
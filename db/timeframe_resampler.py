@@ -0,0 +1,158 @@
+# timeframe_resampler.py
+import logging
+import numpy as np
+import pandas as pd
+from ccxt import Exchange
+from datetime import datetime, timezone
+from db.real_time_updater import WEEK_OFFSET_SEC
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_TARGET_TIMEFRAMES = ('15m', '1h', '4h', '1d', '1w', '1M')
+
+OHLCV_AGGREGATION = {
+    "open": "first",
+    "high": "max",
+    "low": "min",
+    "close": "last",
+    "volume": "sum",
+}
+
+def resample_rule(timeframe: str) -> str:
+    """
+    Maps a ccxt timeframe to a pandas resample rule.
+    Weekly buckets start on Monday and monthly buckets on the first of the month, like Binance.
+    """
+    amount, unit = int(timeframe[:-1] or 1), timeframe[-1]
+    if unit == 'm':
+        return f"{amount}min"
+    if unit == 'h':
+        return f"{amount}h"
+    if unit == 'd':
+        # Hours rather than "D" keep the rule fixed-length, so it aligns to the epoch like 3d candles do.
+        return f"{amount * 24}h"
+    if unit == 'w' and amount == 1:
+        return "W-MON"
+    if unit == 'M' and amount == 1:
+        return "MS"
+    raise ValueError(f"Timeframe '{timeframe}' cannot be derived locally")
+
+def bucket_start(ts: datetime, timeframe: str) -> datetime:
+    """
+    Returns the start of the `timeframe` candle containing `ts` (naive UTC, like Mongo returns).
+    """
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    if timeframe.endswith('M'):
+        return datetime(ts.year, ts.month, 1)
+    duration = Exchange.parse_timeframe(timeframe)
+    offset = WEEK_OFFSET_SEC if timeframe.endswith('w') else 0
+    epoch_sec = ts.replace(tzinfo=timezone.utc).timestamp()
+    start = (epoch_sec - offset) // duration * duration + offset
+    return datetime.fromtimestamp(start, tz=timezone.utc).replace(tzinfo=None)
+
+def resample_ohlcv(df: pd.DataFrame, timeframe: str) -> pd.DataFrame:
+    """
+    Aggregates base candles into `timeframe` candles in one vectorized pass.
+    Buckets without any base candle are dropped rather than filled.
+    """
+    if df.empty:
+        return df.iloc[0:0][["timestamp", "open", "high", "low", "close", "volume"]]
+    frame = df.set_index(pd.to_datetime(df["timestamp"]))[list(OHLCV_AGGREGATION)]
+    # Calendar rules (W-MON, MS) are already anchored; only fixed-length rules need an origin.
+    origin = {"origin": "epoch"} if timeframe[-1] in "mhd" else {}
+    resampled = frame.resample(resample_rule(timeframe), closed="left", label="left", **origin).agg(OHLCV_AGGREGATION)
+    resampled = resampled.dropna(subset=["open"])
+    resampled.index.name = "timestamp"
+    return resampled.reset_index()
+
+class TimeframeResampler:
+    """
+    Derives higher timeframes from the lowest stored timeframe instead of fetching each
+    one from the exchange. Updates are incremental: only the buckets touched by newly
+    upserted base candles are recomputed.
+    """
+
+    def __init__(self, mongo_handler, base_timeframe: str = '5m',
+                 target_timeframes: tuple[str, ...] = DEFAULT_TARGET_TIMEFRAMES):
+        """
+        :param mongo_handler: Instance of MongoDBHandler.
+        :param base_timeframe: Stored timeframe the others are built from.
+        :param target_timeframes: Timeframes to derive; each must be a multiple of the base.
+        """
+        base_sec = Exchange.parse_timeframe(base_timeframe)
+        for timeframe in target_timeframes:
+            resample_rule(timeframe)
+            # Collection names are lowercased, so "1M" candles would overwrite a "1m" base.
+            if timeframe.lower() == base_timeframe.lower():
+                raise ValueError(f"Timeframe '{timeframe}' shares its collection with base timeframe '{base_timeframe}'")
+            if timeframe[-1] not in 'wM' and Exchange.parse_timeframe(timeframe) % base_sec:
+                raise ValueError(f"Timeframe '{timeframe}' is not a multiple of base timeframe '{base_timeframe}'")
+        self.mongo_handler = mongo_handler
+        self.base_timeframe = base_timeframe
+        self.target_timeframes = target_timeframes
+
+    @classmethod
+    def from_stored(cls, mongo_handler, exchange: str, symbol: str, **kwargs) -> "TimeframeResampler":
+        """
+        Builds a resampler whose base is the lowest timeframe already stored for the pair.
+        Collection names are lowercased, so derived "1M" candles are stored under "1m";
+        the collections of the timeframes to derive are therefore never taken as the base.
+        """
+        prefix = mongo_handler._collection_name(exchange, symbol, "")
+        derived = {mongo_handler._collection_name(exchange, symbol, tf)
+                   for tf in kwargs.get("target_timeframes", DEFAULT_TARGET_TIMEFRAMES)}
+        stored = [name[len(prefix):] for name in mongo_handler.db.list_collection_names()
+                  if name.startswith(prefix) and name not in derived]
+        candidates = [tf for tf in stored if tf[:-1].isdigit() and tf[-1] in "mhd"]
+        if not candidates:
+            raise ValueError(f"No stored timeframe found for {symbol} on {exchange}")
+        base_timeframe = min(candidates, key=Exchange.parse_timeframe)
+        return cls(mongo_handler, base_timeframe=base_timeframe, **kwargs)
+
+    def update(self, exchange: str, symbol: str, since: datetime | None = None) -> dict[str, int]:
+        """
+        Recomputes the derived candles whose buckets contain base candles at or after `since`
+        and upserts them. With since=None the whole history is rebuilt.
+
+        :param since: Timestamp of the earliest newly upserted base candle.
+        :return: Number of upserted candles per derived timeframe.
+        """
+        starts = {tf: bucket_start(since, tf) if since is not None else None for tf in self.target_timeframes}
+        # Read the base candles once, from the earliest bucket any timeframe needs.
+        earliest = min((start for start in starts.values() if start is not None), default=None)
+        base = self.mongo_handler.get_ohlcv(exchange, symbol, self.base_timeframe, start=earliest)
+        if base.empty:
+            logger.info(f"No {self.base_timeframe} candles stored for {symbol} on {exchange}; nothing to derive.")
+            return {}
+
+        base_times = base["timestamp"].to_numpy()
+        upserted = {}
+        for timeframe, start in starts.items():
+            first = 0 if start is None else int(np.searchsorted(base_times, np.datetime64(start), side="left"))
+            derived = resample_ohlcv(base.iloc[first:], timeframe)
+            self.mongo_handler.upsert_frame(derived, exchange, symbol, timeframe)
+            upserted[timeframe] = len(derived)
+        logger.info(f"Derived {upserted} candles for {symbol} on {exchange} from {self.base_timeframe}.")
+        return upserted
+
+    def verify(self, collector, exchange: str, symbol: str, timeframe: str,
+               since: datetime, until: datetime, rtol: float = 1e-6) -> pd.DataFrame:
+        """
+        Compares derived candles in [since, until) with the exchange's native candles.
+
+        :param collector: Instance of MarketDataCollector.
+        :param rtol: Relative tolerance for price and volume comparisons.
+        :return: Rows that are missing on either side or differ, with derived and native values side by side.
+        """
+        derived = self.mongo_handler.get_ohlcv(exchange, symbol, timeframe, start=since, end=until)
+        native = collector.crypto.fetch_by_date(exchange_name=exchange, symbol=symbol, timeframe=timeframe, since=since, until=until)
+        merged = derived.merge(native, on="timestamp", how="outer", suffixes=("_derived", "_native"), indicator=True)
+
+        mismatch = merged["_merge"] != "both"
+        for column in OHLCV_AGGREGATION:
+            mismatch |= ~np.isclose(merged[f"{column}_derived"].astype(float), merged[f"{column}_native"].astype(float), rtol=rtol)
+        mismatches = merged[mismatch].drop(columns="_merge").reset_index(drop=True)
+        logger.info(f"Verified {len(merged)} {timeframe} candles for {symbol} on {exchange}: {len(mismatches)} mismatches.")
+        return mismatches
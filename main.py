@@ -1,13 +1,12 @@
 #!/usr/bin/env python3
-import time
-import threading
-from datetime import datetime, timezone
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
 
-from data.market_data_collector import MarketDataCollector
+import ccxt
+from data.async_crypto_data_collector import AsyncCryptoDataCollector
 from db.mongo_storage import MongoDBHandler
-
-# Initialize your MarketDataCollector (for crypto, forex key is not used here)
-collector = MarketDataCollector(api_key=None)
+from db.timeframe_resampler import TimeframeResampler
 
 # Initialize the MongoDB handler.
 # The database name is created dynamically, e.g., "binance_BTC_USDT" (with "/" replaced by "_").
@@ -16,45 +15,80 @@ symbol = 'BTC/USDT'
 db_name = exchange + "_" + symbol.replace("/", "_")
 mongo_handler = MongoDBHandler(uri="mongodb://localhost:27017/", db_name=db_name)
 
-# Define the list of timeframes in descending order (largest first)
-timeframes = ['1M', '1w', '1d', '12h', '8h', '4h', '1h', '30m', '15m', '5m']
+# Only the base timeframe is fetched from the exchange; the higher ones
+# (largest first) are derived from it locally.
+base_timeframe = '5m'
+derived_timeframes = ['1M', '1w', '1d', '12h', '8h', '4h', '1h', '30m', '15m']
+resampler = TimeframeResampler(mongo_handler, base_timeframe=base_timeframe, target_timeframes=tuple(derived_timeframes))
 
 # Define the historical date range for data fetching.
 # Ensure timezone-aware datetime objects.
 since = datetime(2017, 1, 1, tzinfo=timezone.utc)
-until = datetime.now(timezone.utc)
 
-def update_timeframe(tf):
+async def sync_start(tf, overlap, backfill=False):
+    """
+    Returns where a cycle should start fetching: the latest stored candle minus `overlap`
+    candles, so the candle that was still open at the last cycle is refreshed. Falls back
+    to the full history when nothing is stored yet or a backfill is requested.
+    """
+    if backfill:
+        return since
+    latest = await asyncio.to_thread(mongo_handler.get_latest_timestamp, exchange, symbol, tf)
+    if latest is None:
+        return since
+    return max(since, latest - (overlap - 1) * timedelta(seconds=ccxt.Exchange.parse_timeframe(tf)))
+
+async def update_timeframe(crypto, tf, start, until):
     try:
-        print(f"Fetching candles for timeframe {tf}...")
-        df = collector.crypto.fetch_by_date(
+        print(f"Fetching candles for timeframe {tf} from {start}...")
+        df = await crypto.fetch_by_date(
             exchange_name=exchange,
             symbol=symbol,
             timeframe=tf,
-            since=since,
+            since=start,
             until=until
         )
         num_candles = len(df)
         print(f"Fetched {num_candles} candles for timeframe {tf}.")
-        records = df.to_dict("records")
-        mongo_handler.upsert_ohlcv(records, exchange, symbol, tf)
-        print(f"Upserted {len(records)} candles for timeframe {tf}.")
+        # pymongo is blocking; keep it off the event loop.
+        await asyncio.to_thread(mongo_handler.upsert_frame, df, exchange, symbol, tf)
+        print(f"Upserted {num_candles} candles for timeframe {tf}.")
+        return df
     except Exception as e:
         print(f"Error fetching or upserting data for timeframe {tf}: {e}")
 
-def update_all_timeframes():
-    threads = []
-    for tf in timeframes:
-        thread = threading.Thread(target=update_timeframe, args=(tf,))
-        threads.append(thread)
-        thread.start()
-    for thread in threads:
-        thread.join()
+async def update_all_timeframes(crypto, overlap=2, backfill=False):
+    until = datetime.now(timezone.utc)
+    start = await sync_start(base_timeframe, overlap, backfill)
+    df = await update_timeframe(crypto, base_timeframe, start, until)
+    if df is None or df.empty:
+        return
+    try:
+        # Only the buckets touched by the fetched base candles are recomputed.
+        first_new = df['timestamp'].min().to_pydatetime()
+        derived = await asyncio.to_thread(resampler.update, exchange, symbol, since=first_new)
+        print(f"Derived candles per timeframe: {derived}")
+    except Exception as e:
+        print(f"Error deriving timeframes from {base_timeframe}: {e}")
+
+async def main(overlap=2, backfill=False, interval=60):
+    async with AsyncCryptoDataCollector(exchange_names=[exchange]) as crypto:
+        while True:
+            current_time = datetime.now(timezone.utc).isoformat()
+            print(f"\nStarting data update cycle at {current_time}")
+            # Only the first cycle backfills; later cycles sync the tail.
+            await update_all_timeframes(crypto, overlap=overlap, backfill=backfill)
+            backfill = False
+            print(f"Scheduler stats: {crypto.scheduler_stats()}")
+            print(f"Cycle complete. Waiting {interval} seconds before next cycle...")
+            await asyncio.sleep(interval)
 
 if __name__ == "__main__":
-    while True:
-        current_time = datetime.now(timezone.utc).isoformat()
-        print(f"\nStarting data update cycle at {current_time}")
-        update_all_timeframes()
-        print("Cycle complete. Waiting 60 seconds before next cycle...")
-        time.sleep(60)
+    parser = argparse.ArgumentParser(description="Keeps the stored candles of one symbol up to date.")
+    parser.add_argument("--backfill", action="store_true",
+                        help=f"Re-fetch the full history since {since.date()} in the first cycle")
+    parser.add_argument("--overlap", type=int, default=2,
+                        help="Stored candles re-fetched every cycle, the last (possibly open) one included")
+    parser.add_argument("--interval", type=float, default=60, help="Seconds between two cycles")
+    args = parser.parse_args()
+    asyncio.run(main(overlap=max(1, args.overlap), backfill=args.backfill, interval=args.interval))
@@ -0,0 +1,146 @@
+# fake_collection.py
+import copy
+import threading
+from types import SimpleNamespace
+from pymongo.errors import DuplicateKeyError
+
+class FakeCollection:
+    """
+    Dict-backed stand-in for a pymongo collection keyed by _id, covering the queries of the
+    coordination code (leases, import checkpoints): equality (None also matches a missing
+    field), $in, $nin, $lt, $lte, $gt, $gte, $and and $or filters, $set, $inc and
+    $setOnInsert updates, sorted find_one_and_update, and bulk_write of UpdateOne.
+    """
+
+    def __init__(self, name: str = "fake"):
+        self.name = name
+        self.docs: dict = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def matches(cls, doc: dict, query: dict) -> bool:
+        for field, condition in query.items():
+            if field == "$and":
+                if not all(cls.matches(doc, part) for part in condition):
+                    return False
+            elif field == "$or":
+                if not any(cls.matches(doc, part) for part in condition):
+                    return False
+            elif isinstance(condition, dict):
+                value = doc.get(field)
+                for operator, operand in condition.items():
+                    if not cls._compare(operator, value, operand):
+                        return False
+            elif doc.get(field) != condition:
+                return False
+        return True
+
+    @staticmethod
+    def _compare(operator: str, value, operand) -> bool:
+        if operator == "$in":
+            return value in operand
+        if operator == "$nin":
+            return value not in operand
+        if value is None:
+            return False
+        if operator == "$lt":
+            return value < operand
+        if operator == "$lte":
+            return value <= operand
+        if operator == "$gt":
+            return value > operand
+        if operator == "$gte":
+            return value >= operand
+        raise NotImplementedError(f"Unsupported operator {operator}")
+
+    def _find(self, query: dict | None) -> list:
+        return [doc for doc in self.docs.values() if self.matches(doc, query or {})]
+
+    @staticmethod
+    def _update(doc: dict, update: dict, created: bool) -> None:
+        for operator, fields in update.items():
+            if operator == "$set" or (operator == "$setOnInsert" and created):
+                doc.update(copy.deepcopy(fields))
+            elif operator == "$inc":
+                for field, amount in fields.items():
+                    doc[field] = doc.get(field, 0) + amount
+            elif operator != "$setOnInsert":
+                raise NotImplementedError(f"Unsupported update operator {operator}")
+
+    def _upsert(self, query: dict, update: dict, upsert: bool) -> tuple[dict | None, bool]:
+        docs = self._find(query)
+        if docs:
+            self._update(docs[0], update, created=False)
+            return docs[0], False
+        if not upsert:
+            return None, False
+        if "_id" not in query or isinstance(query["_id"], dict):
+            raise NotImplementedError("Upserts need an _id equality filter")
+        if query["_id"] in self.docs:
+            raise DuplicateKeyError(f"E11000 duplicate key {query['_id']}")
+        doc = {"_id": query["_id"]}
+        self._update(doc, update, created=True)
+        self.docs[doc["_id"]] = doc
+        return doc, True
+
+    def create_index(self, *args, **kwargs) -> str:
+        return "index"
+
+    def find(self, query: dict | None = None, projection=None) -> list:
+        with self._lock:
+            return [copy.deepcopy(doc) for doc in self._find(query)]
+
+    def find_one(self, query: dict | None = None, projection=None) -> dict | None:
+        docs = self.find(query)
+        return docs[0] if docs else None
+
+    def count_documents(self, query: dict) -> int:
+        with self._lock:
+            return len(self._find(query))
+
+    def update_one(self, query: dict, update: dict, upsert: bool = False):
+        with self._lock:
+            doc, created = self._upsert(query, update, upsert)
+        return SimpleNamespace(matched_count=int(doc is not None and not created), upserted_id=doc["_id"] if created else None)
+
+    def update_many(self, query: dict, update: dict):
+        with self._lock:
+            docs = self._find(query)
+            for doc in docs:
+                self._update(doc, update, created=False)
+        return SimpleNamespace(matched_count=len(docs))
+
+    def find_one_and_update(self, query: dict, update: dict, sort=None, return_document=None) -> dict | None:
+        with self._lock:
+            docs = self._find(query)
+            if not docs:
+                return None
+            for field, direction in reversed(sort or []):
+                docs.sort(key=lambda doc: doc[field], reverse=direction < 0)
+            self._update(docs[0], update, created=False)
+            return copy.deepcopy(docs[0])
+
+    def bulk_write(self, operations, ordered: bool = True):
+        upserted = 0
+        with self._lock:
+            for operation in operations:
+                # pymongo's UpdateOne keeps its arguments in these attributes.
+                _, created = self._upsert(operation._filter, operation._doc, operation._upsert)
+                upserted += created
+        return SimpleNamespace(upserted_count=upserted)
+
+    def delete_one(self, query: dict):
+        with self._lock:
+            docs = self._find(query)
+            if docs:
+                del self.docs[docs[0]["_id"]]
+        return SimpleNamespace(deleted_count=len(docs[:1]))
+
+class FakeDatabase(dict):
+    """
+    Creates a FakeCollection on first access, like a pymongo database.
+    """
+
+    def __missing__(self, name: str) -> FakeCollection:
+        self[name] = FakeCollection(name)
+        return self[name]
@@ -0,0 +1,277 @@
+# memory_storage.py
+import bisect
+import threading
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Dict, List
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from db.data_integrity_checker import DataIntegrityChecker
+from db.mongo_storage import MongoDBHandler, VERSIONS_COLLECTION
+
+def _naive_utc(value):
+    # pymongo stores datetimes as naive UTC, so aware query bounds are converted the same way.
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+class MemoryCursor:
+    def __init__(self, docs: list, projection: dict | None):
+        self._docs = docs
+        self._projection = projection
+
+    def sort(self, key, direction: int = 1) -> "MemoryCursor":
+        if direction < 0:
+            self._docs = self._docs[::-1]
+        return self
+
+    def __iter__(self):
+        return (MemoryCollection.project(doc, self._projection) for doc in self._docs)
+
+class MemoryCollection:
+    """
+    Dict-backed collection with one unique key field kept sorted. It covers the operations
+    MongoDBHandler issues in document mode: range finds and find_one sorted on the key,
+    insert_many with duplicate-key errors, update_one/bulk_write UpdateOne with
+    $set, $setOnInsert, $inc and $push, and the aggregation stages of the gap scan.
+    """
+
+    def __init__(self, name: str, key: str = "timestamp"):
+        self.name = name
+        self.key = key
+        self._docs: dict = {}
+        self._keys: list = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def project(doc: dict, projection: dict | None) -> dict:
+        if not projection:
+            return dict(doc)
+        included = [field for field, on in projection.items() if on and field != "_id"]
+        if included:
+            out = {field: doc[field] for field in included if field in doc}
+            if projection.get("_id", 1) and "_id" in doc:
+                out["_id"] = doc["_id"]
+            return out
+        return {field: value for field, value in doc.items() if projection.get(field, 1)}
+
+    def create_index(self, *args, **kwargs) -> str:
+        return f"{self.key}_1"
+
+    def _add_key(self, key) -> None:
+        if not self._keys or key > self._keys[-1]:
+            self._keys.append(key)
+        else:
+            bisect.insort(self._keys, key)
+
+    def _select(self, query: dict | None) -> list:
+        query = query or {}
+        if set(query) - {self.key}:
+            raise NotImplementedError(f"MemoryCollection only filters on {self.key}, got {query}")
+        condition = query.get(self.key)
+        if condition is None:
+            return list(self._keys)
+        if not isinstance(condition, dict):
+            condition = _naive_utc(condition)
+            return [condition] if condition in self._docs else []
+        low, high = 0, len(self._keys)
+        for operator, value in condition.items():
+            value = _naive_utc(value)
+            if operator == "$gte":
+                low = max(low, bisect.bisect_left(self._keys, value))
+            elif operator == "$gt":
+                low = max(low, bisect.bisect_right(self._keys, value))
+            elif operator == "$lte":
+                high = min(high, bisect.bisect_right(self._keys, value))
+            elif operator == "$lt":
+                high = min(high, bisect.bisect_left(self._keys, value))
+            else:
+                raise NotImplementedError(f"Unsupported operator {operator}")
+        return self._keys[low:high]
+
+    def find(self, filter: dict | None = None, projection: dict | None = None) -> MemoryCursor:
+        with self._lock:
+            return MemoryCursor([self._docs[key] for key in self._select(filter)], projection)
+
+    def find_one(self, filter: dict | None = None, projection: dict | None = None, sort: list | None = None) -> dict | None:
+        with self._lock:
+            keys = self._select(filter)
+            if not keys:
+                return None
+            descending = bool(sort) and sort[0][1] < 0
+            return self.project(self._docs[keys[-1] if descending else keys[0]], projection)
+
+    def count_documents(self, filter: dict) -> int:
+        with self._lock:
+            return len(self._select(filter))
+
+    @classmethod
+    def evaluate(cls, expression, doc: dict):
+        """
+        Evaluates the aggregation expressions of the gap scan: field paths, $subtract
+        (date minus date is milliseconds) and $gt, with null propagating like MongoDB.
+        """
+        if isinstance(expression, str) and expression.startswith("$"):
+            return doc.get(expression[1:])
+        if not isinstance(expression, dict):
+            return expression
+        (operator, args), = expression.items()
+        left, right = (cls.evaluate(arg, doc) for arg in args)
+        if operator == "$subtract":
+            if left is None or right is None:
+                return None
+            difference = left - right
+            return difference // timedelta(milliseconds=1) if isinstance(difference, timedelta) else difference
+        if operator == "$gt":
+            # null sorts before numbers and dates.
+            return left is not None and (right is None or left > right)
+        raise NotImplementedError(f"Unsupported expression operator {operator}")
+
+    def aggregate(self, pipeline: list, allowDiskUse: bool = False) -> list:
+        """
+        Runs $match (on the key or with $expr), $project, and $setWindowFields with $shift.
+        """
+        with self._lock:
+            docs = [dict(self._docs[key]) for key in self._keys]
+        for stage in pipeline:
+            (operator, spec), = stage.items()
+            if operator == "$match" and set(spec) == {"$expr"}:
+                docs = [doc for doc in docs if self.evaluate(spec["$expr"], doc)]
+            elif operator == "$match":
+                with self._lock:
+                    keys = set(self._select(spec))
+                docs = [doc for doc in docs if doc[self.key] in keys]
+            elif operator == "$project":
+                docs = [self.project(doc, spec) for doc in docs]
+            elif operator == "$setWindowFields":
+                (field, direction), = spec["sortBy"].items()
+                docs.sort(key=lambda doc: doc[field], reverse=direction < 0)
+                for name, window in spec["output"].items():
+                    (window_operator, args), = window.items()
+                    if window_operator != "$shift":
+                        raise NotImplementedError(f"Unsupported window operator {window_operator}")
+                    values = [self.evaluate(args["output"], doc) for doc in docs]
+                    for index, doc in enumerate(docs):
+                        source = index + args["by"]
+                        doc[name] = values[source] if 0 <= source < len(docs) else args.get("default")
+            else:
+                raise NotImplementedError(f"Unsupported aggregation stage {operator}")
+        return docs
+
+    def insert_many(self, documents: list, ordered: bool = True) -> SimpleNamespace:
+        inserted_ids, errors = [], []
+        with self._lock:
+            for index, document in enumerate(documents):
+                key = _naive_utc(document[self.key])
+                if key in self._docs:
+                    errors.append({"index": index, "code": 11000, "errmsg": f"E11000 duplicate key {key}"})
+                    if ordered:
+                        break
+                    continue
+                doc = dict(document, **{self.key: key})
+                doc.setdefault("_id", ObjectId())
+                self._docs[key] = doc
+                self._add_key(key)
+                inserted_ids.append(doc["_id"])
+        if errors:
+            raise BulkWriteError({"nInserted": len(inserted_ids), "writeErrors": errors})
+        return SimpleNamespace(inserted_ids=inserted_ids)
+
+    def _update(self, filter: dict, update: dict, upsert: bool) -> str | None:
+        key = _naive_utc(filter[self.key])
+        doc = self._docs.get(key)
+        created = doc is None
+        if created:
+            if not upsert:
+                return None
+            doc = {self.key: key}
+            if self.key != "_id":
+                doc["_id"] = ObjectId()
+        before = None if created else dict(doc)
+        for operator, fields in update.items():
+            if operator == "$set" or (operator == "$setOnInsert" and created):
+                doc.update(fields)
+            elif operator == "$inc":
+                for field, amount in fields.items():
+                    doc[field] = doc.get(field, 0) + amount
+            elif operator == "$push":
+                for field, value in fields.items():
+                    values = list(doc.get(field, []))
+                    if isinstance(value, dict) and "$each" in value:
+                        values.extend(value["$each"])
+                        if "$slice" in value:
+                            values = values[value["$slice"]:] if value["$slice"] < 0 else values[:value["$slice"]]
+                    else:
+                        values.append(value)
+                    doc[field] = values
+            elif operator != "$setOnInsert":
+                raise NotImplementedError(f"Unsupported update operator {operator}")
+        if created:
+            self._docs[key] = doc
+            self._add_key(key)
+            return "upserted"
+        return "modified" if doc != before else "matched"
+
+    def update_one(self, filter: dict, update: dict, upsert: bool = False) -> SimpleNamespace:
+        with self._lock:
+            outcome = self._update(filter, update, upsert)
+        return SimpleNamespace(matched_count=int(outcome in ("modified", "matched")),
+                               modified_count=int(outcome == "modified"), upserted_id=None)
+
+    def bulk_write(self, operations: list, ordered: bool = True) -> SimpleNamespace:
+        outcomes = []
+        with self._lock:
+            for operation in operations:
+                # pymongo's UpdateOne keeps its arguments in these attributes.
+                outcomes.append(self._update(operation._filter, operation._doc, operation._upsert))
+        return SimpleNamespace(upserted_count=outcomes.count("upserted"), modified_count=outcomes.count("modified"),
+                               matched_count=outcomes.count("modified") + outcomes.count("matched"))
+
+class MemoryDatabase:
+    def __init__(self, name: str):
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(name, key="_id" if name == VERSIONS_COLLECTION else "timestamp")
+        return self._collections[name]
+
+    def list_collection_names(self) -> List[str]:
+        return list(self._collections)
+
+    def drop_collection(self, name: str) -> None:
+        self._collections.pop(name, None)
+
+class InMemoryMongoDBHandler(MongoDBHandler):
+    """
+    MongoDBHandler on an in-process stand-in for MongoDB (document storage mode only),
+    so tests and benchmarks run without a server. Lookups are bisections over sorted keys, roughly
+    what an index gives a server, without the network and BSON costs; use a real server
+    (--mongo-uri) for end-to-end figures.
+    """
+
+    def __init__(self, db_name: str = "bench", storage_mode: str = "document", **kwargs):
+        if storage_mode != "document":
+            raise ValueError(f"The in-memory backend only supports the document storage mode, not '{storage_mode}'")
+        # pymongo clients connect lazily, so the placeholder never reaches a server.
+        super().__init__(uri="mongodb://localhost:27017", db_name=db_name, storage_mode=storage_mode, **kwargs)
+        self.client.close()
+        self.client = None
+        self.db = MemoryDatabase(db_name)
+
+    def get_collection_versions(self) -> Dict[str, Dict]:
+        return {doc["_id"]: doc for doc in self.db[VERSIONS_COLLECTION].find()}
+
+    def get_latest_timestamps(self, pairs: List[tuple], batch_size: int = 100) -> Dict[tuple, datetime | None]:
+        # There is no aggregation pipeline, so look the pairs up one by one.
+        return {pair: self.get_latest_timestamp(*pair) for pair in pairs}
+
+class InMemoryIntegrityChecker(DataIntegrityChecker):
+    """
+    DataIntegrityChecker that always takes the NumPy gap scan, to measure or compare it
+    against the $setWindowFields pipeline.
+    """
+
+    def _server_side_gaps(self, coll, period_start, period_end, threshold_ms):
+        return None
@@ -0,0 +1,67 @@
+# test_async_crypto_data_collector.py
+import asyncio
+import ccxt
+import pytest
+from data.async_crypto_data_collector import AsyncCryptoDataCollector
+
+HOUR = 3_600_000
+T0 = 1_704_067_200_000
+
+class AsyncCappedExchange:
+    """
+    ccxt.async_support-style exchange with hourly candles, at most `max_limit` per call.
+    The n-th call takes n * `delay` seconds.
+    """
+
+    def __init__(self, max_limit: int, delay: float = 0.0):
+        self.id = "capped"
+        self.max_limit = max_limit
+        self.delay = delay
+        self.calls = []
+        self.cancelled = 0
+
+    @staticmethod
+    def parse_timeframe(timeframe: str) -> int:
+        return ccxt.Exchange.parse_timeframe(timeframe)
+
+    def milliseconds(self) -> int:
+        return T0 + 10_000 * HOUR
+
+    async def fetch_ohlcv(self, symbol, timeframe="1h", since=None, limit=None, params={}):
+        self.calls.append((since, limit))
+        try:
+            await asyncio.sleep(self.delay * len(self.calls))
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        first = -(-since // HOUR) * HOUR
+        return [[ts, 1.0, 2.0, 0.5, 1.5, 10.0] for ts in range(first, first + min(limit, self.max_limit) * HOUR, HOUR)]
+
+    async def close(self):
+        pass
+
+def collector(exchange, **kwargs) -> AsyncCryptoDataCollector:
+    collector = AsyncCryptoDataCollector(exchange_names=["capped"], **kwargs)
+    collector.exchanges[exchange.id] = exchange
+    return collector
+
+@pytest.mark.parametrize("max_limit", [1000, 300])
+def test_fetch_by_date_fills_windows_of_exchanges_with_smaller_pages(max_limit):
+    exchange = AsyncCappedExchange(max_limit)
+    df = asyncio.run(collector(exchange).fetch_by_date("capped", "BTC/USDT", "1h", since=T0, until=T0 + 3000 * HOUR))
+
+    assert len(df) == 3000 and df["timestamp"].is_unique
+    assert len(exchange.calls) == 3 * -(-1000 // max_limit)
+
+def test_stopping_early_waits_for_the_cancelled_pages():
+    exchange = AsyncCappedExchange(1000, delay=0.05)
+
+    async def main():
+        pages = collector(exchange, max_concurrency=4).aiter_by_date("capped", "BTC/USDT", "1h", since=T0, until=T0 + 8000 * HOUR)
+        await pages.__anext__()
+        await pages.aclose()
+        # Nothing is left running once the iterator is closed.
+        return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+    assert asyncio.run(main()) == []
+    assert exchange.cancelled == 3
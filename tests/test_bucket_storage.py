@@ -0,0 +1,91 @@
+# test_bucket_storage.py
+import copy
+from types import SimpleNamespace
+import pandas as pd
+import pytest
+from pymongo.errors import BulkWriteError
+from db.bucket_storage import BucketConflictError, BucketStore
+
+class BucketCollection:
+    """
+    Stands in for a bucket collection with its unique bucket index: $in finds and
+    ReplaceOne bulk writes whose filter matches on bucket and version. `before_write`
+    runs once before each bulk_write, to interleave another writer.
+    """
+
+    def __init__(self):
+        self.name = "binance_btcusdt_1m"
+        self.docs = {}
+        self.before_write = None
+
+    def find(self, query, projection=None):
+        return [copy.deepcopy(self.docs[b]) for b in query["bucket"]["$in"] if b in self.docs]
+
+    def bulk_write(self, operations, ordered=True):
+        hook, self.before_write = self.before_write, None
+        if hook:
+            hook()
+        errors = []
+        for index, operation in enumerate(operations):
+            # pymongo's ReplaceOne keeps its arguments in these attributes.
+            current = self.docs.get(operation._filter["bucket"])
+            if current is not None and current.get("version") == operation._filter["version"]:
+                self.docs[operation._filter["bucket"]] = dict(operation._doc)
+            elif current is None and operation._upsert:
+                self.docs[operation._filter["bucket"]] = dict(operation._doc)
+            else:
+                errors.append({"index": index, "code": 11000, "errmsg": "E11000 duplicate key"})
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": 0})
+        return SimpleNamespace()
+
+    def candles(self) -> dict:
+        return {t: close for doc in self.docs.values() for t, close in zip(doc["t"], doc["close"])}
+
+def candles(start: str, periods: int, close: float) -> pd.DataFrame:
+    return pd.DataFrame({
+        "timestamp": pd.date_range(start, periods=periods, freq="1min", tz="UTC"),
+        "open": 1.0, "high": 2.0, "low": 0.5, "close": close, "volume": 10.0,
+    })
+
+def test_concurrent_write_to_a_bucket_is_merged_not_lost():
+    store, coll = BucketStore(candles_per_bucket=60), BucketCollection()
+    store.upsert(coll, candles("2024-01-01 00:00", 10, 1.0), 60)
+
+    # Another writer (say the importer) fills the same bucket after the updater read it.
+    coll.before_write = lambda: store.upsert(coll, candles("2024-01-01 00:10", 10, 2.0), 60)
+    store.upsert(coll, candles("2024-01-01 00:20", 10, 3.0), 60)
+
+    assert len(coll.candles()) == 30
+    assert sorted(set(coll.candles().values())) == [1.0, 2.0, 3.0]
+    assert coll.docs[pd.Timestamp("2024-01-01").to_pydatetime()]["version"] == 3
+
+def test_concurrent_creation_of_a_bucket_is_merged():
+    store, coll = BucketStore(candles_per_bucket=60), BucketCollection()
+    coll.before_write = lambda: store.upsert(coll, candles("2024-01-01 00:00", 5, 1.0), 60)
+    written = store.upsert(coll, candles("2024-01-01 00:05", 5, 2.0), 60)
+
+    assert written == 1
+    assert len(coll.candles()) == 10
+
+def test_buckets_written_before_versioning_are_updated():
+    store, coll = BucketStore(candles_per_bucket=60), BucketCollection()
+    store.upsert(coll, candles("2024-01-01 00:00", 5, 1.0), 60)
+    for doc in coll.docs.values():
+        del doc["version"]
+
+    store.upsert(coll, candles("2024-01-01 00:05", 5, 2.0), 60)
+    assert len(coll.candles()) == 10
+
+def test_gives_up_when_the_bucket_keeps_changing():
+    store, coll = BucketStore(candles_per_bucket=60, max_retries=2), BucketCollection()
+    store.upsert(coll, candles("2024-01-01 00:00", 5, 1.0), 60)
+
+    def interfere():
+        for doc in coll.docs.values():
+            doc["version"] += 1
+        coll.before_write = interfere
+
+    coll.before_write = interfere
+    with pytest.raises(BucketConflictError):
+        store.upsert(coll, candles("2024-01-01 00:05", 5, 2.0), 60)
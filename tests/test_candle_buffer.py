@@ -0,0 +1,90 @@
+# test_candle_buffer.py
+import numpy as np
+import pandas as pd
+import pytest
+from data.candle_buffer import CandleBuffer, rebatch_frames
+
+MINUTE = 60_000
+T0 = 1_704_067_200_000
+
+def row(minute: int, close: float) -> list:
+    return [T0 + minute * MINUTE, 1.0, 2.0, 0.5, close, 10.0]
+
+def frame(start: int, rows: int) -> pd.DataFrame:
+    buffer = CandleBuffer()
+    buffer.append([row(start + i, float(start + i)) for i in range(rows)])
+    return buffer.to_frame().copy()
+
+def test_append_grows_past_the_initial_capacity():
+    buffer = CandleBuffer(capacity=2)
+    buffer.append([row(i, float(i)) for i in range(3)])
+    buffer.append(np.array([row(i, float(i)) for i in range(3, 7)]))
+
+    assert len(buffer) == 7 and buffer.capacity >= 7
+    assert buffer.timestamps.tolist() == [T0 + i * MINUTE for i in range(7)]
+    assert buffer.values[:, 3].tolist() == [float(i) for i in range(7)]
+
+def test_dedupe_sort_keeps_the_last_appended_duplicate():
+    buffer = CandleBuffer()
+    buffer.append([row(0, 1.0), row(1, 1.0), row(2, 1.0)])
+    # A refetched page overlapping the first: its candles are newer and must win.
+    buffer.append([row(1, 2.0), row(2, 2.0), row(3, 2.0)])
+    buffer.append([row(2, 3.0)])
+    buffer.dedupe_sort()
+
+    assert buffer.timestamps.tolist() == [T0 + i * MINUTE for i in range(4)]
+    assert buffer.values[:, 3].tolist() == [1.0, 2.0, 3.0, 2.0]
+
+def test_dedupe_sort_orders_unsorted_pages_with_their_values():
+    buffer = CandleBuffer()
+    buffer.append([row(5, 5.0), row(6, 6.0)])
+    buffer.append([row(0, 0.0), row(3, 3.0)])
+    buffer.append([row(4, 4.0), row(1, 1.0)])
+    buffer.dedupe_sort()
+
+    assert buffer.timestamps.tolist() == [T0 + i * MINUTE for i in (0, 1, 3, 4, 5, 6)]
+    assert buffer.values[:, 3].tolist() == [0.0, 1.0, 3.0, 4.0, 5.0, 6.0]
+
+@pytest.mark.parametrize("rows", [[], [row(0, 1.0)], [row(0, 1.0), row(1, 2.0)]])
+def test_dedupe_sort_leaves_sorted_and_tiny_buffers_alone(rows):
+    buffer = CandleBuffer()
+    buffer.append(rows)
+    buffer.dedupe_sort()
+
+    assert buffer.timestamps.tolist() == [r[0] for r in rows]
+
+def test_to_frame_and_iter_frames():
+    buffer = CandleBuffer()
+    buffer.append([row(i, float(i)) for i in range(5)])
+
+    df = buffer.to_frame()
+    assert df.columns.tolist() == ["timestamp", "open", "high", "low", "close", "volume"]
+    assert df["timestamp"].iloc[0] == pd.Timestamp(T0, unit="ms")
+    assert [len(part) for part in buffer.iter_frames(2)] == [2, 2, 1]
+    assert [part["close"].iloc[0] for part in buffer.iter_frames(2)] == [0.0, 2.0, 4.0]
+
+@pytest.mark.parametrize("sizes, min_rows, expected", [
+    ([], 5, []),
+    ([5], 5, [5]),
+    ([2, 3], 5, [5]),
+    ([2, 2, 2], 5, [6]),
+    ([2, 2], 5, [4]),
+    ([6, 1], 5, [6, 1]),
+    ([3, 3, 3, 3], 5, [6, 6]),
+    ([5, 0], 5, [5]),
+    ([0, 0], 5, []),
+    ([0, 3, 0, 2, 0], 5, [5]),
+])
+def test_rebatch_frames_boundaries(sizes, min_rows, expected):
+    chunks, start = [], 0
+    for size in sizes:
+        chunks.append(frame(start, size))
+        start += size
+
+    frames = list(rebatch_frames(iter(chunks), min_rows))
+
+    assert [len(f) for f in frames] == expected
+    if frames:
+        # Nothing lost, reordered or duplicated, and each frame has a fresh index.
+        assert pd.concat(frames)["close"].tolist() == [float(i) for i in range(start)]
+        assert all(f.index.tolist() == list(range(len(f))) for f in frames)
@@ -0,0 +1,132 @@
+# test_candle_ring.py
+import multiprocessing
+import uuid
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import pytest
+from data.candle_ring import CandleRing, CandleRingStore, SEQUENCE
+
+MINUTE = 60_000
+
+def candles(first: int, count: int, close: float = 1.0) -> tuple[np.ndarray, np.ndarray]:
+    timestamps = (first + np.arange(count, dtype=np.int64)) * MINUTE
+    values = np.tile([1.0, 2.0, 0.5, close, 10.0], (count, 1))
+    return timestamps, values
+
+@pytest.fixture
+def ring():
+    ring = CandleRing(f"test_ring_{uuid.uuid4().hex[:12]}", capacity=10, create=True)
+    yield ring
+    ring.close()
+
+def test_appends_newer_candles(ring):
+    ring.update(*candles(0, 4))
+    ring.update(*candles(4, 2))
+
+    timestamps, values = ring.latest()
+    assert timestamps.tolist() == (np.arange(6) * MINUTE).tolist()
+    assert ring.latest(2)[0].tolist() == [4 * MINUTE, 5 * MINUTE]
+    assert values.shape == (6, 5)
+
+def test_wraps_around_keeping_the_latest_capacity_candles(ring):
+    ring.update(*candles(0, 7))
+    ring.update(*candles(7, 7))
+    assert ring.latest()[0].tolist() == (np.arange(4, 14) * MINUTE).tolist()
+
+    # More new candles than the ring holds in one update.
+    ring.update(*candles(14, 25))
+    assert ring.latest()[0].tolist() == (np.arange(29, 39) * MINUTE).tolist()
+    assert len(ring) == 10
+
+def test_overwrites_the_open_candle(ring):
+    ring.update(*candles(0, 5, close=1.0))
+    ring.update(*candles(4, 2, close=2.0))
+
+    timestamps, values = ring.latest()
+    assert timestamps.tolist() == (np.arange(6) * MINUTE).tolist()
+    assert values[:, 3].tolist() == [1.0, 1.0, 1.0, 1.0, 2.0, 2.0]
+
+def test_ignores_candles_older_than_the_ring(ring):
+    ring.update(*candles(100, 10, close=1.0))
+    ring.update(*candles(50, 5, close=9.0))
+
+    timestamps, values = ring.latest()
+    assert timestamps.tolist() == (np.arange(100, 110) * MINUTE).tolist()
+    assert (values[:, 3] == 1.0).all()
+
+def test_writer_restart_after_a_crash_mid_update():
+    ring = CandleRing(f"test_ring_{uuid.uuid4().hex[:12]}", capacity=10, create=True)
+    ring.update(*candles(0, 3))
+    # The writer died between the two sequence increments of update().
+    ring._header[SEQUENCE] += 1
+    ring.close(unlink=False)
+
+    restarted = CandleRing(ring.name, capacity=10, create=True)
+    try:
+        assert restarted._header[SEQUENCE] % 2 == 0
+        restarted.update(*candles(3, 1))
+        assert restarted.latest(timeout=0.1)[0].tolist() == (np.arange(4) * MINUTE).tolist()
+    finally:
+        restarted.close()
+
+def test_reader_times_out_on_a_ring_stuck_mid_update(ring):
+    ring.update(*candles(0, 3))
+    ring._header[SEQUENCE] += 1
+    with pytest.raises(TimeoutError):
+        ring.latest(timeout=0.05)
+    ring._header[SEQUENCE] += 1
+
+def read_ring(name: str, queue) -> None:
+    reader = CandleRing(name)
+    try:
+        queue.put(reader.latest()[0].tolist())
+    finally:
+        reader.close()
+
+def test_another_process_reads_the_ring(ring):
+    ring.update(*candles(0, 5))
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=read_ring, args=(ring.name, queue))
+    process.start()
+    try:
+        assert queue.get(timeout=30) == (np.arange(5) * MINUTE).tolist()
+    finally:
+        process.join(timeout=30)
+    assert process.exitcode == 0
+
+class StoredCandles:
+    """
+    Stands in for MongoDBHandler in warm_load: one stored series per pair.
+    """
+
+    def __init__(self, end: datetime, count: int):
+        self.frame = pd.DataFrame({
+            "timestamp": pd.date_range(end=end, periods=count, freq="1min"),
+            "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5, "volume": 10.0,
+        })
+        self.reads = []
+
+    def get_latest_timestamps(self, pairs):
+        return {pair: self.frame["timestamp"].iloc[-1].to_pydatetime() for pair in pairs}
+
+    def get_ohlcv(self, exchange, symbol, timeframe, start=None):
+        self.reads.append((exchange, symbol, timeframe))
+        return self.frame[self.frame["timestamp"] >= start]
+
+def test_warm_load_fills_each_ring_once():
+    store = CandleRingStore(capacity=10, create=True, prefix=f"test_{uuid.uuid4().hex[:8]}")
+    stored = StoredCandles(datetime(2024, 1, 1), 100)
+    pairs = [("binance", "BTC/USDT", "1m"), ("binance", "ETH/USDT", "1m")]
+    try:
+        assert store.warm_load(stored, pairs) > 0
+        assert store.warm_load(stored, pairs) == 0
+        assert len(stored.reads) == 2
+
+        df = store.latest("binance", "BTC/USDT", "1m")
+        assert len(df) == 10
+        assert df["timestamp"].iloc[-1] == pd.Timestamp("2024-01-01")
+        assert df["timestamp"].iloc[0] == pd.Timestamp("2024-01-01") - timedelta(minutes=9)
+    finally:
+        store.close()
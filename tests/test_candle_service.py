@@ -0,0 +1,129 @@
+# test_candle_service.py
+import io
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+from api.candle_service import CandleQueryService, create_app
+from db.mongo_storage import WRITE_LOG_SIZE
+from tests.memory_storage import InMemoryMongoDBHandler
+
+MINUTE = 60_000
+T0 = 1_704_067_200_000
+URL = "/candles/binance/BTC-USDT/1m"
+
+def candles(first: int, count: int, close: float = 1.5) -> pd.DataFrame:
+    return pd.DataFrame({
+        "timestamp": pd.to_datetime(T0 + (first + np.arange(count)) * MINUTE, unit="ms", utc=True),
+        "open": 1.0, "high": 2.0, "low": 0.5, "close": close, "volume": 10.0,
+    })
+
+@pytest.fixture
+def handler():
+    handler = InMemoryMongoDBHandler()
+    handler.upsert_frame(candles(0, 100), "binance", "BTC/USDT", "1m")
+    return handler
+
+@pytest.fixture
+def service(handler):
+    return CandleQueryService(handler, version_poll_interval=0)
+
+@pytest.fixture
+def client(service):
+    return create_app(service).test_client()
+
+def closes(response) -> list:
+    return [row[4] for row in response.get_json()]
+
+def test_json_range_and_etag(client, service):
+    response = client.get(URL, query_string={"from": T0 + 10 * MINUTE, "to": T0 + 20 * MINUTE})
+    assert response.status_code == 200
+    assert response.headers["X-Candle-Count"] == "10"
+    rows = response.get_json()
+    assert [row[0] for row in rows] == [T0 + i * MINUTE for i in range(10, 20)]
+
+    again = client.get(URL, query_string={"from": T0 + 10 * MINUTE, "to": T0 + 20 * MINUTE},
+                       headers={"If-None-Match": response.headers["ETag"]})
+    assert again.status_code == 304 and again.data == b""
+    assert service.stats["hits"] == 1 and service.stats["misses"] == 1
+
+def test_format_negotiation(client):
+    npy = client.get(URL, query_string={"format": "npy", "to": "2024-01-01T00:05:00"})
+    assert npy.mimetype == "application/x-npy"
+    assert np.load(io.BytesIO(npy.data))["timestamp"].tolist() == [T0 + i * MINUTE for i in range(5)]
+
+    arrow = client.get(URL, headers={"Accept": "application/vnd.apache.arrow.stream"})
+    assert arrow.mimetype == "application/vnd.apache.arrow.stream"
+    assert pa.ipc.open_stream(arrow.data).read_all().num_rows == 100
+    # Each representation has its own ETag.
+    assert arrow.headers["ETag"] != client.get(URL).headers["ETag"]
+
+    assert client.get(URL, query_string={"format": "csv"}).status_code == 400
+    assert client.get(URL, query_string={"from": "yesterday-ish"}).status_code == 400
+
+def test_local_write_invalidates_overlapping_ranges(client, handler, service):
+    client.get(URL, query_string={"to": T0 + 50 * MINUTE})
+    client.get(URL, query_string={"from": T0 + 50 * MINUTE})
+
+    handler.upsert_frame(candles(60, 5, close=3.0), "binance", "BTC/USDT", "1m")
+
+    assert service.stats["invalidations"] == 1
+    assert closes(client.get(URL, query_string={"from": T0 + 60 * MINUTE, "to": T0 + 61 * MINUTE})) == [3.0]
+
+def test_read_racing_a_write_is_not_cached(handler, service):
+    read = service._read
+
+    def read_during_write(*args):
+        result = read(*args)
+        handler.upsert_frame(candles(0, 1, close=3.0), "binance", "BTC/USDT", "1m")
+        return result
+
+    service._read = read_during_write
+    service.get("binance", "BTC/USDT", "1m")
+    service._read = read
+    entry = service.get("binance", "BTC/USDT", "1m")
+
+    assert service.stats["misses"] == 2
+    assert entry.candles["close"][0] == 3.0
+
+def remote_writer(handler: InMemoryMongoDBHandler) -> InMemoryMongoDBHandler:
+    # Another process writing the same database, with the version log on.
+    writer = InMemoryMongoDBHandler(version_log=True)
+    writer.db = handler.db
+    return writer
+
+def test_remote_writes_invalidate_through_the_version_log(client, handler, service):
+    writer = remote_writer(handler)
+    writer.upsert_frame(candles(0, 1), "binance", "BTC/USDT", "1m")
+    service.poll_versions(force=True)
+    client.get(URL, query_string={"to": T0 + 50 * MINUTE})
+    client.get(URL, query_string={"from": T0 + 50 * MINUTE})
+
+    writer.upsert_frame(candles(70, 5, close=3.0), "binance", "BTC/USDT", "1m")
+    response = client.get(URL, query_string={"from": T0 + 50 * MINUTE})
+
+    assert service.stats["invalidations"] == 1
+    assert closes(response)[20] == 3.0
+    # The range before the write is still cached.
+    client.get(URL, query_string={"to": T0 + 50 * MINUTE})
+    assert service.stats["hits"] == 1
+
+def test_version_log_gap_invalidates_the_whole_collection(client, handler, service):
+    writer = remote_writer(handler)
+    writer.upsert_frame(candles(0, 1), "binance", "BTC/USDT", "1m")
+    service.poll_versions(force=True)
+    client.get(URL, query_string={"to": T0 + 10 * MINUTE})
+
+    # More writes than the log keeps, none of them overlapping the cached range.
+    for i in range(WRITE_LOG_SIZE + 1):
+        writer.upsert_frame(candles(200 + i, 1), "binance", "BTC/USDT", "1m")
+    service.poll_versions(force=True)
+
+    assert service.stats["invalidations"] == 1
+
+def test_version_log_is_off_by_default(handler, monkeypatch):
+    monkeypatch.delenv("MONGODB_VERSION_LOG", raising=False)
+    handler.upsert_frame(candles(100, 5), "binance", "BTC/USDT", "1m")
+    assert handler.get_collection_versions() == {}
+    monkeypatch.setenv("MONGODB_VERSION_LOG", "1")
+    assert InMemoryMongoDBHandler().version_log
@@ -0,0 +1,68 @@
+# test_crypto_data_collector.py
+import ccxt
+import numpy as np
+import pytest
+from data.crypto_data_collector import CryptoDataCollector
+from data.rate_limiter import RequestScheduler
+
+HOUR = 3_600_000
+T0 = 1_704_067_200_000
+
+class CappedExchange:
+    """
+    ccxt-style exchange with hourly candles from `listing` up to the open one at `now`,
+    returning at most `max_limit` candles per call whatever limit is asked for.
+    """
+
+    def __init__(self, max_limit: int, listing: int = T0, now: int = T0 + 5000 * HOUR):
+        self.id = "capped"
+        self.rateLimit = 1
+        self.last_response_headers = {}
+        self.max_limit = max_limit
+        self.listing = listing
+        self.now = now
+        self.calls = []
+
+    @staticmethod
+    def parse_timeframe(timeframe: str) -> int:
+        return ccxt.Exchange.parse_timeframe(timeframe)
+
+    def milliseconds(self) -> int:
+        return self.now
+
+    def fetch_ohlcv(self, symbol, timeframe="1h", since=None, limit=None, params={}):
+        self.calls.append((since, limit))
+        first = max(since, self.listing)
+        first = -(-first // HOUR) * HOUR
+        last = min(first + min(limit, self.max_limit) * HOUR, self.now + 1)
+        return [[ts, 1.0, 2.0, 0.5, 1.5, 10.0] for ts in range(first, last, HOUR)]
+
+def collector(exchange: CappedExchange, **kwargs) -> CryptoDataCollector:
+    collector = CryptoDataCollector(exchange_names=[], **kwargs)
+    collector.schedulers[exchange.id] = RequestScheduler.from_exchange(exchange)
+    collector.exchanges[exchange.id] = exchange
+    return collector
+
+@pytest.mark.parametrize("max_limit", [1000, 720, 300, 100])
+def test_fetch_by_date_fills_windows_of_exchanges_with_smaller_pages(max_limit):
+    exchange = CappedExchange(max_limit)
+    df = collector(exchange).fetch_by_date("capped", "BTC/USDT", "1h", since=T0, until=T0 + 4000 * HOUR)
+
+    assert len(df) == 4000
+    assert np.array_equal(df["timestamp"].to_numpy().astype("datetime64[ms]").astype(np.int64), T0 + np.arange(4000) * HOUR)
+    # Four windows of 1000 candles, each taking ceil(1000 / max_limit) requests.
+    assert len(exchange.calls) == 4 * -(-1000 // max_limit)
+
+def test_iter_by_date_pages_are_complete_and_in_order():
+    exchange = CappedExchange(300)
+    frames = list(collector(exchange, page_limit=500).iter_by_date("capped", "BTC/USDT", "1h", since=T0, until=T0 + 2000 * HOUR))
+
+    assert [len(frame) for frame in frames] == [500] * 4
+
+def test_no_follow_up_request_past_the_available_candles():
+    # Listed halfway through the first window; the range ends at the open candle.
+    exchange = CappedExchange(300, listing=T0 + 500 * HOUR, now=T0 + 999 * HOUR + 1)
+    df = collector(exchange).fetch_by_date("capped", "BTC/USDT", "1h", since=T0)
+
+    assert len(df) == 500
+    assert len(exchange.calls) == 2
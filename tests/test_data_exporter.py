@@ -0,0 +1,44 @@
+# test_data_exporter.py
+import pandas as pd
+import pytest
+from db.data_exporter import DataExporter
+
+def candles(start: str, periods: int, close: float = 1.5) -> pd.DataFrame:
+    return pd.DataFrame({
+        "timestamp": pd.date_range(start, periods=periods, freq="1min"),
+        "open": 1.0, "high": 2.0, "low": 0.5, "close": close, "volume": 10.0,
+    })
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    # DataExporter writes under ./data.
+    monkeypatch.chdir(tmp_path)
+
+def test_append_without_overlap_adds_a_part():
+    DataExporter.save_to_parquet(candles("2024-01-01", 100), "BTC_USDT", "1m", "binance")
+    DataExporter.save_to_parquet(candles("2024-01-01 01:40", 100), "BTC_USDT", "1m", "binance")
+
+    df = DataExporter.read_parquet("BTC_USDT", "1m", "binance")
+    assert len(df) == 200
+    assert df["timestamp"].is_monotonic_increasing
+
+def test_overlapping_resave_keeps_dataset_readable():
+    DataExporter.save_to_parquet(candles("2024-01-01", 100), "BTC_USDT", "1m", "binance")
+    DataExporter.save_to_parquet(candles("2024-01-01 00:50", 100, close=3.0), "BTC_USDT", "1m", "binance")
+    # A third save appends next to the rewritten part, so the partition is read as a dataset again.
+    DataExporter.save_to_parquet(candles("2024-01-01 02:30", 10), "BTC_USDT", "1m", "binance")
+
+    df = DataExporter.read_parquet("BTC_USDT", "1m", "binance")
+    assert list(df.columns) == ["timestamp", "open", "high", "low", "close", "volume"]
+    assert len(df) == 160
+    assert df["timestamp"].is_unique
+    # The overlapping save wins.
+    assert (df.set_index("timestamp").loc["2024-01-01 00:50":"2024-01-01 02:29", "close"] == 3.0).all()
+
+def test_read_parquet_filters_range_across_years():
+    DataExporter.save_to_parquet(candles("2023-12-31 23:00", 120), "BTC_USDT", "1m", "binance")
+
+    df = DataExporter.read_parquet("BTC_USDT", "1m", "binance", start=pd.Timestamp("2024-01-01"),
+                                   end=pd.Timestamp("2024-01-01 00:30"))
+    assert len(df) == 30
+    assert df["timestamp"].iloc[0] == pd.Timestamp("2024-01-01")
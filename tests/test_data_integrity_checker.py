@@ -0,0 +1,68 @@
+# test_data_integrity_checker.py
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import ccxt
+import pandas as pd
+import pytest
+from pymongo.errors import OperationFailure
+from db.data_integrity_checker import DataIntegrityChecker
+from tests.memory_storage import InMemoryIntegrityChecker, InMemoryMongoDBHandler, MemoryCollection
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+END = START + timedelta(minutes=59)
+COLLECTOR = SimpleNamespace(crypto=SimpleNamespace(
+    check_exchange=lambda name: SimpleNamespace(parse_timeframe=ccxt.Exchange.parse_timeframe)))
+
+def minute(n: int) -> datetime:
+    return START + timedelta(minutes=n)
+
+def stored(minutes) -> InMemoryMongoDBHandler:
+    handler = InMemoryMongoDBHandler()
+    timestamps = [minute(n) for n in minutes]
+    if timestamps:
+        handler.upsert_frame(pd.DataFrame({"timestamp": timestamps, "open": 1.0, "high": 2.0, "low": 0.5,
+                                           "close": 1.5, "volume": 10.0}), "binance", "BTC/USDT", "1m")
+    return handler
+
+def gaps(checker_class, handler) -> list:
+    return checker_class(COLLECTOR, handler).find_gaps("binance", "BTC/USDT", "1m", START, END)
+
+def ms_before(value: datetime) -> datetime:
+    return value - timedelta(milliseconds=1)
+
+def ms_after(value: datetime) -> datetime:
+    return value + timedelta(milliseconds=1)
+
+@pytest.mark.parametrize("minutes, expected", [
+    ([], [(START, END)]),
+    (range(60), []),
+    ([n for n in range(60) if n not in (10, 11, 12, 30)],
+     [(ms_after(minute(9)), ms_before(minute(13))), (ms_after(minute(29)), ms_before(minute(31)))]),
+    (range(5, 50), [(START, ms_before(minute(5))), (ms_after(minute(49)), END)]),
+    ([20], [(START, ms_before(minute(20))), (ms_after(minute(20)), END)]),
+])
+def test_pipeline_and_numpy_fallback_find_the_same_gaps(monkeypatch, minutes, expected):
+    handler = stored(minutes)
+    fallback = gaps(InMemoryIntegrityChecker, handler)
+
+    # The pipeline must not silently fall back to the NumPy scan.
+    monkeypatch.setattr(DataIntegrityChecker, "_numpy_gaps", lambda *args: pytest.fail("NumPy fallback used"))
+    pipeline = gaps(DataIntegrityChecker, handler)
+
+    assert pipeline == fallback == expected
+
+def test_late_candles_within_tolerance_are_not_gaps():
+    handler = InMemoryMongoDBHandler()
+    timestamps = [minute(n) + timedelta(seconds=3 * (n % 2)) for n in range(60)]
+    handler.upsert_frame(pd.DataFrame({"timestamp": timestamps, "close": 1.0}), "binance", "BTC/USDT", "1m")
+
+    assert gaps(DataIntegrityChecker, handler) == gaps(InMemoryIntegrityChecker, handler) == []
+
+def test_server_without_window_functions_falls_back_to_numpy(monkeypatch):
+    def unsupported(self, pipeline, allowDiskUse=False):
+        raise OperationFailure("Unrecognized pipeline stage name: '$setWindowFields'")
+
+    monkeypatch.setattr(MemoryCollection, "aggregate", unsupported)
+    handler = stored([n for n in range(60) if n != 30])
+
+    assert gaps(DataIntegrityChecker, handler) == [(ms_after(minute(29)), ms_before(minute(31)))]
@@ -0,0 +1,151 @@
+# test_forex_data_collector.py
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+import pandas as pd
+import pytest
+from data.forex_data_collector import ForexDataCollector, MAX_OUTPUT_SIZE
+from data.retry_policy import APIError, RetryPolicy, classify_error, RATE_LIMIT, EXCHANGE_DOWN, PERMANENT
+
+class TwelveDataStub:
+    """
+    Local stand-in for Twelve Data's time_series endpoint. It records every request
+    (query and arrival time) and answers with hourly or minute candles, newest first, in
+    the single or batch response format. `errors` holds body-level error payloads
+    returned (with HTTP 200, like the real API) by the next requests.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.errors = []
+        self.symbol_errors = {}
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                query = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+                with stub._lock:
+                    stub.requests.append(dict(query, received_at=time.monotonic()))
+                    error = stub.errors.pop(0) if stub.errors else None
+                body = json.dumps(error or stub.respond(query)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/time_series"
+
+    def respond(self, query: dict) -> dict:
+        freq = {"1min": "1min", "1h": "1h"}[query["interval"]]
+        if "start_date" in query:
+            index = pd.date_range(query["start_date"], query["end_date"], freq=freq)
+        else:
+            index = pd.date_range("2024-01-01", periods=int(query["outputsize"]), freq=freq)
+
+        def one(symbol):
+            if symbol in self.symbol_errors:
+                return self.symbol_errors[symbol]
+            return {"meta": {"symbol": symbol}, "status": "ok", "values": [
+                {"datetime": str(ts), "open": "1.1", "high": "1.2", "low": "1.0", "close": "1.15"} for ts in index[::-1]]}
+
+        symbols = query["symbol"].split(",")
+        return one(symbols[0]) if len(symbols) == 1 else {symbol: one(symbol) for symbol in symbols}
+
+@pytest.fixture
+def stub():
+    stub = TwelveDataStub()
+    thread = threading.Thread(target=stub.server.serve_forever, daemon=True)
+    thread.start()
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
+
+def collector(stub, **kwargs) -> ForexDataCollector:
+    kwargs.setdefault("credits_per_minute", 60_000)
+    return ForexDataCollector("key", retry_policy=RetryPolicy(base_delay=0.01, max_attempts=3), base_url=stub.url, **kwargs)
+
+def test_fetch_by_date_splits_windows_and_parses_columns(stub):
+    df = collector(stub).fetch_by_date("EUR", "USD", "1min", "2024-01-01", "2024-01-08")
+
+    # 7 days of minutes, both ends included, in windows of MAX_OUTPUT_SIZE - 1 candles.
+    assert len(df) == 7 * 1440 + 1
+    assert len(stub.requests) == -(-len(df) // MAX_OUTPUT_SIZE)
+    assert df["timestamp"].is_monotonic_increasing and df["timestamp"].is_unique
+    assert all(df[column].dtype == np.float64 for column in ["open", "high", "low", "close", "volume"])
+    assert df["volume"].isna().all()
+    starts = sorted(pd.Timestamp(request["start_date"]) for request in stub.requests)
+    assert starts[0] == pd.Timestamp("2024-01-01") and starts[1] == pd.Timestamp("2024-01-01") + pd.Timedelta(minutes=MAX_OUTPUT_SIZE)
+
+def test_fetch_batch_by_limit_splits_symbols_into_batches(stub):
+    symbols = ["EUR/USD", "GBP/USD", "USD/JPY", "AUD/USD", "USD/CHF"]
+    frames = collector(stub, batch_size=2).fetch_batch_by_limit(symbols, "1h", limit=10)
+
+    assert sorted(len(request["symbol"].split(",")) for request in stub.requests) == [1, 2, 2]
+    assert sorted(",".join(request["symbol"] for request in stub.requests).split(",")) == sorted(symbols)
+    assert {symbol: len(df) for symbol, df in frames.items()} == {symbol: 10 for symbol in symbols}
+
+def test_fetch_batch_by_date_requests_every_window_of_every_batch(stub):
+    frames = collector(stub, batch_size=2).fetch_batch_by_date(["EUR/USD", "GBP/USD", "USD/JPY"], "1min",
+                                                               "2024-01-01", "2024-01-05")
+
+    # Two symbol batches times two windows.
+    assert len(stub.requests) == 4
+    assert {symbol: len(df) for symbol, df in frames.items()} == {symbol: 4 * 1440 + 1 for symbol in frames}
+
+def test_requests_are_paced_by_credits(stub):
+    # 1200 credits a minute = 20 per second; a two-symbol request costs two credits.
+    client = collector(stub, credits_per_minute=1200, batch_size=2, max_workers=4)
+    client.fetch_batch_by_limit([f"S{i}/USD" for i in range(8)], "1h", limit=5)
+
+    arrivals = sorted(request["received_at"] for request in stub.requests)
+    assert len(arrivals) == 4
+    # No burst: every request waits for its own credits despite four workers.
+    assert min(np.diff(arrivals)) >= 2 / 20 * 0.9
+    assert client.scheduler_stats()["granted_weight"] == 8
+
+@pytest.mark.parametrize("payload, error_class", [
+    ({"code": 429, "message": "You have run out of API credits", "status": "error"}, RATE_LIMIT),
+    ({"code": 500, "message": "Internal error", "status": "error"}, EXCHANGE_DOWN),
+    ({"code": 400, "message": "symbol not found", "status": "error"}, PERMANENT),
+    ({"code": 401, "message": "apikey is incorrect", "status": "error"}, PERMANENT),
+])
+def test_body_errors_are_classified(payload, error_class):
+    with pytest.raises(APIError) as info:
+        ForexDataCollector._raise_for_error(payload)
+    assert classify_error(info.value) == error_class
+
+def test_transient_body_errors_are_retried(stub):
+    stub.errors = [{"code": 429, "message": "out of credits", "status": "error"},
+                   {"code": 500, "message": "Internal error", "status": "error"}]
+    client = collector(stub)
+    df = client.fetch_by_limit("EUR", "USD", "1h", limit=3)
+
+    assert len(df) == 3
+    assert len(stub.requests) == 3
+    stats = client.retry_stats()["twelvedata"]
+    assert stats["errors_rate_limit"] == 1 and stats["errors_exchange_down"] == 1 and stats["retries"] == 2
+
+def test_permanent_symbol_error_fails_the_batch_without_retry(stub):
+    stub.symbol_errors["BAD/X"] = {"code": 400, "message": "symbol not found", "status": "error"}
+    client = collector(stub)
+    with pytest.raises(APIError):
+        client.fetch_batch_by_limit(["EUR/USD", "BAD/X"], "1h", limit=3)
+
+    assert len(stub.requests) == 1
+    assert client.retry_stats()["twelvedata"]["giveups"] == 1
+
+def test_window_without_data_is_empty(stub):
+    stub.errors = [{"code": 400, "message": "No data is available on the specified dates.", "status": "error"}]
+    df = collector(stub).fetch_by_date("EUR", "USD", "1h", "2024-01-06", "2024-01-07")
+
+    assert df.empty
+    assert len(stub.requests) == 1
@@ -0,0 +1,159 @@
+# test_import_historical.py
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import ccxt
+import numpy as np
+import pandas as pd
+from db.import_historical import HistoricalImporter
+from tests.fake_collection import FakeDatabase
+
+HOUR = 3_600_000
+T0 = 1_704_060_000_000  # on the 10h chunk grid
+PAIR = {"exchange": "stub", "symbol": "BTC/USDT", "timeframe": "1h"}
+PERIODS = [("2024", T0, T0 + 30 * HOUR)]
+
+class HourlyExchange:
+    """
+    Stands in for collector.crypto: hourly candles in pages of `page` candles.
+    `on_page(since, index)` runs before each page is yielded, to inject failures.
+    """
+
+    def __init__(self, page: int = 5):
+        self.page = page
+        self.requests = []
+        self.on_page = None
+
+    def check_exchange(self, name):
+        return SimpleNamespace(parse_timeframe=ccxt.Exchange.parse_timeframe)
+
+    def iter_by_date(self, exchange_name, symbol, timeframe, since, until):
+        self.requests.append((since, until))
+        first = -(-since // HOUR) * HOUR
+        for index, start in enumerate(range(first, until, self.page * HOUR)):
+            if self.on_page:
+                self.on_page(since, index)
+            timestamps = np.arange(start, min(start + self.page * HOUR, until), HOUR)
+            yield pd.DataFrame({"timestamp": pd.to_datetime(timestamps, unit="ms"), "open": 1.0, "high": 2.0,
+                                "low": 0.5, "close": 1.5, "volume": 10.0})
+
+class Storage:
+    """
+    Stands in for MongoDBHandler: records the written candles, checkpoints in a FakeDatabase.
+    """
+
+    def __init__(self, latest: datetime | None = None):
+        self.db = FakeDatabase()
+        self.latest = latest
+        self.written = []
+
+    def get_latest_timestamp(self, exchange, symbol, timeframe):
+        return self.latest
+
+    def upsert_frame(self, df, exchange, symbol, timeframe):
+        self.written += df["timestamp"].to_numpy().astype("datetime64[ms]").astype(np.int64).tolist()
+
+def importer(storage: Storage, exchange: HourlyExchange, **kwargs) -> HistoricalImporter:
+    kwargs.setdefault("chunk_candles", 10)
+    kwargs.setdefault("flush_rows", 5)
+    kwargs.setdefault("workers_per_exchange", 1)
+    return HistoricalImporter(SimpleNamespace(crypto=exchange), storage, worker_id="me", **kwargs)
+
+def checkpoints(storage: Storage) -> dict:
+    return storage.db["import_checkpoints"].docs
+
+def chunk_id(grid_start: int) -> str:
+    return f"stub|BTC/USDT|1h|2024|{grid_start}"
+
+def test_plan_creates_grid_chunks_once():
+    storage = Storage()
+    job = importer(storage, HourlyExchange())
+    assert job.plan([PAIR], PERIODS) == 3
+
+    checkpoints(storage)[chunk_id(T0)]["resume_from"] = T0 + 4 * HOUR
+    # Planning again adds nothing and keeps the progress.
+    assert job.plan([PAIR], PERIODS) == 0
+    assert checkpoints(storage)[chunk_id(T0)]["resume_from"] == T0 + 4 * HOUR
+    assert sorted((c["start"], c["end"]) for c in checkpoints(storage).values()) == \
+        [(T0 + i * 10 * HOUR, T0 + (i + 1) * 10 * HOUR) for i in range(3)]
+
+def test_plan_starts_after_the_latest_stored_candle():
+    storage = Storage(latest=datetime.fromtimestamp((T0 + 14 * HOUR) / 1000, tz=timezone.utc))
+    assert importer(storage, HourlyExchange()).plan([PAIR], PERIODS) == 2
+    assert checkpoints(storage)[chunk_id(T0 + 10 * HOUR)]["start"] == T0 + 15 * HOUR
+
+def test_run_imports_everything_and_summarizes():
+    storage, exchange = Storage(), HourlyExchange()
+    summary = importer(storage, exchange).run([PAIR], PERIODS)
+
+    assert summary == {"chunks": 3, "done": 3, "failed": 0, "candles": 30}
+    assert sorted(storage.written) == [T0 + i * HOUR for i in range(30)]
+    assert all(c["status"] == "done" and c["candles"] == 10 and c["owner"] is None for c in checkpoints(storage).values())
+
+def test_failed_chunk_is_counted_and_retried_by_the_next_run():
+    storage, exchange = Storage(), HourlyExchange()
+
+    def fail_second_chunk(since, index):
+        if since == T0 + 10 * HOUR and index == 1:
+            raise ccxt.ExchangeError("boom")
+
+    exchange.on_page = fail_second_chunk
+    assert importer(storage, exchange).run([PAIR], PERIODS) == {"chunks": 3, "done": 2, "failed": 1, "candles": 25}
+    failed = checkpoints(storage)[chunk_id(T0 + 10 * HOUR)]
+    assert failed["status"] == "failed" and failed["attempts"] == 1 and failed["resume_from"] == T0 + 14 * HOUR + 1
+
+    exchange.on_page = None
+    assert importer(storage, exchange).run([PAIR], PERIODS) == {"chunks": 1, "done": 1, "failed": 0, "candles": 5}
+    # The retry resumed after the last written batch.
+    assert exchange.requests[-1] == (T0 + 14 * HOUR + 1, T0 + 20 * HOUR)
+
+def test_chunk_of_a_crashed_importer_resumes_and_counts_an_attempt():
+    storage, exchange = Storage(), HourlyExchange()
+    job = importer(storage, exchange)
+    job.plan([PAIR], PERIODS)
+    crashed = checkpoints(storage)[chunk_id(T0)]
+    crashed.update(status="running", owner="dead", resume_from=T0 + 5 * HOUR,
+                   lease_until=datetime.now(timezone.utc) - timedelta(seconds=1))
+
+    job.run([PAIR], PERIODS)
+
+    assert crashed["status"] == "done" and crashed["attempts"] == 1
+    assert (T0 + 5 * HOUR, T0 + 10 * HOUR) in exchange.requests
+    assert (T0, T0 + 10 * HOUR) not in exchange.requests
+
+def test_chunk_that_keeps_crashing_its_importer_is_given_up():
+    storage, exchange = Storage(), HourlyExchange()
+    job = importer(storage, exchange, max_attempts=2)
+    job.plan([PAIR], PERIODS[:1])
+    chunk = checkpoints(storage)[chunk_id(T0)]
+    chunk.update(status="running", owner="dead", attempts=2, lease_until=datetime.now(timezone.utc) - timedelta(seconds=1))
+
+    summary = job.run([PAIR], PERIODS)
+
+    assert chunk["status"] == "running" and chunk["owner"] == "dead"
+    assert summary["chunks"] == 2
+
+def test_live_lease_is_not_taken_over():
+    storage, exchange = Storage(), HourlyExchange()
+    job = importer(storage, exchange)
+    job.plan([PAIR], PERIODS)
+    checkpoints(storage)[chunk_id(T0)].update(status="running", owner="other",
+                                              lease_until=datetime.now(timezone.utc) + timedelta(minutes=5))
+
+    assert job.run([PAIR], PERIODS)["chunks"] == 2
+    assert checkpoints(storage)[chunk_id(T0)]["owner"] == "other"
+
+def test_worker_stops_when_its_chunk_was_taken_over():
+    storage, exchange = Storage(), HourlyExchange()
+    job = importer(storage, exchange)
+
+    def taken_over(since, index):
+        if since == T0 and index == 1:
+            checkpoints(storage)[chunk_id(T0)]["owner"] = "other"
+
+    exchange.on_page = taken_over
+    summary = job.run([PAIR], PERIODS)
+
+    chunk = checkpoints(storage)[chunk_id(T0)]
+    # The first batch was checkpointed; the new owner's progress is left alone.
+    assert chunk["owner"] == "other" and chunk["status"] == "running" and chunk["resume_from"] == T0 + 4 * HOUR + 1
+    assert summary == {"chunks": 3, "done": 2, "failed": 1, "candles": 30}
@@ -0,0 +1,83 @@
+# test_lease_coordinator.py
+import time
+from datetime import datetime, timezone
+from db.lease_coordinator import LeaseCoordinator
+from tests.fake_collection import FakeDatabase
+
+class Handler:
+    """
+    Stands in for MongoDBHandler: only its db attribute is used.
+    """
+
+    def __init__(self):
+        self.db = FakeDatabase()
+
+PAIRS = [("binance", f"S{i}/USDT", "1m") for i in range(6)]
+
+def worker(handler: Handler, name: str, pairs=PAIRS, **kwargs) -> LeaseCoordinator:
+    kwargs.setdefault("lease_ttl", 30.0)
+    kwargs.setdefault("heartbeat_interval", 0.1)
+    coordinator = LeaseCoordinator(handler, worker_id=name, **kwargs)
+    coordinator.register(pairs)
+    return coordinator
+
+def test_pairs_are_rebalanced_when_a_worker_joins():
+    handler = Handler()
+    a = worker(handler, "a")
+    assert a.heartbeat() == (set(PAIRS), set())
+
+    b = worker(handler, "b")
+    # Every pair is still leased by a; it gives three back on its next heartbeat.
+    assert b.heartbeat() == (set(), set())
+    added, removed = a.heartbeat()
+    assert added == set() and len(removed) == 3 and a.live_workers == 2
+    b.heartbeat()
+
+    assert len(a.owned) == len(b.owned) == 3
+    assert a.owned | b.owned == set(PAIRS)
+
+def test_pairs_of_a_dead_worker_are_taken_over_once_its_leases_expire():
+    handler = Handler()
+    a = worker(handler, "a", lease_ttl=0.2)
+    b = worker(handler, "b", lease_ttl=0.2)
+    a.heartbeat()
+    b.heartbeat()
+    assert b.owned == set()
+
+    # a stops heartbeating.
+    time.sleep(0.25)
+    added, _ = b.heartbeat()
+    assert added == set(PAIRS) and b.live_workers == 1
+
+def test_release_all_hands_the_pairs_over_at_once():
+    handler = Handler()
+    a, b = worker(handler, "a"), worker(handler, "b")
+    a.heartbeat()
+    a.release_all()
+
+    assert a.owned == set()
+    assert b.heartbeat()[0] == set(PAIRS)
+    assert b.live_workers == 1
+
+def test_leases_of_other_configs_are_not_counted_or_claimed():
+    handler = Handler()
+    other = worker(handler, "other", pairs=[("kraken", f"X{i}/USD", "1h") for i in range(10)])
+    mine = worker(handler, "mine", pairs=PAIRS[:2])
+    other.release_all()
+
+    mine.heartbeat()
+    assert mine.owned == set(PAIRS[:2])
+    assert all(doc["owner"] is None for _id, doc in handler.db["pair_leases"].docs.items() if _id.startswith("kraken"))
+
+def test_longest_expired_leases_are_claimed_first():
+    handler = Handler()
+    a = worker(handler, "a")
+    leases = handler.db["pair_leases"].docs
+    for i, pair in enumerate(PAIRS):
+        leases["|".join(pair)]["expires_at"] = datetime(2024, 1, 6 - i, tzinfo=timezone.utc)
+    # A second live worker halves a's share.
+    handler.db["pair_leases_workers"].docs["b"] = {"_id": "b", "expires_at": datetime(2100, 1, 1, tzinfo=timezone.utc)}
+
+    a.heartbeat()
+    assert a.owned == set(PAIRS[3:])
+    assert all(leases["|".join(pair)]["owner"] is None for pair in PAIRS[:3])
@@ -0,0 +1,41 @@
+# test_mongo_storage.py
+import pandas as pd
+from tests.memory_storage import InMemoryMongoDBHandler
+from db.mongo_storage import VERSIONS_COLLECTION
+
+def candles(start: str, periods: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        "timestamp": pd.date_range(start, periods=periods, freq="1min", tz="UTC"),
+        "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5, "volume": 10.0,
+    })
+
+def test_upsert_stream_logs_one_write_for_all_flushes():
+    handler = InMemoryMongoDBHandler(version_log=True)
+    writes = []
+    handler.add_write_listener(lambda *write: writes.append(write))
+    chunks = [candles("2024-01-01", 100), candles("2024-01-01 01:40", 100), candles("2024-01-01 03:20", 100)]
+
+    counts = handler.upsert_stream(iter(chunks), "binance", "BTC/USDT", "1m", flush_rows=100, batch_size=30)
+
+    assert counts["inserted"] == 300
+    version = handler.db[VERSIONS_COLLECTION].find_one({"_id": "binance_btcusdt_1m"})
+    assert version["version"] == 1
+    assert version["writes"] == [{"first": pd.Timestamp("2024-01-01").to_pydatetime(),
+                                  "last": pd.Timestamp("2024-01-01 04:59").to_pydatetime()}]
+    assert writes == [("binance_btcusdt_1m", version["writes"][0]["first"], version["writes"][0]["last"])]
+
+def test_upsert_frame_logs_one_write_per_call():
+    handler = InMemoryMongoDBHandler(version_log=True)
+    handler.upsert_frame(candles("2024-01-01", 100), "binance", "BTC/USDT", "1m", batch_size=10)
+    handler.upsert_frame(candles("2024-01-01 00:50", 100), "binance", "BTC/USDT", "1m", batch_size=10)
+
+    assert handler.db[VERSIONS_COLLECTION].find_one({"_id": "binance_btcusdt_1m"})["version"] == 2
+
+def test_upsert_ohlcv_logs_the_range_of_its_rows():
+    handler = InMemoryMongoDBHandler(version_log=True)
+    rows = candles("2024-01-01", 3).to_dict("records")
+    handler.upsert_ohlcv(rows[::-1], "binance", "BTC/USDT", "1m")
+
+    writes = handler.db[VERSIONS_COLLECTION].find_one({"_id": "binance_btcusdt_1m"})["writes"]
+    assert writes == [{"first": pd.Timestamp("2024-01-01").to_pydatetime(),
+                       "last": pd.Timestamp("2024-01-01 00:02").to_pydatetime()}]
@@ -0,0 +1,156 @@
+# test_ohlcv_cache.py
+import os
+import ccxt
+import numpy as np
+import pandas as pd
+import pytest
+from data.ohlcv_cache import CANDLE_DTYPE, MIN_CAPACITY, CachedCryptoDataCollector, OHLCVCache
+from data.rate_limiter import RequestScheduler
+
+MINUTE = 60_000
+KEY = ("binance", "BTC/USDT", "1m")
+
+def records(first: int, count: int, close: float = 1.0) -> np.ndarray:
+    candles = np.zeros(count, dtype=CANDLE_DTYPE)
+    candles["timestamp"] = (first + np.arange(count)) * MINUTE
+    candles["close"] = close
+    return candles
+
+def write(cache: OHLCVCache, candles: np.ndarray) -> None:
+    cache.write(*KEY, candles, int(candles["timestamp"][0]), int(candles["timestamp"][-1]) + MINUTE)
+
+def test_newer_candles_are_appended_in_place(tmp_path):
+    cache = OHLCVCache(str(tmp_path))
+    write(cache, records(0, 100))
+    path = cache._path(cache._key(*KEY))
+    inode, size = os.stat(path).st_ino, os.path.getsize(path)
+
+    for first in range(100, 500, 10):
+        write(cache, records(first, 10))
+
+    # Same file, same size: the preallocated records were filled, nothing was rewritten.
+    assert (os.stat(path).st_ino, os.path.getsize(path)) == (inode, size)
+    assert cache._index[cache._key(*KEY)]["count"] == 500
+    assert np.array_equal(cache.read(*KEY, 0, 500 * MINUTE)["timestamp"], np.arange(500) * MINUTE)
+
+def test_overlapping_candles_are_merged(tmp_path):
+    cache = OHLCVCache(str(tmp_path))
+    write(cache, records(50, 100))
+    write(cache, records(0, 60, close=2.0))
+    write(cache, records(140, 20, close=3.0))
+
+    candles = cache.read(*KEY, 0, 200 * MINUTE)
+    assert np.array_equal(candles["timestamp"], np.arange(160) * MINUTE)
+    # The newest write of a timestamp wins.
+    assert candles["close"][59] == 2.0 and candles["close"][60] == 1.0 and candles["close"][140] == 3.0
+    assert cache.missing(*KEY, 0, 160 * MINUTE) == []
+
+def test_file_grows_when_appends_outrun_its_capacity(tmp_path):
+    cache = OHLCVCache(str(tmp_path))
+    write(cache, records(0, MIN_CAPACITY))
+    write(cache, records(MIN_CAPACITY, MIN_CAPACITY))
+
+    assert len(cache.read(*KEY, 0, 2 * MIN_CAPACITY * MINUTE)) == 2 * MIN_CAPACITY
+    assert len(np.load(cache._path(cache._key(*KEY)), mmap_mode="r")) > 2 * MIN_CAPACITY
+
+def test_count_survives_reopening_and_legacy_files_are_read_whole(tmp_path):
+    cache = OHLCVCache(str(tmp_path))
+    write(cache, records(0, 10))
+    assert len(OHLCVCache(str(tmp_path)).read(*KEY, 0, 100 * MINUTE)) == 10
+
+    # A file written before preallocation: exactly its records and no count in the index.
+    np.save(cache._path(cache._key(*KEY)), records(0, 20))
+    del cache._index[cache._key(*KEY)]["count"]
+    assert len(cache.read(*KEY, 0, 100 * MINUTE)) == 20
+    write(cache, records(20, 5))
+    assert len(cache.read(*KEY, 0, 100 * MINUTE)) == 25
+
+class CalendarExchange:
+    """
+    ccxt-style exchange serving candles on the Binance calendar (weeks from Monday, months
+    from the 1st) up to the open candle at `now`. Every candle closes at `close`.
+    """
+
+    FREQUENCIES = {"1h": "h", "1w": "W-MON", "1M": "MS"}
+
+    def __init__(self, now: str, listing: str = "2023-01-01"):
+        self.id = "stub"
+        self.rateLimit = 1
+        self.last_response_headers = {}
+        self.now = pd.Timestamp(now, tz="UTC")
+        self.listing = listing
+        self.close = 1.0
+        self.calls = []
+
+    @staticmethod
+    def parse_timeframe(timeframe: str) -> int:
+        return ccxt.Exchange.parse_timeframe(timeframe)
+
+    def milliseconds(self) -> int:
+        return self.now.value // 1_000_000
+
+    def fetch_ohlcv(self, symbol, timeframe="1m", since=None, limit=None, params={}):
+        self.calls.append((timeframe, since, limit))
+        opens = pd.date_range(pd.Timestamp(self.listing, tz="UTC"), self.now, freq=self.FREQUENCIES[timeframe])
+        opens = opens.as_unit("ms").asi8
+        opens = opens[opens >= since][:limit]
+        return [[int(ts), 1.0, 2.0, 0.5, self.close, 10.0] for ts in opens]
+
+def cached_collector(tmp_path, exchange: CalendarExchange, **kwargs) -> CachedCryptoDataCollector:
+    collector = CachedCryptoDataCollector(OHLCVCache(str(tmp_path)), exchange_names=[], **kwargs)
+    collector.schedulers[exchange.id] = RequestScheduler.from_exchange(exchange)
+    collector.exchanges[exchange.id] = exchange
+    return collector
+
+def ms(value: str) -> int:
+    return pd.Timestamp(value, tz="UTC").value // 1_000_000
+
+@pytest.mark.parametrize("timeframe, since, now, open_candle", [
+    # The epoch grid starts weeks on Thursday (2024-01-11); Binance weeks start on Monday.
+    ("1w", "2023-12-04", "2024-01-12 12:00", "2024-01-08"),
+    # Thirty days before the end of March is still in March.
+    ("1M", "2023-10-01", "2024-03-31 12:00", "2024-03-01"),
+])
+def test_open_calendar_candle_is_not_cached(tmp_path, timeframe, since, now, open_candle):
+    exchange = CalendarExchange(now)
+    collector = cached_collector(tmp_path, exchange)
+    df = collector.fetch_by_date("stub", "BTC/USDT", timeframe, since=since)
+    assert df["timestamp"].iloc[-1] == pd.Timestamp(open_candle)
+
+    assert collector.cache.covered("stub", "BTC/USDT", timeframe) == [(ms(since), ms(open_candle))]
+    assert len(collector.cache.read("stub", "BTC/USDT", timeframe, ms(since), ms(now))) == len(df) - 1
+
+    # The open candle moved on; only it is fetched again, and its new values are served.
+    exchange.close = 2.0
+    calls = len(exchange.calls)
+    df = collector.fetch_by_date("stub", "BTC/USDT", timeframe, since=since)
+    assert exchange.calls[calls][1] == ms(open_candle)
+    assert df["close"].iloc[-1] == 2.0 and (df["close"].iloc[:-1] == 1.0).all()
+
+def test_iter_by_date_reads_and_fills_the_cache(tmp_path):
+    exchange = CalendarExchange("2024-01-02 00:30")
+    collector = cached_collector(tmp_path, exchange, page_limit=5)
+    frames = list(collector.iter_by_date("stub", "BTC/USDT", "1h", since="2024-01-01"))
+    assert sum(len(frame) for frame in frames) == 25
+    assert collector.cache.covered("stub", "BTC/USDT", "1h") == [(ms("2024-01-01"), ms("2024-01-02"))]
+
+    exchange.close = 2.0
+    calls = len(exchange.calls)
+    frames = list(collector.iter_by_date("stub", "BTC/USDT", "1h", since="2024-01-01"))
+    df = pd.concat(frames, ignore_index=True)
+
+    assert len(exchange.calls) == calls + 1
+    assert max(len(frame) for frame in frames) <= 5
+    assert df["timestamp"].is_monotonic_increasing and len(df) == 25
+    assert df["close"].iloc[-1] == 2.0 and (df["close"].iloc[:-1] == 1.0).all()
+
+def test_interrupted_iter_by_date_keeps_the_pages_it_yielded(tmp_path):
+    exchange = CalendarExchange("2024-01-02 00:30")
+    collector = cached_collector(tmp_path, exchange, page_limit=5, max_workers=1)
+    pages = collector.iter_by_date("stub", "BTC/USDT", "1h", since="2024-01-01")
+    next(pages), next(pages)
+    pages.close()
+
+    assert collector.cache.covered("stub", "BTC/USDT", "1h") == [(ms("2024-01-01"), ms("2024-01-01 10:00"))]
+    assert collector.cache.missing("stub", "BTC/USDT", "1h", ms("2024-01-01"), ms("2024-01-02")) == \
+        [(ms("2024-01-01 10:00"), ms("2024-01-02"))]
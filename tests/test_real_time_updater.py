@@ -0,0 +1,155 @@
+# test_real_time_updater.py
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import ccxt
+import pandas as pd
+import pytest
+import db.real_time_updater as real_time_updater_module
+from db.real_time_updater import RESCHEDULE_RETRY_SEC, RealTimeScheduler, next_candle_close, real_time_updater
+
+PAIRS = [("stub", "BTC/USDT", "1m"), ("stub", "ETH/USDT", "1h")]
+
+def utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+@pytest.mark.parametrize("timeframe, now, expected", [
+    ("1m", utc(2024, 1, 1, 12, 0, 30), utc(2024, 1, 1, 12, 1)),
+    ("1m", utc(2024, 1, 1, 12, 1), utc(2024, 1, 1, 12, 2)),
+    ("4h", utc(2024, 1, 1, 13, 5), utc(2024, 1, 1, 16)),
+    # 2024-01-01 was a Monday.
+    ("1w", utc(2024, 1, 3, 9), utc(2024, 1, 8)),
+    ("1w", utc(2024, 1, 8), utc(2024, 1, 15)),
+    ("1w", utc(2024, 1, 7, 23, 59), utc(2024, 1, 8)),
+    ("1M", utc(2024, 1, 31, 23, 59), utc(2024, 2, 1)),
+    ("1M", utc(2024, 2, 1), utc(2024, 3, 1)),
+    ("1M", utc(2024, 12, 15), utc(2025, 1, 1)),
+    ("3M", utc(2024, 2, 10), utc(2024, 4, 1)),
+    ("3M", utc(2024, 11, 10), utc(2025, 1, 1)),
+])
+def test_next_candle_close(timeframe, now, expected):
+    assert next_candle_close(timeframe, ccxt.Exchange.parse_timeframe(timeframe), now) == expected
+
+class Crypto:
+    """
+    Stands in for collector.crypto: returns one candle per request, and check_exchange
+    fails `failures` times first.
+    """
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.requests = []
+
+    def check_exchange(self, name):
+        if self.failures:
+            self.failures -= 1
+            raise ccxt.ExchangeNotAvailable("markets not loaded")
+        return SimpleNamespace(parse_timeframe=ccxt.Exchange.parse_timeframe)
+
+    def fetch_by_date(self, exchange_name, symbol, timeframe, since, until, priority=None):
+        self.requests.append((symbol, timeframe))
+        return pd.DataFrame({"timestamp": [pd.Timestamp(since)], "close": [1.0]})
+
+class Storage:
+    """
+    Stands in for MongoDBHandler in the real-time updater.
+    """
+
+    def __init__(self):
+        self.latest = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.upserts = []
+
+    def get_latest_timestamp(self, exchange, symbol, timeframe):
+        return self.latest
+
+    def get_latest_timestamps(self, pairs):
+        return {pair: self.latest for pair in pairs}
+
+    def upsert_frame(self, df, exchange, symbol, timeframe):
+        self.upserts.append((symbol, timeframe))
+
+    def _collection_name(self, exchange, symbol, timeframe):
+        return f"{exchange}_{symbol}_{timeframe}"
+
+class Rings:
+    """
+    Records the pairs warm-loaded into a CandleRingStore.
+    """
+
+    def __init__(self):
+        self.warm_loads = []
+
+    def warm_load(self, mongo_handler, pairs):
+        self.warm_loads.append(list(pairs))
+
+    def update_frame(self, df, exchange, symbol, timeframe):
+        pass
+
+def scheduler(crypto: Crypto, **kwargs) -> RealTimeScheduler:
+    tests = [{"exchange": e, "symbol": s, "timeframe": t} for e, s, t in PAIRS]
+    return RealTimeScheduler(SimpleNamespace(crypto=crypto), Storage(), tests, **kwargs)
+
+def run_until(job: RealTimeScheduler, condition, timeout: float = 5.0) -> None:
+    thread = threading.Thread(target=job.run)
+    thread.start()
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    job.stop()
+    thread.join(timeout)
+    assert not thread.is_alive()
+
+def test_run_catches_up_each_pair_and_schedules_the_next_close():
+    crypto = Crypto()
+    job = scheduler(crypto, settle_delay=2.0)
+    run_until(job, lambda: len(job.mongo_handler.upserts) == len(PAIRS) and len(job._heap) == len(PAIRS))
+
+    assert sorted(job.mongo_handler.upserts) == sorted((s, t) for _, s, t in PAIRS)
+    assert {pair: stats["runs"] for pair, stats in job.stats().items()} == {"/".join(p): 1 for p in PAIRS}
+    for due, _, pair, close_time, _ in job._heap:
+        assert close_time == next_candle_close(pair[2], ccxt.Exchange.parse_timeframe(pair[2]), close_time - timedelta(seconds=1))
+        assert due == close_time.timestamp() + 2.0
+
+def test_run_warm_loads_the_rings_once():
+    rings = Rings()
+    job = scheduler(Crypto(), ring_store=rings)
+    run_until(job, lambda: len(job.mongo_handler.upserts) == len(PAIRS))
+
+    assert rings.warm_loads == [PAIRS]
+    job.add_pair(PAIRS[0])
+    assert rings.warm_loads == [PAIRS]
+    job.add_pair(("stub", "SOL/USDT", "1m"))
+    assert rings.warm_loads == [PAIRS, [("stub", "SOL/USDT", "1m")]]
+
+def test_pair_is_retried_when_its_next_close_cannot_be_computed():
+    job = scheduler(Crypto(failures=1))
+    job._activate(PAIRS[0])
+    job._heap.clear()
+    close_time = datetime.now(timezone.utc)
+
+    job._run_pair(PAIRS[0], close_time, job._active[PAIRS[0]])
+    (due, _, pair, retry_close, _), = job._heap
+    assert pair == PAIRS[0] and due == pytest.approx(time.time() + RESCHEDULE_RETRY_SEC, abs=1)
+
+    job._heap.clear()
+    job._run_pair(PAIRS[0], retry_close, job._active[PAIRS[0]])
+    (due, _, pair, next_close, _), = job._heap
+    assert next_close == next_candle_close("1m", 60, retry_close)
+
+def test_removed_pair_is_not_rescheduled():
+    job = scheduler(Crypto())
+    job._activate(PAIRS[0])
+    generation = job._active[PAIRS[0]]
+    job._heap.clear()
+    job.remove_pair(PAIRS[0])
+
+    job._run_pair(PAIRS[0], datetime.now(timezone.utc), generation)
+    assert job._heap == []
+
+def test_sleep_interval_arguments_are_deprecated(monkeypatch):
+    monkeypatch.setattr(real_time_updater_module.RealTimeScheduler, "run", lambda self: None)
+    with pytest.warns(DeprecationWarning):
+        real_time_updater(None, None, [], 60, {"1m": 60})
+    with pytest.warns(DeprecationWarning):
+        real_time_updater(None, None, [], sleep_intervals={"1m": 60})
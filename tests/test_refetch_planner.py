@@ -0,0 +1,116 @@
+# test_refetch_planner.py
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import ccxt
+import numpy as np
+import pytest
+from data.crypto_data_collector import CryptoDataCollector
+from data.rate_limiter import RequestScheduler, TokenBucket
+from db.refetch_planner import RefetchPlanner, coalesce_gaps
+
+HOUR = 3_600_000
+T0 = 1_704_067_200_000
+
+class HourlyExchange:
+    """
+    ccxt-style exchange with an hourly candle at every hour.
+    """
+
+    def __init__(self):
+        self.id = "stub"
+        self.rateLimit = 1
+        self.last_response_headers = {}
+        self.calls = []
+
+    @staticmethod
+    def parse_timeframe(timeframe: str) -> int:
+        return ccxt.Exchange.parse_timeframe(timeframe)
+
+    def fetch_ohlcv(self, symbol, timeframe="1h", since=None, limit=None, params={}):
+        self.calls.append((since, limit))
+        first = -(-since // HOUR) * HOUR
+        return [[ts, 1.0, 2.0, 0.5, 1.5, 10.0] for ts in range(first, first + limit * HOUR, HOUR)]
+
+class Storage:
+    """
+    Stands in for MongoDBHandler: records the upserted frames.
+    """
+
+    def __init__(self):
+        self.frames = []
+
+    def upsert_frame(self, df, exchange, symbol, timeframe):
+        self.frames.append(df)
+
+def planner(exchange: HourlyExchange, scheduler: RequestScheduler | None = None, **kwargs) -> RefetchPlanner:
+    crypto = CryptoDataCollector(exchange_names=[])
+    crypto.exchanges[exchange.id] = exchange
+    if scheduler is not None:
+        crypto.schedulers[exchange.id] = scheduler
+    return RefetchPlanner(SimpleNamespace(crypto=crypto), Storage(), **kwargs)
+
+def hours(start: int, end: int) -> tuple[datetime, datetime]:
+    """
+    Inclusive gap of the candles start..end (in hours after T0), ending a millisecond before
+    the next stored candle as find_gaps reports it.
+    """
+    first = datetime.fromtimestamp(T0 / 1000, tz=timezone.utc)
+    return first + timedelta(hours=start), first + timedelta(hours=end + 1, milliseconds=-1)
+
+@pytest.mark.parametrize("gaps, expected", [
+    ([], []),
+    ([(0, 9)], [(0, 10)]),
+    # Nearby gaps ride along in one page, stored candles in between included.
+    ([(0, 9), (30, 39), (90, 95)], [(0, 96)]),
+    ([(0, 9), (100, 109)], [(0, 10), (100, 110)]),
+    ([(100, 109), (0, 9)], [(0, 10), (100, 110)]),
+    # A gap longer than a page continues in the next pages.
+    ([(0, 249)], [(0, 100), (100, 200), (200, 250)]),
+    # A gap running past the page end continues in a page shared with the next gap.
+    ([(50, 159), (165, 169)], [(50, 150), (150, 170)]),
+])
+def test_coalesce_gaps(gaps, expected):
+    assert coalesce_gaps(gaps, page_ms=100) == expected
+
+def test_plan_reports_requests_against_one_request_per_gap():
+    gaps = [hours(0, 9), hours(20, 29), hours(40, 49), hours(3000, 3999)]
+    plan = planner(HourlyExchange(), page_limit=1000).plan("stub", "1h", gaps)
+
+    assert plan["pages"] == [(T0, T0 + 50 * HOUR), (T0 + 3000 * HOUR, T0 + 4000 * HOUR)]
+    assert plan["report"] == {"gaps": 4, "missing_candles": 1030, "requests": 2, "naive_requests": 4,
+                              "estimated_seconds": 0.0}
+
+@pytest.mark.parametrize("capacity, pages, expected", [(3, 2, 0.0), (3, 3, 0.0), (3, 7, 2.0), (1, 6, 2.5)])
+def test_plan_estimates_the_wait_beyond_the_burst(capacity, pages, expected):
+    # Two requests per second, `capacity` of them allowed in a burst.
+    scheduler = RequestScheduler(TokenBucket(rate=2, capacity=capacity))
+    gaps = [hours(i * 100, i * 100 + 9) for i in range(pages)]
+    plan = planner(HourlyExchange(), scheduler, page_limit=10).plan("stub", "1h", gaps)
+
+    assert plan["report"]["requests"] == pages
+    assert plan["report"]["estimated_seconds"] == expected
+
+def test_dry_run_makes_no_request_and_no_write():
+    exchange = HourlyExchange()
+    job = planner(exchange)
+    plan = job.plan("stub", "1h", [hours(0, 9), hours(500, 509)])
+
+    report = job.execute("BTC/USDT", plan, dry_run=True)
+
+    assert report == plan["report"] and "fetched_candles" not in report
+    assert exchange.calls == [] and job.mongo_handler.frames == []
+
+def test_execute_fetches_each_page_once_and_writes_them_together():
+    exchange = HourlyExchange()
+    job = planner(exchange, RequestScheduler.from_exchange(exchange), page_limit=100)
+    plan = job.plan("stub", "1h", [hours(0, 9), hours(50, 59), hours(300, 309)])
+
+    report = job.execute("BTC/USDT", plan)
+
+    # One candle past each page (see page_request_limit) is asked for and trimmed off.
+    assert sorted(exchange.calls) == [(T0, 61), (T0 + 300 * HOUR, 11)]
+    frame, = job.mongo_handler.frames
+    timestamps = frame["timestamp"].to_numpy().astype("datetime64[ms]").astype(np.int64)
+    expected = np.concatenate([T0 + np.arange(60) * HOUR, T0 + np.arange(300, 310) * HOUR])
+    assert np.array_equal(timestamps, expected)
+    assert report["fetched_candles"] == 70 and report["requests"] == 2
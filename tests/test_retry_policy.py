@@ -0,0 +1,73 @@
+# test_retry_policy.py
+import threading
+import time
+import ccxt
+import pytest
+from data.retry_policy import CircuitOpenError, RetryPolicy
+
+def trip(policy: RetryPolicy, key: str, failures: int) -> None:
+    def fail():
+        raise ccxt.NetworkError("down")
+
+    for _ in range(failures):
+        with pytest.raises(ccxt.NetworkError):
+            policy.call(fail, key=key, max_attempts=1)
+
+def test_half_open_breaker_lets_one_trial_through():
+    policy = RetryPolicy(failure_threshold=2, reset_timeout=0.2, max_breaker_wait=5)
+    trip(policy, "ex", 2)
+    assert policy.breaker("ex").state == "open"
+
+    lock, in_flight, peak, started = threading.Lock(), [0], [0], []
+
+    def call():
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+            started.append(time.monotonic())
+        time.sleep(0.1)
+        with lock:
+            in_flight[0] -= 1
+
+    threads = [threading.Thread(target=policy.call, args=(call, "ex")) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    started.sort()
+    # The others only start once the trial succeeded and closed the breaker.
+    assert started[1] - started[0] >= 0.1
+    assert len(started) == 6
+    assert policy.breaker("ex").state == "closed"
+
+def test_failed_trial_opens_the_breaker_again():
+    policy = RetryPolicy(failure_threshold=2, reset_timeout=0.1)
+    trip(policy, "ex", 2)
+    time.sleep(0.15)
+    assert policy.breaker("ex").state == "half_open"
+
+    trip(policy, "ex", 1)
+    assert policy.breaker("ex").state == "open"
+    assert policy.breaker("ex").opens == 2
+
+def test_calls_fail_fast_when_the_breaker_stays_open_too_long():
+    policy = RetryPolicy(failure_threshold=1, reset_timeout=10, max_breaker_wait=1)
+    trip(policy, "ex", 1)
+
+    with pytest.raises(CircuitOpenError):
+        policy.call(lambda: None, key="ex")
+    assert policy.stats()["ex"]["rejected"] == 1
+
+def test_permanent_errors_are_not_retried():
+    policy = RetryPolicy(base_delay=0.01)
+    calls = []
+
+    def bad_symbol():
+        calls.append(1)
+        raise ccxt.BadSymbol("unknown symbol")
+
+    with pytest.raises(ccxt.BadSymbol):
+        policy.call(bad_symbol, key="ex")
+    assert len(calls) == 1
+    assert policy.breaker("ex").state == "closed"
@@ -0,0 +1,167 @@
+# test_stream_updater.py
+import asyncio
+import json
+import re
+import aiohttp
+import ccxt
+import pandas as pd
+import pytest
+from aiohttp import web
+from db.stream_updater import StreamingUpdater
+
+PAIR = {"exchange": "stub", "symbol": "BTC/USDT", "timeframe": "1m"}
+MINUTE = 60_000
+T0 = 1_704_067_200_000
+
+def kline(ts: int, close: float) -> dict:
+    return {"symbol": PAIR["symbol"], "timeframe": PAIR["timeframe"], "kline": [ts, 1.0, 2.0, 0.5, close, 10.0]}
+
+class KlineServer:
+    """
+    Local WebSocket kline feed. Connection i replays scripts[i], a (messages, keep_open)
+    tuple; connections past the scripts stay open without sending anything.
+    """
+
+    def __init__(self, scripts):
+        self.scripts = list(scripts)
+        self.connections = 0
+        self._runner = None
+        self.url = None
+
+    async def _handler(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        messages, keep_open = self.scripts[self.connections] if self.connections < len(self.scripts) else ([], True)
+        self.connections += 1
+        for message in messages:
+            await ws.send_json(message)
+            await asyncio.sleep(0.005)
+        if keep_open:
+            async for _ in ws:
+                pass
+        await ws.close()
+        return ws
+
+    async def start(self) -> "KlineServer":
+        app = web.Application()
+        app.router.add_get("/ws", self._handler)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/ws"
+        return self
+
+    async def stop(self) -> None:
+        await self._runner.cleanup()
+
+class StreamExchange:
+    """
+    Minimal ccxt pro-style client of KlineServer: watch_ohlcv returns the next update and
+    raises NetworkError when the server dropped the connection.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self._session = None
+        self._ws = None
+
+    async def watch_ohlcv(self, symbol, timeframe):
+        if self._ws is None:
+            self._session = self._session or aiohttp.ClientSession()
+            self._ws = await self._session.ws_connect(self.url)
+        message = await self._ws.receive()
+        if message.type != aiohttp.WSMsgType.TEXT:
+            self._ws = None
+            raise ccxt.NetworkError("stream closed")
+        return [json.loads(message.data)["kline"]]
+
+    async def close(self):
+        if self._ws is not None:
+            await self._ws.close()
+        if self._session is not None:
+            await self._session.close()
+
+class RecordingStorage:
+    def __init__(self):
+        self.frames = []
+
+    def upsert_frame(self, df, exchange, symbol, timeframe):
+        self.frames.append(df)
+
+    @property
+    def candles(self) -> pd.DataFrame:
+        return pd.concat(self.frames, ignore_index=True) if self.frames else pd.DataFrame(columns=["timestamp", "close"])
+
+@pytest.fixture
+def catch_ups(monkeypatch):
+    calls = []
+    monkeypatch.setattr("db.stream_updater.update_pair", lambda collector, handler, *pair, **kwargs: calls.append(pair))
+    return calls
+
+def stream(scripts, until, **kwargs) -> tuple[StreamingUpdater, RecordingStorage, KlineServer]:
+    """
+    Runs a StreamingUpdater against a KlineServer replaying `scripts` until `until(updater,
+    storage, server)` holds (or 5 seconds passed), then stops it.
+    """
+    storage = RecordingStorage()
+
+    async def main():
+        server = await KlineServer(scripts).start()
+        updater = StreamingUpdater(None, storage, [PAIR], flush_interval=0.01,
+                                   exchange_factory=lambda name: StreamExchange(server.url), **kwargs)
+        task = asyncio.create_task(updater.run())
+        try:
+            for _ in range(500):
+                if until(updater, storage, server):
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            updater.stop()
+            await task
+            await server.stop()
+        return updater, server
+
+    updater, server = asyncio.run(main())
+    return updater, storage, server
+
+def closed_ms(storage: RecordingStorage) -> list[int]:
+    return storage.candles["timestamp"].to_numpy().astype("datetime64[ms]").astype("int64").tolist()
+
+def test_candle_is_written_once_the_next_one_opens(catch_ups):
+    scripts = [([kline(T0, 1.0), kline(T0, 1.5), kline(T0 + MINUTE, 2.0), kline(T0 + 2 * MINUTE, 3.0)], True)]
+    updater, storage, _ = stream(scripts, lambda u, s, _: len(s.candles) >= 2)
+
+    assert closed_ms(storage) == [T0, T0 + MINUTE]
+    # The last update of a candle is the one written.
+    assert storage.candles["close"].tolist() == [1.5, 2.0]
+    assert updater.stats["closed_candles"] == 2
+    assert updater.stats["reconnects"] == 0
+    assert catch_ups == [("stub", "BTC/USDT", "1m")]
+
+def test_reconnect_catches_up_over_rest(catch_ups):
+    # The server drops the stream twice; the candle open at each drop is left to the REST catch-up.
+    scripts = [
+        ([kline(T0, 1.0), kline(T0 + MINUTE, 2.0)], False),
+        ([kline(T0 + 2 * MINUTE, 3.0), kline(T0 + 3 * MINUTE, 4.0)], False),
+        ([kline(T0 + 4 * MINUTE, 5.0)], True),
+    ]
+    updater, storage, server = stream(scripts, lambda u, s, srv: srv.connections >= 3 and len(catch_ups) >= 3,
+                                      reconnect_delay=0.01)
+
+    assert updater.stats["reconnects"] == 2
+    # Every (re)connection is followed by one REST catch-up.
+    assert len(catch_ups) == server.connections == 3
+    assert closed_ms(storage) == [T0, T0 + 2 * MINUTE]
+
+def test_reconnect_delay_backs_off_up_to_the_maximum(catch_ups, caplog):
+    scripts = [([], False)] * 5 + [([kline(T0, 1.0)], True)]
+    updater, _, _ = stream(scripts, lambda u, s, srv: len(catch_ups) >= 1,
+                           reconnect_delay=0.01, max_reconnect_delay=0.04)
+
+    delays = [float(d) for d in re.findall(r"reconnecting in ([\d.]+)s", caplog.text)]
+    assert delays == [0.01, 0.02, 0.04, 0.04, 0.04]
+    assert updater.stats["reconnects"] == 5
+    # Only the sixth connection delivered an update, so it is the only one caught up.
+    assert len(catch_ups) == 1
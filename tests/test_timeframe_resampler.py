@@ -0,0 +1,126 @@
+# test_timeframe_resampler.py
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+import pytest
+from db.mongo_storage import MongoDBHandler
+from db.timeframe_resampler import TimeframeResampler, bucket_start, resample_ohlcv
+from tests.memory_storage import InMemoryMongoDBHandler
+
+def candles(start: str, periods: int, freq: str, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 100 + rng.normal(size=periods).cumsum()
+    open_ = close + rng.normal(size=periods)
+    return pd.DataFrame({
+        "timestamp": pd.date_range(start, periods=periods, freq=freq),
+        "open": open_,
+        "high": np.maximum(open_, close) + rng.random(periods),
+        "low": np.minimum(open_, close) - rng.random(periods),
+        "close": close,
+        "volume": rng.random(periods) * 10,
+    })
+
+def expected_buckets(df: pd.DataFrame, timeframe: str) -> pd.DataFrame:
+    """
+    Aggregates candles bucket by bucket with bucket_start, independently of pandas' resample rules.
+    """
+    rows = []
+    for start, group in df.groupby(df["timestamp"].map(lambda ts: bucket_start(ts.to_pydatetime(), timeframe))):
+        rows.append({"timestamp": start, "open": group["open"].iloc[0], "high": group["high"].max(),
+                     "low": group["low"].min(), "close": group["close"].iloc[-1], "volume": group["volume"].sum()})
+    return pd.DataFrame(rows)
+
+class StoredCollections:
+    """
+    Stands in for MongoDBHandler in from_stored: collection naming plus the stored names.
+    """
+
+    def __init__(self, *timeframes):
+        names = [self._collection_name("binance", "BTC/USDT", tf) for tf in timeframes]
+        self.db = SimpleNamespace(list_collection_names=lambda: names)
+
+    _collection_name = MongoDBHandler._collection_name
+
+def test_from_stored_skips_derived_monthly_collection():
+    # Derived "1M" candles live in the "_1m" collection and must not be read as 1-minute candles.
+    resampler = TimeframeResampler.from_stored(StoredCollections("1M", "5m", "1h"), "binance", "BTC/USDT")
+    assert resampler.base_timeframe == "5m"
+
+def test_from_stored_uses_1m_when_monthly_is_not_derived():
+    resampler = TimeframeResampler.from_stored(StoredCollections("1m", "5m"), "binance", "BTC/USDT",
+                                               target_timeframes=("15m", "1h"))
+    assert resampler.base_timeframe == "1m"
+
+def test_from_stored_without_a_base_fails():
+    with pytest.raises(ValueError):
+        TimeframeResampler.from_stored(StoredCollections("1M", "1w"), "binance", "BTC/USDT")
+
+def test_target_sharing_the_base_collection_is_rejected():
+    with pytest.raises(ValueError):
+        TimeframeResampler(None, base_timeframe="1m", target_timeframes=("1h", "1M"))
+
+def test_resample_aggregates_first_max_min_last_sum():
+    base = pd.DataFrame({
+        "timestamp": pd.date_range("2024-01-01 00:05", periods=4, freq="5min"),
+        "open": [10.0, 11.0, 12.0, 13.0],
+        "high": [15.0, 19.0, 14.0, 16.0],
+        "low": [9.0, 8.0, 11.0, 12.0],
+        "close": [11.0, 12.0, 13.0, 14.0],
+        "volume": [1.0, 2.0, 3.0, 4.0],
+    })
+    derived = resample_ohlcv(base, "15m")
+
+    assert derived["timestamp"].tolist() == [pd.Timestamp("2024-01-01 00:00"), pd.Timestamp("2024-01-01 00:15")]
+    assert derived[["open", "high", "low", "close", "volume"]].values.tolist() == [
+        [10.0, 19.0, 8.0, 12.0, 3.0],
+        [12.0, 16.0, 11.0, 14.0, 7.0],
+    ]
+
+@pytest.mark.parametrize("ts, timeframe, expected", [
+    # 2024-01-01 was a Monday.
+    (datetime(2024, 1, 7, 23, 59), "1w", datetime(2024, 1, 1)),
+    (datetime(2024, 1, 8), "1w", datetime(2024, 1, 8)),
+    (datetime(2024, 3, 1, 0, 30), "1w", datetime(2024, 2, 26)),
+    (datetime(2024, 2, 29, 23, 59), "1M", datetime(2024, 2, 1)),
+    (datetime(2024, 3, 1), "1M", datetime(2024, 3, 1)),
+    (datetime(2024, 1, 1, 5, tzinfo=timezone.utc), "4h", datetime(2024, 1, 1, 4)),
+    (datetime(2024, 1, 2, 12), "3d", datetime(2023, 12, 31)),
+])
+def test_bucket_start(ts, timeframe, expected):
+    assert bucket_start(ts, timeframe) == expected
+
+@pytest.mark.parametrize("timeframe", ["1w", "1M", "1d", "3d", "4h"])
+def test_resample_buckets_match_bucket_start(timeframe):
+    # Hourly candles from a Thursday across two month ends.
+    base = candles("2024-01-25 07:00", 24 * 70, "1h")
+    derived = resample_ohlcv(base, timeframe)
+
+    pd.testing.assert_frame_equal(derived.reset_index(drop=True), expected_buckets(base, timeframe), check_dtype=False,
+                                  check_index_type=False)
+
+def test_resample_drops_empty_buckets():
+    base = candles("2024-01-01", 24, "1h")
+    base = base[(base["timestamp"] < "2024-01-01 04:00") | (base["timestamp"] >= "2024-01-01 12:00")]
+
+    assert resample_ohlcv(base, "4h")["timestamp"].dt.hour.tolist() == [0, 12, 16, 20]
+
+def test_update_since_recomputes_only_the_touched_buckets():
+    handler = InMemoryMongoDBHandler()
+    base = candles("2024-01-31 20:00", 48, "5min", seed=1)
+    handler.upsert_frame(base, "binance", "BTC/USDT", "5m")
+    resampler = TimeframeResampler(handler, base_timeframe="5m", target_timeframes=("15m", "1h", "1M"))
+    resampler.update("binance", "BTC/USDT")
+
+    # The last stored candle (23:55) changes and the next hour of the new month arrives.
+    newer = candles("2024-01-31 23:55", 13, "5min", seed=2)
+    handler.upsert_frame(newer, "binance", "BTC/USDT", "5m")
+    since = newer["timestamp"].iloc[0].to_pydatetime()
+    upserted = resampler.update("binance", "BTC/USDT", since=since)
+
+    # 15m: 23:45 and four buckets of the new hour; 1h: 23:00 and 00:00; 1M: January and February.
+    assert upserted == {"15m": 5, "1h": 2, "1M": 2}
+    stored_base = pd.concat([base.iloc[:-1], newer], ignore_index=True)
+    for timeframe in resampler.target_timeframes:
+        derived = handler.get_ohlcv("binance", "BTC/USDT", timeframe)
+        pd.testing.assert_frame_equal(derived, expected_buckets(stored_base, timeframe), check_dtype=False)